@@ -1,17 +1,39 @@
 from az.llm_provider import LLMProvider
+from az import context, tokens, transport
+from az.context import Message
 import anthropic
 
 
+PROMPT_CACHE = {"type": "ephemeral"}
+
+
+def cache_breakpoints(messages):
+    """ The messages with prompt cache breakpoints on their stable prefix: the first message (which has the primer),
+    the previous user message (up to which the previous request was cached) and the last one (caching this request)
+    """
+    users = [i for i, m in enumerate(messages) if m["role"] == "user"]
+    marked = {0, *users[-2:]} if messages else set()
+    return [{"role": m["role"], "content": [{"type": "text", "text": m["content"], "cache_control": PROMPT_CACHE}]} if i in marked else m
+            for i, m in enumerate(messages)]
+
+
+def is_text(event):
+    return event.type == "content_block_delta" and event.delta.type == "text_delta"
+
 
 class AnthropicClient(LLMProvider):
     def __init__(self, config={}, primer=None):
         self.provider = 'anthropic'
-        self.client = anthropic.Anthropic()
-        self.models = self.list_models()
         self.config = config
+        self.client = anthropic.Anthropic(http_client=transport.http_client(config))
+        self.async_client = anthropic.AsyncAnthropic(http_client=transport.async_http_client(config))
+        self.models = self.list_models()
         self.model = self.config.get("anthropic", {}).get("model", "claude-3-5-sonnet")
         self.messages = []
         self.primer = primer
+        # prefixes of at least 1024 tokens (2048 for haiku) are cached for 5 minutes: reading them costs 10% of the
+        # input price (writing them 125%), and they are not prefilled again
+        self.prompt_cache = self.config.get("anthropic", {}).get("prompt-cache", True)
           
 
     def list_models(self):
@@ -19,19 +41,82 @@ class AnthropicClient(LLMProvider):
         return ["claude-3-5-sonnet-20240620"]
     
 
-    def chat(self, message):
+    def _add_user_message(self, message):
         if self.primer and len(self.messages) == 0:
             self.messages.append({"role": "user", "content": self.primer + "\n\n" + message})
         else:
             self.messages.append({"role": "user", "content": message})
-        with self.client.messages.stream(
-            max_tokens=1024,
-            messages=self.messages,
-            model=self.model,
-                ) as stream:
-            for text in stream.text_stream:
-                yield text
-        self.messages.append({"role": "assistant", "content": text})
+
+    def _request(self, message):
+        self._add_user_message(message)
+        self.fit_context()
+        messages = self.wire_messages()
+        if self.prompt_cache:
+            messages = cache_breakpoints(messages)
+        return dict(messages=messages, model=self.model, **self.sampling_params())
+
+    def _messages_api(self, client):
+        """ The messages API of the SDK client (prompt caching is still a beta in this SDK version) """
+        return client.beta.prompt_caching.messages if self.prompt_cache else client.messages
+
+    def context_messages(self):
+        """ Anthropic has no system messages: once the first turn (with the primer) is evicted,
+        the primer and the summary go in the first user message
+        """
+        if not self.messages.evicted_turns:
+            return self.messages
+        preamble = [self.primer] if self.primer else []
+        if self.messages.summary:
+            preamble.append(context.SUMMARY_PREFIX + self.messages.summary)
+        if not preamble:
+            return self.messages
+        first = self.messages[0]
+        return [Message(first.role, "\n\n".join(preamble + [first.content]))] + self.messages[1:]
+
+    def _on_usage(self, usage):
+        # input_tokens doesn't count the tokens read from, or written to, the prompt cache
+        cached = getattr(usage, "cache_read_input_tokens", None) or 0
+        written = getattr(usage, "cache_creation_input_tokens", None) or 0
+        self.last_usage = {"input_tokens": usage.input_tokens + cached + written, "output_tokens": usage.output_tokens}
+        if self.prompt_cache:
+            self.last_usage["cached_tokens"] = cached
+
+    def sampling_params(self):
+        return {"max_tokens": tokens.max_tokens(self.config, self.provider)}
+
+    def tokenizer(self):
+        # the SDK's tokenizer is of older models, so newer models' counts are close, not exact
+        try:
+            self.client.get_tokenizer()
+        except Exception:
+            return super().tokenizer()
+        return "anthropic", self.client.count_tokens
+
+    def record_turn(self, message, response):
+        self._add_user_message(message)
+        self.messages.append({"role": "assistant", "content": response})
+
+    def turns(self):
+        turns = super().turns()
+        if turns and self.primer and turns[0][0].startswith(self.primer + "\n\n"):
+            turns[0] = (turns[0][0][len(self.primer) + 2:], turns[0][1])
+        return turns
+
+    def _stream(self, request):
+        # leaving the block closes the stream, also when it is cut short
+        with self._messages_api(self.client).stream(**request) as stream:
+            self.open_response = stream.response
+            for event in stream:
+                if is_text(event):
+                    yield event.delta.text
+            self._on_usage(stream.get_final_message().usage)
+
+    async def _astream(self, request):
+        async with self._messages_api(self.async_client).stream(**request) as stream:
+            async for event in stream:
+                if is_text(event):
+                    yield event.delta.text
+            self._on_usage((await stream.get_final_message()).usage)
 
 
     def new_chat(self, primer=None):
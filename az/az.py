@@ -2,45 +2,25 @@
 
 import sys
 import os
+import json
 import shutil
 import argparse
-
-# a mix of rich and prompt_toolkit seem to hit the sweet spot for terminal UI interactivity
-from rich.console import Console
-from rich.markdown import Markdown
-from rich.panel import Panel
-from rich.align import Align
-from rich.live import Live
-from rich.box import Box
-from prompt_toolkit import PromptSession
-from prompt_toolkit.patch_stdout import patch_stdout
-from prompt_toolkit.formatted_text import HTML
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.completion import Completer, Completion
-from prompt_toolkit.key_binding import KeyBindings
-
-
-import readline # needed for prompt editing
+import time
 
 from az.utils import number_to_ordinal
-from az.config import load_config, default_model, default_provider
+from az.config import get_config, default_model, default_provider, digest as config_digest
+from az.providers import configured_providers, resolve_provider, provider_class, ClientPool, DEFAULT_IDLE_TIMEOUT
+from az.stats import measure, StatsReport
+from az.coalesce import coalesce
+from az.llm_provider import INTERRUPTIONS, TRUNCATED_MARK
+from az import tokens
 
-# Providers
-from az.ollama_provider import OllamaClient
-from az.openai_provider import OpenAIClient
-from az.anthropic_provider import AnthropicClient
-from az.gemini_provider import GeminiClient
+# Note that rich, prompt_toolkit and the provider SDKs are imported lazily (only on the code
+# paths which need them), as importing them dominates the startup time of one-shot runs.
 
 HISTORY_FILE_NAME = os.path.expanduser("~/.config/.azc_history" if os.path.exists(os.path.expanduser("~/.config")) else "~/.azc_history")
 
-config = load_config()
-
-bindings = KeyBindings()
-
-def is_command(string: str) -> bool:
-    if string.strip().lower() in ('exit', 'quit', 'q', 'p', 'l', 'm', 'p', 'n', 'h', 'r', '?', ''): return True
-    elif string.strip().startswith("p "): return True
-    else: return False
+config = get_config()  # read on first use, shared with the providers
 
 
 def get_input():
@@ -48,58 +28,7 @@ def get_input():
     return None
 
 
-# Bind 'Control+n' to insert a newline
-@bindings.add('c-n')
-def insert_newline(event):
-    event.current_buffer.insert_text('\n')
-
-
-# An empty box border makes it easier to copy and paste.
-EMPTY: Box = Box(
-    "    \n"
-    "    \n"
-    "    \n"
-    "    \n"
-    "    \n"
-    "    \n"
-    "    \n"
-    "    \n",
-    ascii=True,
-)
-
-# Initialize the console
-console = Console()
-
-# this is done by the providers so it's not needed here
-# load_dotenv(os.path.expanduser("~/.config/.env" if os .path.exists(os.path.expanduser("~/.config")) else "~/.env"))
-
-
-providers = []
-if 'OPENAI_API_KEY' in os.environ:
-    providers.append('openai')
-if 'OLLAMA_URL' in os.environ:
-    providers.append('ollama')
-if 'ANTHROPIC_API_KEY' in os.environ:
-    providers.append('anthropic')
-if 'GEMINI_API_KEY' in os.environ:
-    providers.append('gemini')
-
-# provider_completer = WordCompleter([f"p {provider}" for provider in providers], ignore_case=True)
-
-class CommandsCompleter(Completer):
-    """
-    This completer handles the 'p' command for changing provider
-    """
-    def get_completions(self, document, complete_event):
-        text = document.current_line
-        if text.startswith('p '):   
-            for provider in providers:
-                yield Completion(
-                f'p {provider}', start_position=-1000,
-                display=HTML(f'{provider}'),
-                style='bg:ansiyellow')
-        
-completer = CommandsCompleter()
+providers = configured_providers()
 
 
 def primer():
@@ -109,35 +38,16 @@ def primer():
 
 
 def provider_factory(provider_hint):
-    provider_found = False
-
-    for provider_name in providers:
-        if provider_hint in provider_name:
-            provider_full_name = provider_name
-            provider_found = True
-            break
-
-    if not provider_found:
-        raise ValueError(f"Cannot find provider with <{provider_hint}>")
-    
-    if provider_full_name == 'ollama':
-        return OllamaClient(primer=primer())
-    elif provider_full_name == 'openai':
-        return OpenAIClient(config, primer=primer())
-    elif provider_full_name == 'anthropic':
-        return AnthropicClient(config, primer=primer())
-    elif provider_full_name == 'gemini':
-        return GeminiClient(config, primer=primer())
-
+    provider_name = resolve_provider(provider_hint, providers)
+    return provider_class(provider_name)(config, primer=primer())
 
 
-class FilteredHistory(FileHistory):
-    """
-    This class is a custom history class that filters out commands we don't want to save
-    """
-    def store_string(self, string: str) -> None:
-        if not is_command(string):
-                super().store_string(string)
+def full_provider_name(provider_hint):
+    """ The full name of a provider, e.g. 'op' -> 'openai' (or the hint itself if it matches none, for provider_factory to report) """
+    try:
+        return resolve_provider(provider_hint, providers)
+    except ValueError:
+        return provider_hint
 
 
 def help():
@@ -153,67 +63,491 @@ Just type your message and press enter to start a chat.
 | ? or h  | Help (this screen) |
 | m       | Change model |
 | p provider_name | Change provider (p and space trigger autocomplete) |
+| sessions | List saved chats |
+| sessions id | Resume a saved chat (a unique prefix of its id is enough) |
+| /search words | Search past prompts and responses |
+| f provider,provider:model,... | Fan out: send every prompt to all of these (or to all providers, if none are given) |
 | ctrl-n  | New line |
 """
 
 
 
-def main(initial_prompt=None):
-    if len(providers) == 0:
-        console.print('no providers found, exiting, please set one of the following: OPENAI_API_KEY, OLLAMA_URL, ANTHROPIC_API_KEY, GEMINI_API_KEY in a .env file')
-        return
+def chosen_provider(args):
+    """ The provider asked for (-p), or the configured default """
+    return args.provider or default_provider() or providers[0]
+
+
+def make_client(args, pool=None):
+    provider_name = chosen_provider(args)
     
+    if pool is not None:
+        client, _ = pool.get(full_provider_name(provider_name))
+    else:
+        client = provider_factory(provider_name)
+
+    if args.model:
+        client.model = args.model
+    return client
+
+
+def make_fan_out(spec):
+    """ A client for each of the providers (and optionally models) in spec, e.g. 'openai,ollama:llama3.1' """
+    from az.fanout import parse_targets, make_clients
+    targets = parse_targets(spec, providers)
+    for provider_hint, _ in targets:
+        resolve_provider(provider_hint, providers)  # fail before creating any client
+    return make_clients(targets, provider_factory)
+
+
+def make_response_cache(args):
+    """ The response cache, if enabled by --cache/--cache-ttl or the "response-cache" config, otherwise None """
+    settings = config.get("response-cache", {})
+    enabled = args.cache if args.cache is not None else (args.cache_ttl is not None or settings.get("enabled", False))
+    if not enabled:
+        return None
+    from az.response_cache import ResponseCache
+    ttl = args.cache_ttl if args.cache_ttl is not None else settings.get("ttl")
+    return ResponseCache(ttl=ttl, max_size=settings.get("max-size-mb", 100) * 1024 * 1024)
+
+
+def run_prompts(args):
+    """ --prompts: run many prompts concurrently, writing JSONL results to stdout """
+    from az.batch import read_prompts, run_batch, write_results
+
+    client = make_client(args)
+    search_index = make_search_index()
+    chat = make_chat(make_response_cache(args), search_index=search_index)
+    try:
+        if args.prompts == '-':
+            n_errors = write_results(run_batch(client, read_prompts(sys.stdin), workers=args.workers, ordered=not args.unordered, stats=args.stats, chat=chat))
+        else:
+            with open(args.prompts) as f:
+                n_errors = write_results(run_batch(client, read_prompts(f), workers=args.workers, ordered=not args.unordered, stats=args.stats, chat=chat))
+    finally:
+        if search_index is not None:
+            search_index.close()
+    if n_errors:
+        print(f"{n_errors} prompt(s) failed", file=sys.stderr)
+    return 1 if n_errors else 0
+
+
+def make_failover(args):
+    """ The failover policy (see az.hedge), if --failover or the "failover" config name backup providers, otherwise None """
+    if not (args.failover or config.get("failover", {}).get("providers")):
+        return None
+    from az.hedge import Policy
+    return Policy.from_config(config, provider_factory, args.failover)
+
+
+def make_search_index():
+    """ The index of past prompts and responses (see az.search), None if it's turned off """
+    if not config.get("search", {}).get("enabled", True):
+        return None
+    from az.search import SearchIndex
+    return SearchIndex()
+
+
+def make_chat(response_cache, failover=None, search_index=None, session=None):
+    """ chat(client, message): the response chunks, from the response cache if there is one,
+    hedged and failed over to other providers if there is a failover policy, and indexed in
+    search_index (if given, with the id of the session(client) it's saved in) once complete or interrupted
+    """
+    def respond(client, message):
+        if failover:
+            from az.hedge import hedged_chat
+            return hedged_chat(client, message, failover)
+        return client.chat(message)
+
+    def indexed(client, message, chunks):
+        start = time.perf_counter()
+        parts = []
+        answered = False  # completely, or until interrupted (not when the request failed)
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+            answered = True
+        except (*INTERRUPTIONS, Exception) as e:
+            if isinstance(e, INTERRUPTIONS) or getattr(client, "aborted", False):  # cut short (see LLMProvider.abort)
+                parts.append(TRUNCATED_MARK)
+                answered = True
+            raise
+        finally:
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+            if answered:
+                search_index.add(message, "".join(parts), provider=getattr(client, "provider", None), model=getattr(client, "model", None),
+                                 latency=time.perf_counter() - start, session=session(client) if session else None)
+
+    def chat(client, message):
+        if response_cache:
+            from az.response_cache import cached_chat
+            chunks = cached_chat(client, message, response_cache, chunk_size=config.get("response-cache", {}).get("chunk-size", 40), chat=respond)
+        else:
+            chunks = respond(client, message)
+        return indexed(client, message, chunks) if search_index is not None else chunks
+    return chat
+
+
+def run_raw(args):
+    """ --raw (and -b when stdout isn't a terminal): write the response as plain text as it streams in,
+    without rendering it (rich isn't imported). The prompt is the argument, or stdin.
+    """
+    from az.raw import RawWriter, Text
+
+    prompt = args.initial_prompt
+    if prompt is None:
+        if sys.stdin.isatty():
+            print("a prompt is needed, as an argument or on stdin", file=sys.stderr)
+            return 2
+        prompt = sys.stdin.read()
+
+    # a one-shot prompt goes to the daemon, if one is running (see az.daemon)
+    connection = None
+    if not (args.fan_out or args.cache or args.cache_ttl is not None or args.failover):
+        from az.daemon import forward, socket_path
+        connection = forward(socket_path(config))
+
+    out = RawWriter(sys.stdout)
+    all_stats = []
+    search_index = None
+    try:
+        if connection:
+            from az.daemon import ConfigMismatch, DaemonError
+            # chosen by this process's config, not the daemon's
+            provider_name = full_provider_name(chosen_provider(args))
+            request = {"prompt": prompt, "provider": provider_name, "model": args.model or config.get(provider_name, {}).get("model"),
+                       "config": config_digest(config)}
+            last = ""
+            try:
+                with connection:
+                    for chunk in connection.chat(request):
+                        out.write(chunk)
+                        last = chunk or last
+            except ConfigMismatch:
+                connection = None  # the daemon runs with another config (e.g. another project's): the prompt is run here
+            except DaemonError as e:
+                out.close()
+                print(f"error: {e}", file=sys.stderr)
+                return 1
+            else:
+                if not last.endswith("\n"):
+                    out.write("\n")
+                all_stats.append(connection.stats)
+        if connection is None:
+            search_index = make_search_index()  # the daemon indexes the responses it serves
+            chat = make_chat(make_response_cache(args), make_failover(args), search_index)
+            if args.fan_out:
+                # the responses are streamed concurrently, but written one after the other
+                from az.fanout import Stream, fan_out
+                streams = [Stream(client, Text()) for client in make_fan_out(args.fan_out)]
+                fan_out(streams, prompt, chat)
+                for stream in streams:
+                    text = f"error: {stream.error}" if stream.error else stream.response.text
+                    out.write(f"--- {stream.client} ---\n{text.rstrip()}\n")
+                    all_stats.append(stream.stats and stream.stats.as_dict())
+            else:
+                client = make_client(args)
+                for warning in tokens.preflight(client, prompt, config):
+                    print(f"warning: {warning}", file=sys.stderr)
+                measured = measure(client, chat(client, prompt))
+                last = ""
+                for chunk in measured:
+                    out.write(chunk)
+                    last = chunk or last
+                if not last.endswith("\n"):
+                    out.write("\n")
+                all_stats.append(measured.stats.as_dict())
+    finally:
+        out.close()
+        if search_index is not None:
+            search_index.close()
+    if args.stats:
+        for stats in all_stats:
+            if stats:
+                print(json.dumps(stats), file=sys.stderr)
+    return 0
+
+
+def make_responder(args, pool, search_index=None):
+    """ respond(request) for the daemon: the response to a {"prompt", "provider", "model", "config"} request,
+    by a fork (a new chat, sharing connections) of the pooled client of the provider.
+    Requests from processes with another config are refused (with a daemon.ConfigMismatch).
+    """
+    import threading
+    from az.daemon import ConfigMismatch
+    chat = make_chat(make_response_cache(args), make_failover(args), search_index)
+    lock = threading.Lock()  # the pool is shared by the daemon's threads
+
+    def respond(request):
+        if request.get("config") != config_digest(config):
+            raise ConfigMismatch("the daemon runs with another config")
+        provider_name = request.get("provider") or default_provider() or providers[0]
+        with lock:
+            client, _ = pool.get(full_provider_name(provider_name))
+        client = client.fork()
+        if request.get("model"):
+            client.model = request["model"]
+        return measure(client, chat(client, request["prompt"]))
+    return respond
+
+
+def run_daemon(args):
+    """ --daemon: serve prompts from one-shot runs on a Unix socket, with warm clients """
+    import signal
+    from az.daemon import Daemon, socket_path
+
+    pool = ClientPool(provider_factory, idle_timeout=config.get("client-pool", {}).get("idle-timeout", DEFAULT_IDLE_TIMEOUT))
+    make_client(args, pool)  # the client of the default provider is ready before the first prompt
+    path = socket_path(config)
+    search_index = make_search_index()
+    with Daemon(path, make_responder(args, pool, search_index)) as server:
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # exit cleanly (removing the socket) when killed
+        print(f"azc daemon listening on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if search_index is not None:
+                search_index.close()
+    return 0
+
+
+def run_serve(argv):
+    """ azc serve: an OpenAI compatible endpoint over the configured providers (see az.serve) """
+    import asyncio
+    from az.serve import Gateway
+    parser = argparse.ArgumentParser(prog="azc serve", description="Serve the configured providers with the OpenAI API (/v1/chat/completions, /v1/models)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("-p", "--providers", help="The providers to serve, e.g. 'openai,ollama' (default: all configured)")
+    args = parser.parse_args(argv)
+
+    clients = []
+    for provider_hint in (args.providers.split(",") if args.providers else providers):
+        try:
+            # no primer: the requests bring their own system prompt
+            clients.append(provider_class(resolve_provider(provider_hint.strip(), providers))(config))
+        except Exception as e:
+            print(f"skipping {provider_hint}: {e}", file=sys.stderr)
+    if not clients:
+        print("no providers to serve", file=sys.stderr)
+        return 1
+
+    gateway = Gateway(clients, config)
+    print(f"serving {', '.join(map(str, clients))} on http://{args.host}:{args.port}/v1", file=sys.stderr)
+    try:
+        asyncio.run(gateway.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def sessions_table(store, limit=20):
+    """ The most recent saved chats, as markdown """
+    rows = [f"| {s['id']} | {time.strftime('%Y-%m-%d %H:%M', time.localtime(s.get('updated', 0)))} | {s.get('provider')}:{s.get('model')} | {s.get('turns', 0)} | {s.get('title', '')} |"
+            for s in store.sessions()[:limit]]
+    if not rows:
+        return "No saved chats yet"
+    return "| Session | Updated | Model | Turns | First message |\n|---|---|---|---|---|\n" + "\n".join(rows)
+
+
+def search_table(results):
+    """ Search results, as markdown """
+    if not results:
+        return "Nothing found"
+    def cell(text, length=80):
+        text = " ".join(text.split()).replace("|", "\\|")
+        return text if len(text) <= length else text[:length - 1] + "…"
+    rows = [f"| {time.strftime('%Y-%m-%d %H:%M', time.localtime(r['time']))} | {r['provider']}:{r['model']} | {cell(r['prompt'], 40)} | {cell(r['snippet'], 120)} | {r['session'] or ''} |"
+            for r in results]
+    return "| When | Model | Prompt | Found | Session |\n|---|---|---|---|---|\n" + "\n".join(rows)
+
+
+def run_search(args):
+    """ azc --search: print the past chats matching the query (as JSONL when not writing to a terminal, or with --raw) """
+    from az.search import SearchIndex
+    index = SearchIndex()
+    try:
+        results = index.search(args.search)
+    finally:
+        index.close()
+    if args.raw or (args.raw is None and not sys.stdout.isatty()):
+        for result in results:
+            print(json.dumps(result))
+    else:
+        from rich.console import Console
+        from rich.markdown import Markdown
+        Console().print(Markdown(search_table(results)))
+
+
+def stats_table(report):
+    from rich.table import Table
+
+    def number(value, fmt):
+        return "-" if value is None else format(value, fmt)
+
+    table = Table(title="Response stats", title_justify="left")
+    for column in ("Model", "Responses", "Mean TTFT", "Mean duration", "Output tokens", "Mean tok/s", "Cached input"):
+        table.add_column(column, justify="left" if column == "Model" else "right")
+    for row in report.rows():
+        table.add_row(row["model"], str(row["responses"]), number(row["mean_ttft"], ".2f") + "s",
+                      number(row["mean_duration"], ".2f") + "s", str(row["output_tokens"]),
+                      number(row["mean_tokens_per_second"], ".0f"), number(row["cache_hit_rate"], ".0%"))
+    return table
+
+
+def main(initial_prompt=None):
+    if sys.argv[1:2] == ["serve"]:
+        return run_serve(sys.argv[2:])
+
     parser = argparse.ArgumentParser(description="Chat with an AI assistant")
     parser.add_argument("-p", "--provider", help="The provider to use, e.g. 'openai' or 'ollama'. Abbreviations allowed, like 'op' for 'openai'")
     parser.add_argument("-m", "--model", help="The model to use")
     parser.add_argument("-d", "--double-enter", action="store_true", help="Enable 'press enter twice to submit' mode")
     parser.add_argument("-b", "--batch", action="store_true", help="Not interactive, just do one chat and exit")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
+    parser.add_argument("--prompts", metavar="FILE", help="Run every prompt in FILE ('-' for stdin; one per line, or JSONL with a \"prompt\" field) and write the responses as JSONL")
+    parser.add_argument("--workers", type=int, default=4, help="Number of prompts to run concurrently with --prompts (default: 4)")
+    parser.add_argument("--unordered", action="store_true", help="With --prompts, write results as they complete rather than in input order")
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=None, help="Serve repeated requests (same provider, model and conversation) from a local response cache, or not (overrides the config)")
+    parser.add_argument("--cache-ttl", type=float, metavar="SECONDS", help="Ignore cached responses older than this (implies --cache)")
+    parser.add_argument("--resume", metavar="ID", help="Continue a saved chat: its id (or a unique prefix of it), or 'last'")
+    parser.add_argument("--search", metavar="WORDS", help="Search past prompts and responses, and exit")
+    parser.add_argument("--raw", action=argparse.BooleanOptionalAction, default=None, help="Write the response as plain text as it streams, no markdown rendering, and exit (the default with -b when stdout isn't a terminal)")
+    parser.add_argument("-f", "--fan-out", metavar="PROVIDERS", help="Send every prompt to several providers at once, e.g. 'openai,anthropic,ollama:llama3.1' ('all' for all of them)")
+    parser.add_argument("--failover", metavar="PROVIDERS", help="Backup providers, e.g. 'anthropic,ollama:llama3.1': asked when the provider fails, or is slow to answer (see \"failover\" in the config)")
+    parser.add_argument("--daemon", action="store_true", help="Keep warm provider clients in the background, for one-shot runs (-b to a pipe, --raw) to use")
+    parser.add_argument("--stats", action="store_true", help="Show latency and throughput after each response, and a report at exit (as JSON on stderr with -b, in each result with --prompts)")
     parser.add_argument("initial_prompt", nargs='?', help="Initial prompt (if provided without a flag)")
     args = parser.parse_args()
     initial_prompt = args.initial_prompt
 
+    if args.search:
+        return run_search(args)
+
+    if len(providers) == 0:
+        print('no providers found, exiting, please set one of the following: OPENAI_API_KEY, OLLAMA_URL, ANTHROPIC_API_KEY, GEMINI_API_KEY in a .env file')
+        return
+
+    if args.daemon:
+        return run_daemon(args)
+
+    if args.prompts:
+        return run_prompts(args)
+
+    if args.raw or (args.raw is None and args.batch and not args.resume and not sys.stdout.isatty()):
+        return run_raw(args)
+
+    from rich.console import Console
+    from rich.markdown import Markdown
+    from rich.live import Live
+    from az.render import response_panel, StreamingMarkdown
+
+    console = Console()
+
     if args.verbose:
         console.print('providers configured: [yellow]' + ', '.join(providers) + '[/]')
 
     if args.double_enter:
         console.print("type <enter> twice to submit...")
-        @bindings.add('enter')
-        def _(event):
-            buffer = event.current_buffer
-            accepted = False
-            if buffer.document.text.strip() == '':
-                accepted = True
-            elif is_command(buffer.document.text):
-                accepted = True
-            elif buffer.document.text.endswith('\n') and buffer.document.is_cursor_at_the_end:
-                accepted = True
-            else:
-                accepted = False
-            if accepted:
-                buffer.validate_and_handle()
-            else:
-                buffer.insert_text('\n')
 
 
-
-    provider_name = args.provider if args.provider else default_provider()
-    provider_name = provider_name if provider_name else providers[0]
-    
-    client = provider_factory(provider_name)
-
-    if args.model:
-        client.model = args.model
+    # interactive (and resumed) chats are saved, see az.sessions
+    store = None
+    if (not args.batch or args.resume) and config.get("sessions", {}).get("enabled", True):
+        from az.sessions import SessionStore
+        store = SessionStore()
+    client_sessions = {}  # client -> id of the session its current chat is saved in
+
+    # the clients of the providers used in this session, so switching back to one keeps its conversation
+    client_pool = ClientPool(lambda provider_name: provider_factory(provider_name),
+                             idle_timeout=config.get("client-pool", {}).get("idle-timeout", DEFAULT_IDLE_TIMEOUT),
+                             on_evict=lambda evicted: client_sessions.pop(evicted, None))
+    def session_of(client):
+        """ The id of the session the client's current chat is saved in (a new one for a new chat), None if not saved """
+        if store is None:
+            return None
+        if client not in client_sessions:
+            client_sessions[client] = store.new_id()
+        return client_sessions[client]
+
+    def record(client, message, response):
+        if store is not None:
+            store.append(session_of(client), [{"role": "user", "content": message}, {"role": "assistant", "content": response}],
+                         provider=getattr(client, "provider", None), model=getattr(client, "model", None))
+
+    # and every prompt and response is indexed for /search (by chat, see make_chat and az.search)
+    search_index = make_search_index()
+
+    client = make_client(args, client_pool)
+    response_cache = make_response_cache(args)
+    chat = make_chat(response_cache, make_failover(args), search_index, session_of)
+    fan_out_clients = make_fan_out(args.fan_out) if args.fan_out else None
+
+    def resume(session_id):
+        """ Load a saved chat into the client of its provider, which becomes the current client """
+        from az.sessions import turns
+        session_id = store.resolve(session_id)
+        entry, messages = store.load(session_id)
+        resumed, _ = client_pool.get(full_provider_name(entry["provider"]))
+        try:
+            resumed.model = entry["model"]
+        except ValueError:
+            console.print(f'[red]model {entry["model"]} is not available, using {resumed.model}[/]')
+        resumed.new_chat()
+        for message, response in turns(messages):
+            resumed.record_turn(message, response)
+        client_sessions[resumed] = session_id
+        console.print(f'resumed {session_id}: {resumed} ({entry.get("turns", 0)} turns)')
+        return resumed
+
+    if args.resume:
+        try:
+            client = resume(args.resume)
+        except (ValueError, KeyError, OSError) as e:
+            console.print(f'[red]error: cannot resume {args.resume}: {e}[/]')
+            return 1
     
     if args.verbose:
         console.print(f'using: [green]{client}[/]')
         console.print('[magenta]type ? or h for help[/]')
 
-    def bottom_toolbar():
-        return HTML(f' Using <b>{client}</b> ({number_to_ordinal(client.n_user_messages()+1)} message)     <ansicyan>enter ? or h for help</ansicyan> ')
+    session = None
+
+    def prompt_session():
+        # prompt_toolkit is only needed (and imported) once we actually prompt the user
+        nonlocal session
+        if session is None:
+            from prompt_toolkit import PromptSession
+            from az import ui
+            if args.double_enter:
+                ui.enable_double_enter()
+            session = PromptSession(history=ui.FilteredHistory(HISTORY_FILE_NAME), input=get_input())
+        return session
 
-    our_history = FilteredHistory(HISTORY_FILE_NAME)
-    session = PromptSession(history=our_history, input=get_input())
+    last_stats = None
+    stats_report = StatsReport()
+    spent = 0.0  # the estimated cost of the responses so far ($)
+
+    def bottom_toolbar():
+        from prompt_toolkit.formatted_text.html import HTML, html_escape
+        from prompt_toolkit.application import get_app
+        # everything but the markup is escaped: model names, and readouts like '<$0.0001', are not HTML
+        last = f'  last: {html_escape(last_stats.summary())}' if last_stats else ''
+        if getattr(client, 'catalog', None) and client.catalog.refreshing:
+            last += '  (refreshing models)'
+        if fan_out_clients:
+            using = ', '.join(f'<b>{html_escape(c)}</b>' for c in fan_out_clients)
+            return HTML(f' Fan-out to {using} ({number_to_ordinal(fan_out_clients[0].n_user_messages()+1)} message)     <ansicyan>enter ? or h for help</ansicyan> ')
+        # the size (and cost) of the request being typed, counting only new text (see az.tokens)
+        size = tokens.readout(client, get_app().current_buffer.text, config)
+        size = f'  next: {html_escape(size)}' if size else ''
+        if spent:
+            size += f'  spent: {html_escape(tokens.dollars(spent))}'
+        return HTML(f' Using <b>{html_escape(client)}</b> ({number_to_ordinal(client.n_user_messages()+1)} message){size}{last}     <ansicyan>enter ? or h for help</ansicyan> ')
 
     done=False
     
@@ -227,13 +561,17 @@ def main(initial_prompt=None):
                     done=True
             else:
                 # Get user input using prompt_toolkit
+                from prompt_toolkit.patch_stdout import patch_stdout
+                from prompt_toolkit.formatted_text import HTML
+                from az import ui
+                prompt_session()
                 with patch_stdout():
                     try:
                         user_input = session.prompt(
                             HTML(f'<ansicyan>azc></ansicyan> '),
-                            completer=completer,
+                            completer=ui.CommandsCompleter(providers),
                             bottom_toolbar=bottom_toolbar,
-                            key_bindings=bindings
+                            key_bindings=ui.bindings
                         )
                     except EOFError:
                         done = True
@@ -248,24 +586,59 @@ def main(initial_prompt=None):
                 break
 
             if user_input.strip().lower() in ('l'):
-                console.print(Markdown('  - ' + '\n  - '.join(client.list_models())))
+                models = client.list_models()
+                if models:
+                    console.print(Markdown('  - ' + '\n  - '.join(models)))
+                elif getattr(client, 'catalog', None) and client.catalog.refreshing:
+                    console.print('[magenta]the models are being fetched, try again in a moment[/]')
                 continue
 
             if user_input.strip().lower() in ('n'):
                 client.new_chat()
+                client_sessions.pop(client, None)
+                for fan_out_client in fan_out_clients or []:
+                    fan_out_client.new_chat()
+                    client_sessions.pop(fan_out_client, None)
                 continue
 
             if user_input.strip().lower() in ('r'):
                 client.refresh_models()
                 continue
 
+            if user_input.strip() == 'sessions' or user_input.startswith('sessions '):
+                session_id = user_input[len('sessions'):].strip()
+                if store is None:
+                    console.print('[red]saving chats is disabled[/]')
+                elif not session_id:
+                    console.print(Markdown(sessions_table(store)))
+                else:
+                    try:
+                        store.flush()
+                        client = resume(session_id)
+                        fan_out_clients = None
+                    except (ValueError, KeyError, OSError) as e:
+                        console.print(f'[red]error: {e}[/]')
+                continue
+
+            if user_input.strip() == '/search' or user_input.startswith('/search '):
+                query = user_input[len('/search'):].strip()
+                if search_index is None:
+                    console.print('[red]search is disabled[/]')
+                elif query:
+                    search_index.flush()
+                    console.print(Markdown(search_table(search_index.search(query))))
+                continue
+
             if user_input.strip().lower() in ('h', '?'):
                 console.print(Markdown(help()))
                 continue
 
             if user_input.strip().lower() in ('m'):
-                model = session.prompt(
+                from prompt_toolkit.formatted_text import HTML
+                from az import ui
+                model = prompt_session().prompt(
                     HTML(f'<ansicyan>model (partial name okay): </ansicyan> '),
+                    completer=ui.ModelsCompleter(client),
                     multiline=False,
                     is_password=False
                 )
@@ -275,44 +648,92 @@ def main(initial_prompt=None):
             if user_input.startswith('p '):
                 provider_name = user_input.split(' ')[1]
                 try:
-                    client = provider_factory(provider_name)
-                    console.print(f'using: {client} (new chat)')
+                    client, created = client_pool.get(full_provider_name(provider_name))
+                    fan_out_clients = None
+                    if created or client.n_user_messages() == 0:
+                        console.print(f'using: {client} (new chat)')
+                    else:
+                        console.print(f'using: {client} (continuing the chat, n for a new one)')
                 except ValueError as e:
                     console.print(f'[red]error: {e}[/]')
                 continue
 
-            title = f"{client} ({number_to_ordinal(client.n_user_messages()+1)} message)" if not args.batch else None
+            if user_input.strip() == 'f' or user_input.startswith('f '):
+                try:
+                    fan_out_clients = make_fan_out(user_input[2:])
+                    console.print(f'fanning out to: {", ".join(map(str, fan_out_clients))} (new chats)')
+                except ValueError as e:
+                    console.print(f'[red]error: {e}[/]')
+                continue
 
-            assistant_panel = Panel(
-                Align.left(""),
-                title=title,
-                style="yellow",
-                expand=True,
-                box=EMPTY
-            )
+            for checked in fan_out_clients or [client]:
+                for warning in tokens.preflight(checked, user_input, config):
+                    console.print(f'[yellow]warning: {checked}: {warning}[/]')
 
-            current_message = ""
+            if fan_out_clients:
+                from az.fanout import FanOutView, Stream, fan_out
+                streams = [Stream(fan_out_client) for fan_out_client in fan_out_clients]
+                try:
+                    with Live(FanOutView(streams), console=console, refresh_per_second=4, vertical_overflow='ellipsis'):
+                        fan_out(streams, user_input, chat, config)
+                except KeyboardInterrupt:
+                    console.print('[dim](interrupted)[/]')
+                for stream in streams:
+                    if not stream.error:
+                        record(stream.client, user_input, stream.response.text + (TRUNCATED_MARK if stream.truncated else ""))
+                    if stream.stats:
+                        stats_report.add(stream.stats)
+                        spent += tokens.stats_cost(config, stream.stats) or 0
+                        if args.stats and args.batch:
+                            print(json.dumps(stream.stats.as_dict()), file=sys.stderr)
+                continue
+
+            title = f"{client} ({number_to_ordinal(client.n_user_messages()+1)} message)" if not args.batch else None
+
+            response = StreamingMarkdown()
+            assistant_panel = response_panel(response, title=title, border_style="none")
 
             # Note that vertical_overflow="visible" causes realtime updates of rendered markdown beyond the full window height,
             # but it leaves a trail of partially rendered markdown behind when new content is added, hence it is not used
-            with Live(assistant_panel, console=console, refresh_per_second=2, vertical_overflow='ellipsis') as live:
-                if args.double_enter:
-                    console.print(f'...')
-                for chunk in client.chat(user_input):
-                    current_message += chunk
-                    new_panel = Panel(
-                        Align.left(Markdown(current_message)),
-                        title=title,
-                        style="yellow",
-                        expand=True,
-                        border_style="none",
-                        box=EMPTY
-                    )
-                    live.update(new_panel, refresh=False)
+            # the response is read on its own thread, and rendered in chunks as large as rendering can keep up with
+            measured = measure(client, chat(client, user_input))
+            stream = coalesce(measured, config, abort=getattr(client, "abort", None))
+            truncated = False
+            try:
+                with Live(assistant_panel, console=console, refresh_per_second=2, vertical_overflow='ellipsis') as live:
+                    if args.double_enter:
+                        console.print(f'...')
+                    for chunk in stream:
+                        # Live picks up the new text on its next refresh
+                        response.append(chunk)
+            except KeyboardInterrupt:
+                # ctrl-c stops the response, not azc: the stream is closed (releasing its connection),
+                # and the partial response is kept in the chat, marked as truncated
+                stream.close()
+                truncated = True
+                console.print('[dim](interrupted)[/]')
+
+            record(client, user_input, response.text + (TRUNCATED_MARK if truncated else ""))
+            last_stats = measured.stats
+            spent += tokens.stats_cost(config, last_stats) or 0
+            if last_stats.answered_by and not args.stats:
+                console.print(f"[dim](answered by {last_stats.answered_by})[/]", justify="right")
+            stats_report.add(last_stats)
+            if args.stats:
+                if args.batch:
+                    print(json.dumps(last_stats.as_dict()), file=sys.stderr)
+                else:
+                    console.print(f"[dim]{last_stats.summary()}[/]", justify="right")
 
     except KeyboardInterrupt:
         done = True
     finally:
+        if store is not None:
+            store.close()
+        if search_index is not None:
+            search_index.close()
+        if args.stats and not args.batch and stats_report.responses:
+            console.print(stats_table(stats_report))
         if not args.batch:
             console.print(":wave: [italic]Bye[/]")
 
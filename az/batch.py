@@ -0,0 +1,102 @@
+""" Batch mode: run many prompts through a provider concurrently
+
+Prompts are read one per line, either as plain text or as JSON objects (JSONL) with a "prompt"
+and optionally an "id" and any other fields, which are passed through to the result.
+Results are written as JSONL, either in input order or in completion order.
+"""
+import json
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from az.response_cache import cached_chat
+from az.stats import measure
+
+
+def read_prompts(lines):
+    """ Yield a dict with (at least) "id" and "prompt" for every non-empty input line.
+    A line which isn't a JSON object is a plain text prompt (even if it starts with '{'),
+    a JSON object without a "prompt" gets an "error" instead, so the rest of the batch still runs.
+    """
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        item = None
+        if line.startswith('{'):
+            try:
+                item = json.loads(line)
+            except ValueError:
+                pass
+        if not isinstance(item, dict):
+            yield {"id": line_number, "prompt": line}
+            continue
+        item.setdefault("id", line_number)
+        if "prompt" not in item:
+            item["error"] = f"line {line_number}: JSON input must have a \"prompt\" field"
+        yield item
+
+
+def run_prompt(client, item, cache=None, stats=False, chat=None):
+    """ Run a single prompt in a new conversation, return the result record """
+    result = dict(item)
+    if "error" in item:
+        return result  # the input line was invalid
+    try:
+        conversation = client.fork()
+        if chat:
+            chunks = chat(conversation, item["prompt"])
+        else:
+            chunks = cached_chat(conversation, item["prompt"], cache) if cache else conversation.chat(item["prompt"])
+        measured = measure(conversation, chunks)
+        result["response"] = "".join(measured)
+        if stats:
+            result["stats"] = measured.stats.as_dict()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def run_batch(client, items, workers=4, ordered=True, cache=None, stats=False, chat=None):
+    """ Run prompts concurrently on at most `workers` threads, yielding results as they are ready.
+
+    Every prompt gets its own conversation (a fork of `client`, so the SDK client and its connection
+    pool are shared). Only a bounded number of prompts is read ahead, so the input can be arbitrarily large.
+    With ordered=True results are yielded in input order, otherwise in completion order.
+    If a ResponseCache is given, prompts which were run before are answered from it.
+    `chat(client, message)` sends the prompts instead, if given (e.g. az.az.make_chat's, which also caches them).
+    With stats=True, every result has the latency and throughput of its response (see az.stats).
+    """
+    items = iter(items)
+    max_pending = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def fill():
+            while len(pending) < max_pending:
+                item = next(items, None)
+                if item is None:
+                    return
+                pending.append(executor.submit(run_prompt, client, item, cache, stats, chat))
+
+        fill()
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(f for f in pending if f in done)
+                pending.remove(future)
+            yield future.result()
+            fill()
+
+
+def write_results(results, out=None):
+    """ Write results as JSONL, flushing every line so consumers see results as they complete """
+    out = sys.stdout if out is None else out
+    n_errors = 0
+    for result in results:
+        n_errors += "error" in result
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+    return n_errors
@@ -1,37 +1,185 @@
+import hashlib
 import json
 import os
-from typing import Dict, List, Set
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path: str):
+    """ Exclusive lock across processes, held for the duration of the with block.
+
+    The lock file lives in the temp directory rather than next to `path`, so that it doesn't
+    litter the user's config directory (and isn't replaced when `path` is written with a rename).
+    """
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    lock_path = os.path.join(tempfile.gettempdir(), f"azc-{digest}.lock")
+    with open(lock_path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:  # pragma: no cover
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_atomically(path: str, data: str):
+    """ Write to a temporary file and rename it over `path`, so readers never see a partial file """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
 
 class FileCache:
-    def __init__(self, cache_file: str):
+    """ A persistent cache of string sets, stored as JSON, safe to share between processes.
+
+    - Writes go to a temporary file which is renamed over the cache file, under a cross-process lock.
+      Only the changes made through this object are applied on top of what is on disk at write time,
+      so concurrent writers don't lose each other's updates.
+    - Entries can have a time-to-live. Expired entries are still returned by get()
+      (stale-while-revalidate): use is_stale() to find out if it's time to refresh them.
+    - Use deferred() to batch several changes into a single write, or autoflush=False to only write on flush().
+    """
+    def __init__(self, cache_file: str, ttl: Optional[float] = None, autoflush: bool = True):
         self.cache_file = cache_file
-        self.cache: Dict[str, Set[str]] = self._load_cache()
+        self.ttl = ttl
+        self.autoflush = autoflush
+        self._pending = []   # changes not written yet: (operation, key, entry)
+        self._defer = 0
+        self._mtime = None
+        self.cache: Dict[str, Set[str]] = {}
+        self._ordered: Dict[str, List[str]] = {}  # the same values, in the order they were set
+        self._updated: Dict[str, float] = {}
+        self._ttls: Dict[str, Optional[float]] = {}
+        self._load_cache()
 
-    def _load_cache(self) -> Dict[str, Set[str]]:
-        if os.path.exists(self.cache_file):
+    def _read_entries(self) -> Dict[str, dict]:
+        """ The entries on disk: key -> {"value": [...], "updated": timestamp, "ttl": seconds or None} """
+        try:
             with open(self.cache_file, 'r') as f:
+                self._mtime = os.fstat(f.fileno()).st_mtime_ns
                 data = json.load(f)
-                return {k: set(v) for k, v in data.items()}
-        return {}
+        except FileNotFoundError:
+            self._mtime = None
+            return {}
+        # the original format was just key -> list of values
+        return {k: v if isinstance(v, dict) else {"value": v, "updated": 0, "ttl": None} for k, v in data.items()}
+
+    def _set_entries(self, entries: Dict[str, dict]):
+        self.cache = {k: set(entry["value"]) for k, entry in entries.items()}
+        self._ordered = {k: list(entry["value"]) for k, entry in entries.items()}
+        self._updated = {k: entry.get("updated", 0) for k, entry in entries.items()}
+        self._ttls = {k: entry.get("ttl") for k, entry in entries.items()}
+
+    def _load_cache(self):
+        self._set_entries(self._read_entries())
+
+    def _reload_if_changed(self):
+        if self._pending:
+            return
+        try:
+            mtime = os.stat(self.cache_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._load_cache()
 
-    def _save_cache(self):
-        with open(self.cache_file, 'w') as f:
-            json.dump({k: list(v) for k, v in self.cache.items()}, f)
+    def _entry(self, value, ttl: Optional[float]) -> dict:
+        return {"value": list(value), "updated": time.time(), "ttl": self.ttl if ttl is None else ttl}
+
+    def _change(self, operation: str, key: Optional[str] = None, entry: Optional[dict] = None):
+        self._pending.append((operation, key, entry))
+        if self.autoflush and not self._defer:
+            self.flush()
+
+    def flush(self):
+        """ Write pending changes to disk """
+        if not self._pending:
+            return
+        with file_lock(self.cache_file):
+            entries = self._read_entries()
+            for operation, key, entry in self._pending:
+                if operation == 'clear':
+                    entries.clear()
+                elif operation == 'set':
+                    entries[key] = entry
+                elif operation == 'update':
+                    old = entries.get(key, {}).get("value", [])
+                    entries[key] = dict(entry, value=sorted(set(old) | set(entry["value"])))
+            write_atomically(self.cache_file, json.dumps(entries))
+            self._mtime = os.stat(self.cache_file).st_mtime_ns
+            self._pending = []
+        self._set_entries(entries)
+
+    @contextmanager
+    def deferred(self):
+        """ Write all the changes made in the with block at once, when it exits """
+        self._defer += 1
+        try:
+            yield self
+        finally:
+            self._defer -= 1
+            if self.autoflush and not self._defer:
+                self.flush()
 
     def get(self, key: str) -> Set[str]:
+        self._reload_if_changed()
         return self.cache.get(key, set())
 
-    def set(self, key: str, value: List[str]):
+    def ordered(self, key: str) -> List[str]:
+        """ The values of key, in the order they were set (e.g. the order of a provider's models list) """
+        self._reload_if_changed()
+        return list(self._ordered.get(key, []))
+
+    def is_stale(self, key: str, ttl: Optional[float] = None) -> bool:
+        """ True if the key is missing or its time-to-live (or the given ttl) has passed """
+        self._reload_if_changed()
+        if key not in self.cache:
+            return True
+        ttl = self._ttls.get(key) if ttl is None else ttl
+        return ttl is not None and time.time() - self._updated.get(key, 0) > ttl
+
+    def set(self, key: str, value: List[str], ttl: Optional[float] = None):
         self.cache[key] = set(value)
-        self._save_cache()
+        self._ordered[key] = list(value)
+        entry = self._entry(value, ttl)
+        self._updated[key], self._ttls[key] = entry["updated"], entry["ttl"]
+        self._change('set', key, entry)
 
-    def update(self, key: str, value: List[str]):
+    def update(self, key: str, value: List[str], ttl: Optional[float] = None):
         self.cache.setdefault(key, set()).update(value)
-        self._save_cache()
+        self._ordered[key] = sorted(self.cache[key])  # as they are written
+        entry = self._entry(value, ttl)
+        self._updated[key], self._ttls[key] = entry["updated"], entry["ttl"]
+        self._change('update', key, entry)
 
     def clear(self):
         self.cache.clear()
-        self._save_cache()
+        self._ordered.clear()
+        self._updated.clear()
+        self._ttls.clear()
+        self._change('clear')
 
 
 if __name__ == "__main__": # pragma: no cover
@@ -47,10 +195,5 @@ if __name__ == "__main__": # pragma: no cover
         print("cache hit")
         models = cache.get("openai")
         print("models:", models)
-        
-    # print(cache.get("openai"))
-
-
-
-
 
+    # print(cache.get("openai"))
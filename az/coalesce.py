@@ -0,0 +1,117 @@
+""" Coalescing of response streams
+
+Providers yield whatever the network delivers, often a few characters at a time, and rendering
+every one of them makes the UI loop the bottleneck for fast models. A CoalescedStream reads the
+response on its own thread, so slow rendering never holds up reading the socket, and hands it to
+its consumer in larger chunks: everything received since the consumer's last chunk, once `max_size`
+characters are in, or `max_delay` seconds after that last chunk. The first chunk is handed over
+as soon as it arrives, so the time to first token is not delayed.
+
+It is an iterator like the response itself, so it can sit between any chat() generator and its consumer.
+On ctrl-c, the consumer closes it: the response being read is aborted (see LLMProvider.abort), so a
+stalled one stops at once, and the reader thread closes the underlying generator.
+
+Config (all optional):
+
+    "stream": {"coalesce-size": 1024, "coalesce-delay": 0.05}
+"""
+import threading
+import time
+
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_MAX_DELAY = 0.05
+CLOSE_TIMEOUT = 1.0  # seconds close() waits for the reader to stop, after that it stops by itself on its next chunk
+
+
+class CoalescedStream:
+    """ An iterator over the chunks of `chunks` (e.g. client.chat(message)), joined in larger chunks.
+    abort() (e.g. client.abort) stops the read the reader thread is waiting on, when the stream is closed.
+    """
+    def __init__(self, chunks, max_size=DEFAULT_MAX_SIZE, max_delay=DEFAULT_MAX_DELAY, abort=None):
+        self.chunks = chunks
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.abort = abort
+        self._buffer = []
+        self._size = 0
+        self._done = False
+        self._error = None
+        self._closed = False
+        self._last = None  # when the consumer got its last chunk
+        self._condition = threading.Condition()
+        # started by the first next(), so a stream which is never iterated is never read
+        self._reader = threading.Thread(target=self._read, name="azc-stream", daemon=True)
+
+    def _read(self):
+        try:
+            for chunk in self.chunks:
+                with self._condition:
+                    if self._closed:
+                        break
+                    self._buffer.append(chunk)
+                    self._size += len(chunk)
+                    self._condition.notify()
+        except Exception as e:
+            self._error = e
+        finally:
+            if self._closed:
+                # the generator is closed here, as it can't be while this thread is running it
+                close = getattr(self.chunks, "close", None)
+                if close:
+                    close()
+            with self._condition:
+                self._done = True
+                self._condition.notify()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._reader.ident is None:
+            self._reader.start()
+        with self._condition:
+            while not self._ready():
+                self._condition.wait(self._timeout())
+            if not self._buffer:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                raise StopIteration
+            chunk = "".join(self._buffer)
+            self._buffer, self._size = [], 0
+            self._last = time.monotonic()
+            return chunk
+
+    def _ready(self):
+        if self._done:
+            return True
+        if not self._buffer:
+            return False
+        return self._last is None or self._size >= self.max_size or time.monotonic() - self._last >= self.max_delay
+
+    def _timeout(self):
+        if self._buffer and self._last is not None:
+            return max(self._last + self.max_delay - time.monotonic(), 0)
+        return None
+
+    def close(self):
+        """ Stop the stream: the read the reader is waiting on is aborted, and it closes the underlying stream """
+        with self._condition:
+            if self._done and not self._closed:
+                return  # read to the end
+            self._closed = True
+        if self._reader.ident is None:
+            close = getattr(self.chunks, "close", None)
+            if close:
+                close()
+            return
+        if self.abort is not None:
+            self.abort()
+        self._reader.join(CLOSE_TIMEOUT)
+
+
+def coalesce(chunks, config={}, abort=None):
+    """ `chunks` coalesced as configured """
+    settings = config.get("stream", {})
+    return CoalescedStream(chunks, settings.get("coalesce-size", DEFAULT_MAX_SIZE), settings.get("coalesce-delay", DEFAULT_MAX_DELAY), abort)
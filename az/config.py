@@ -1,37 +1,157 @@
+""" Configuration
+
+The config is read from these JSON files, each overriding the ones before it (dicts are merged key by key):
+
+1. $XDG_CONFIG_DIRS/azc/config.json (default /etc/xdg/azc/config.json): system-wide
+2. ~/.config/azc_config.json (or ~/.azc_config.json if there's no ~/.config)
+3. $XDG_CONFIG_HOME/azc/config.json (default ~/.config/azc/config.json)
+4. ./config.json: the current directory, for per-project settings
+
+get_config() returns a single shared Config for the process. It is only read when first used,
+and re-read when one of the files is created, changed or removed (checked at most once a second),
+so it's cheap to read from anywhere, e.g. while rendering the toolbar.
+"""
 import os
 import json
+import threading
+import time
+from collections.abc import Mapping
+
+
+CHECK_INTERVAL = 1.0  # seconds between checks for changed config files
+
+
+def config_paths(environ=None, cwd=None):
+    """ The config files, from the lowest precedence to the highest """
+    environ = os.environ if environ is None else environ
+    home = os.path.expanduser("~")
+    config_home = environ.get("XDG_CONFIG_HOME") or os.path.join(home, ".config")
+    config_dirs = (environ.get("XDG_CONFIG_DIRS") or "/etc/xdg").split(os.pathsep)
+    legacy = os.path.join(home, ".config", "azc_config.json") if os.path.exists(os.path.join(home, ".config")) else os.path.join(home, ".azc_config.json")
+    return (
+        [os.path.join(d, "azc", "config.json") for d in reversed(config_dirs) if d]
+        + [legacy, os.path.join(config_home, "azc", "config.json"), os.path.join(cwd or os.getcwd(), "config.json")]
+    )
+
+
+def merge(base, override):
+    """ A copy of base with override's values, merging nested dicts """
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class Config(Mapping):
+    """ The merged contents of the config files, read on first use and re-read when one of them changes.
+
+    If a file becomes invalid after the first read, the last good config is kept (see .error).
+    """
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.error = None
+        self._data = None
+        self._mtimes = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def _current_mtimes(self):
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def _load(self, mtimes):
+        data = {}
+        for path, mtime in zip(self.paths, mtimes):
+            if mtime is not None:
+                data = merge(data, load_config(path))
+        return data
+
+    @property
+    def data(self):
+        """ The config as a dict (re-read if a file changed since the last check) """
+        now = time.monotonic()
+        if self._data is not None and now - self._checked < CHECK_INTERVAL:
+            return self._data
+        with self._lock:
+            self._checked = now
+            mtimes = self._current_mtimes()
+            if mtimes != self._mtimes:
+                try:
+                    self._data = self._load(mtimes)
+                    self.error = None
+                except (OSError, ValueError) as e:
+                    if self._data is None:
+                        raise
+                    self.error = e
+                self._mtimes = mtimes
+        return self._data
 
+    def reload(self):
+        """ Re-read the files on next access, whether they changed or not """
+        self._mtimes = None
+        self._checked = 0
 
-def load_config(filename="config.json"):
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+_config = None
+
+
+def get_config():
+    """ The configuration of this process (shared, see Config) """
+    global _config
+    if _config is None:
+        _config = Config(config_paths())
+    return _config
+
+
+def digest(config):
+    """ A hash of the config's contents, to tell whether two processes (e.g. in different projects) run with the same config """
+    import hashlib
+    return hashlib.sha256(json.dumps(dict(config), sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def load_config(filename=None):
+    """ The contents of a config file ({} if it doesn't exist), or the shared config if no file is given """
+    if filename is None:
+        return get_config()
     if not os.path.exists(filename):
         return {}
     with open(filename, "r") as f:
         return json.load(f)
-    
 
-def default_provider(filename="config.json"):
+
+def default_provider(filename=None):
     config = load_config(filename)
     return config.get("default-provider", "openai")
 
 
-def default_model(filename="config.json", provider=None):
+def default_model(filename=None, provider=None):
     config = load_config(filename)
     if provider is None:
         provider = default_provider(filename)
     return config.get('default-models', {}).get(provider, {}).get("model")
-    
+
 
 if __name__ == "__main__":
     config = load_config()
-    print(json.dumps(config, indent=4))
+    print("config files:", ", ".join(config.paths))
+    print(json.dumps(dict(config), indent=4))
 
     print("default provider:", default_provider())
     print("default model:", default_model())
-
-    config_file = "does-not-exist.json"
-    config = load_config(config_file)
-    print(json.dumps(config, indent=4))
-
-    print("default provider:", default_provider(config_file))
-    print("default model:", default_model(config_file))
-    
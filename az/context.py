@@ -0,0 +1,243 @@
+""" The conversation history of a chat, kept within a token budget
+
+Every request resends the whole conversation, so its latency and cost grow with every turn.
+A Conversation keeps the primer (leading system messages) and the most recent turns, and when it
+goes over the model's token budget, the oldest turns are evicted. Optionally, the evicted turns are
+summarized in the background (by a cheap model) and the summary is sent instead of them, so the
+next request isn't delayed.
+
+Config (all optional):
+
+    "context": {
+        "budget": 8000,                        # tokens, for models without a budget of their own
+        "budgets": {"gpt-4o": 32000, "llama3": 4000},  # by (part of) the model name
+        "keep-turns": 2,                       # most recent turns which are never evicted
+        "headroom": 0.25,                      # once over budget, evict down to (1 - headroom) of it
+        "summarize": false                     # summarize evicted turns
+    },
+    "openai": {"summary-model": "gpt-4o-mini"} # model which summarizes (default: the chat's model)
+"""
+from az.stats import CHARS_PER_TOKEN
+
+
+DEFAULT_BUDGET = 8000
+DEFAULT_BUDGETS = {"gpt-4o": 32000, "claude-3-5": 32000, "gemini-1.5": 32000}
+DEFAULT_KEEP_TURNS = 2
+# Evicting a little more than needed means the next few turns don't evict again: they resend the same prefix,
+# which the providers' prompt caches can serve
+DEFAULT_HEADROOM = 0.25
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+SUMMARY_PROMPT = """Summarize the conversation below in a few sentences, keeping facts, names, decisions and open questions which may be needed later.
+{previous}
+{conversation}"""
+
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def budget(config, model):
+    """ Token budget of the conversation with `model`: the longest matching name in the budgets, or the default """
+    settings = config.get("context", {})
+    budgets = {**DEFAULT_BUDGETS, **settings.get("budgets", {})}
+    matches = [name for name in budgets if name in (model or "")]
+    if matches:
+        return budgets[max(matches, key=len)]
+    return settings.get("budget", DEFAULT_BUDGET)
+
+
+class Message:
+    """ A message of a conversation, the same for all the providers.
+
+    A response is built chunk by chunk with append(), the chunks are joined once, when the content is read.
+    Its token counts (see count_tokens()) and its conversions to the providers' wire formats (see wire()) are
+    kept with it, so resending (or counting) the conversation only converts (or counts) the messages which are new.
+    m["role"] and m["content"] work too, as with the {"role", "content"} dicts messages used to be.
+    """
+    __slots__ = ("role", "_parts", "_tokens", "_wire")
+
+    def __init__(self, role, content=""):
+        self.role = role
+        self._parts = [content] if content else []
+        self._tokens = None
+        self._wire = None
+
+    @classmethod
+    def of(cls, message):
+        """ `message` as a Message: itself, or made from a {"role", "content"} dict """
+        return message if isinstance(message, Message) else cls(message["role"], message["content"])
+
+    @property
+    def content(self):
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def append(self, chunk):
+        self._parts.append(chunk)
+        self._tokens = self._wire = None
+
+    @property
+    def tokens(self):
+        """ The estimated number of tokens """
+        return self.count_tokens("estimate", estimate_tokens)
+
+    def count_tokens(self, tokenizer, count):
+        """ The number of tokens by a tokenizer: count(content), counted once per tokenizer """
+        if self._tokens is None:
+            self._tokens = {}
+        if tokenizer not in self._tokens:
+            self._tokens[tokenizer] = count(self.content)
+        return self._tokens[tokenizer]
+
+    def wire(self, format, convert):
+        """ The message in a provider's wire format: convert(message), made once per format """
+        if self._wire is None:
+            self._wire = {}
+        if format not in self._wire:
+            self._wire[format] = convert(self)
+        return self._wire[format]
+
+    def as_dict(self):
+        return {"role": self.role, "content": self.content}
+
+    def __getitem__(self, key):
+        if key not in ("role", "content"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in ("role", "content") else default
+
+    def __eq__(self, other):
+        if isinstance(other, Message):
+            return self.role == other.role and self.content == other.content
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content!r})"
+
+
+class Conversation(list):
+    """ A list of Messages (dicts added to it are made Messages) which keeps count of its user messages
+    and tokens as it grows.
+
+    n_user counts all the user messages of the chat, including evicted ones.
+    """
+    def __init__(self, messages=()):
+        super().__init__(map(Message.of, messages))
+        self.summary = None
+        self.evicted_turns = 0
+        self._recount()
+
+    def _recount(self):
+        self.n_user = self.evicted_turns + sum(1 for m in self if m.role == "user")
+        self.tokens = sum(m.tokens for m in self)
+
+    def append(self, message):
+        message = Message.of(message)
+        super().append(message)
+        self.n_user += message.role == "user"
+        self.tokens += message.tokens
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    # less common changes just count again
+
+    def insert(self, index, message):
+        super().insert(index, Message.of(message))
+        self._recount()
+
+    def pop(self, index=-1):
+        message = super().pop(index)
+        self._recount()
+        return message
+
+    def remove(self, message):
+        super().remove(message)
+        self._recount()
+
+    def clear(self):
+        super().clear()
+        self._recount()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, list(map(Message.of, value)) if isinstance(index, slice) else Message.of(value))
+        self._recount()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._recount()
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def copy(self):
+        clone = Conversation(self)
+        clone.summary = self.summary
+        clone.evicted_turns = self.evicted_turns
+        clone.n_user += self.evicted_turns
+        return clone
+
+    def n_pinned(self):
+        """ Number of leading system messages (the primer), which are never evicted """
+        n = 0
+        while n < len(self) and self[n].role == "system":
+            n += 1
+        return n
+
+    def fit(self, budget, keep_turns=DEFAULT_KEEP_TURNS, headroom=0):
+        """ Evict the oldest turns until the conversation (and its summary) fit in `budget` tokens
+        (in `(1 - headroom) * budget` tokens, once over it), keeping at least the last `keep_turns` turns.
+        Return the evicted messages.
+        """
+        excess = self.tokens + (estimate_tokens(self.summary) if self.summary else 0) - budget
+        if excess <= 0:
+            return []
+        excess += int(budget * headroom)
+        head = self.n_pinned()
+        turns = [i for i in range(head, len(self)) if self[i].role == "user"]
+        cut, freed = head, 0
+        for start in turns[1:len(turns) - max(keep_turns, 1) + 1]:
+            freed += sum(m.tokens for m in self[cut:start])
+            cut = start
+            if freed >= excess:
+                break
+        if cut == head:
+            return []
+        evicted = self[head:cut]
+        self.evicted_turns += sum(1 for m in evicted if m.role == "user")
+        del self[head:cut]
+        return evicted
+
+
+_summaries = None
+
+
+def summarize_later(client, conversation, evicted):
+    """ Summarize the evicted messages (and the conversation's previous summary) with `client` on a
+    background thread, then set conversation.summary. Summaries are made one at a time, in order.
+    """
+    global _summaries
+    if _summaries is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _summaries = ThreadPoolExecutor(max_workers=1, thread_name_prefix="azc-summary")
+
+    def summarize():
+        previous = f"Summary so far: {conversation.summary}\n" if conversation.summary else ""
+        text = "\n\n".join(f"{m.role}: {m.content}" for m in evicted)
+        try:
+            conversation.summary = "".join(client.chat(SUMMARY_PROMPT.format(previous=previous, conversation=text)))
+        except Exception:
+            # a failed summary isn't worth interrupting the chat: the turns are just dropped
+            pass
+
+    return _summaries.submit(summarize)
@@ -0,0 +1,165 @@
+""" Daemon mode: warm clients behind a Unix socket
+
+`azc --daemon` keeps the provider clients (SDKs imported, models lists fetched, connections kept
+alive) in a long-lived process. One-shot runs (`azc -b ... | ...`, `--raw`) forward their prompt to
+it when it is running, and stream the response back, so they don't pay for importing the SDKs,
+creating a client and connecting. Without a daemon they run the prompt themselves.
+
+Protocol: a connection per prompt. The client sends a JSON line {"prompt", "provider", "model", "config"}
+(the provider and model as the client's config chooses them, and a digest of that config), the daemon
+answers with JSON lines: {"chunk": text} for every chunk of the response, then {"done": true, "stats": {...}},
+or {"error": message}. A daemon with another config (e.g. started in another project) answers
+{"error": message, "config-mismatch": true}, and the client runs the prompt itself.
+
+Config (optional):
+
+    "daemon": {"socket": "/path/to/azc.sock"}
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+
+
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"azc-{os.getuid()}.sock")
+
+
+class DaemonError(Exception):
+    """ An error reported by the daemon (e.g. an unknown provider, or a failed request) """
+
+
+class ConfigMismatch(DaemonError):
+    """ The daemon runs with another config than the client's, so it can't answer for it """
+
+
+def socket_path(config={}):
+    return config.get("daemon", {}).get("socket") or SOCKET_PATH
+
+
+def is_owned(path):
+    """ Whether `path` is a socket of this user: anyone can create one under /tmp, to be sent the prompts of others """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def is_running(path):
+    try:
+        connect(path).close()
+        return True
+    except OSError:
+        return False
+
+
+def connect(path):
+    """ A socket connected to the daemon (raises OSError, e.g. FileNotFoundError, if it isn't running) """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class Connection:
+    """ The client side: a prompt sent to the daemon, and its response """
+    def __init__(self, path):
+        self.sock = connect(path)
+        self.stats = None
+
+    def chat(self, request):
+        """ Send the request, yield the chunks of the response. The stats are in self.stats once done. """
+        with self.sock.makefile("rwb") as f:
+            f.write((json.dumps(request) + "\n").encode())
+            f.flush()
+            for line in f:
+                message = json.loads(line)
+                if "chunk" in message:
+                    yield message["chunk"]
+                elif "error" in message:
+                    raise (ConfigMismatch if message.get("config-mismatch") else DaemonError)(message["error"])
+                elif message.get("done"):
+                    self.stats = message.get("stats")
+                    return
+        raise DaemonError("the daemon closed the connection")
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def forward(path):
+    """ A Connection to the daemon, or None if it isn't running (or the socket isn't this user's) """
+    if not is_owned(path):
+        return None
+    try:
+        return Connection(path)
+    except OSError:
+        return None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line.strip():
+            return  # a connection which only checks that the daemon is running
+        try:
+            response = self.server.respond(json.loads(line))
+        except ConfigMismatch as e:
+            self.send({"error": str(e), "config-mismatch": True})
+            return
+        except Exception as e:
+            self.send({"error": str(e)})
+            return
+        try:
+            for chunk in response:
+                self.send({"chunk": chunk})
+            self.send({"done": True, "stats": response.stats.as_dict()})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client is gone (e.g. ctrl-c): stop the response
+        except Exception as e:
+            self.send({"error": f"{type(e).__name__}: {e}"})
+        finally:
+            response.close()  # gives the provider's connection back if the response was cut short
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Serves prompts on a Unix socket (a thread each): respond(request) returns the response,
+    a stats.MeasuredChat
+    """
+    daemon_threads = True
+
+    def __init__(self, path, respond):
+        if os.path.lexists(path):
+            if not is_owned(path):
+                raise RuntimeError(f"{path} is not a socket of this user: use another one (\"daemon\": {{\"socket\": ...}} in the config)")
+            if is_running(path):
+                raise RuntimeError(f"an azc daemon is already running on {path}")
+            os.unlink(path)  # left behind by a daemon which didn't exit cleanly
+        self.respond = respond
+        self.path = path
+        old_umask = os.umask(0o177)  # only this user may connect
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
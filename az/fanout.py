@@ -0,0 +1,127 @@
+""" Fan-out: send the same prompt to several providers/models at once, and stream the responses side by side
+
+Every target has its own client, and so its own conversation, so later turns fan out too.
+The responses are streamed concurrently (a thread each), so comparing providers takes as long
+as the slowest of them rather than the sum of their latencies.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from az.coalesce import coalesce
+from az.stats import measure
+
+
+def parse_targets(spec, providers):
+    """ 'openai,anthropic,ollama:llama3.1' -> [("openai", None), ("anthropic", None), ("ollama", "llama3.1")].
+    Providers may be abbreviated. No spec (or 'all') means every configured provider.
+    """
+    if not spec or spec.strip() == "all":
+        return [(provider, None) for provider in providers]
+    targets = []
+    for part in spec.split(","):
+        provider, _, model = part.strip().partition(":")
+        if provider:
+            targets.append((provider, model or None))
+    return targets
+
+
+def make_clients(targets, factory):
+    """ A client for every (provider, model) target, created concurrently (as creating one may fetch its models) """
+    def create(target):
+        provider, model = target
+        client = factory(provider)
+        if model:
+            client.model = model
+        return client
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return list(executor.map(create, targets))
+
+
+class Stream:
+    """ The response of one client to the fanned-out prompt, rendered as it streams in
+    (or just collected, with a raw.Text response)
+    """
+    def __init__(self, client, response=None):
+        if response is None:
+            from az.render import StreamingMarkdown
+            response = StreamingMarkdown()
+        self.client = client
+        self.response = response
+        self.measured = None
+        self.error = None
+        self.truncated = False  # stopped by cancel() before the response was complete
+        self._cancelled = threading.Event()
+
+    @property
+    def stats(self):
+        return self.measured.stats if self.measured else None
+
+    def run(self, message, chat, config={}):
+        try:
+            self.measured = measure(self.client, chat(self.client, message))
+            stream = coalesce(self.measured, config, abort=getattr(self.client, "abort", None))
+            try:
+                for chunk in stream:
+                    if self._cancelled.is_set():
+                        self.truncated = True
+                        break
+                    self.response.append(chunk)
+            finally:
+                stream.close()
+        except Exception as e:
+            if self._cancelled.is_set():
+                self.truncated = True  # the read of the aborted response failed
+            else:
+                self.error = e
+
+    def cancel(self):
+        """ Stop the response: the read it is waiting on is aborted, so it stops at once """
+        self._cancelled.set()
+        if hasattr(self.client, "abort"):
+            self.client.abort()
+
+    def status(self):
+        """ Time to first token and time so far, or the whole summary once done """
+        if self.error:
+            return f"[red]error: {self.error}[/]"
+        stats = self.stats
+        if stats is None:
+            return "waiting"
+        if stats.end:
+            return stats.summary() + (" (truncated)" if self.truncated else "")
+        if stats.ttft is None:
+            return f"waiting {stats.duration:.1f}s"
+        return f"TTFT {stats.ttft:.2f}s · {stats.duration:.1f}s"
+
+
+class FanOutView:
+    """ The streams side by side, in equal columns titled with their client and stats """
+    def __init__(self, streams):
+        self.streams = streams
+
+    def __rich_console__(self, console, options):
+        from rich.table import Table
+        from az.render import response_panel
+        table = Table.grid(expand=True, padding=(0, 1))
+        for _ in self.streams:
+            table.add_column(ratio=1)
+        table.add_row(*[response_panel(s.response, title=str(s.client), subtitle=s.status(), border_style="none")
+                        for s in self.streams])
+        yield table
+
+
+def fan_out(streams, message, chat=None, config={}):
+    """ Send `message` to the client of every stream concurrently, return when all responses are complete.
+    chat(client, message) returns the response chunks (default: client.chat(message)).
+    On ctrl-c the responses are stopped, and KeyboardInterrupt is raised once they all are.
+    """
+    chat = chat or (lambda client, message: client.chat(message))
+    with ThreadPoolExecutor(max_workers=len(streams)) as executor:
+        futures = [executor.submit(stream.run, message, chat, config) for stream in streams]
+        try:
+            wait(futures)
+        except KeyboardInterrupt:
+            for stream in streams:
+                stream.cancel()
+            raise
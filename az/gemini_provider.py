@@ -1,51 +1,99 @@
 import os
 
 from az.llm_provider import LLMProvider
+from az import context, tokens
+from az.context import Message
 import google.generativeai as genai
 
 
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+def cancel(response_stream):
+    """ Cancel the request of a streamed response, releasing its connection.
+    The SDK has no public API for it (resolve() reads the rest of the response instead): this relies on
+    the response's _iterator (the stream of the API call, which can be cancelled), as of google-generativeai 0.8.1
+    (pinned in requirements.txt). Without it, the stream is left to be closed when it's garbage collected.
+    """
+    iterator = getattr(response_stream, "_iterator", None)
+    stop = getattr(iterator, "cancel", None) or getattr(iterator, "close", None)
+    if stop:
+        stop()
+
 
 class GeminiClient(LLMProvider):
+    # the conversation is sent as "contents": {"role": "user" or "model", "parts": [text]}
+    wire_format = "gemini"
+
     def __init__(self, config={}, primer=None):
         self.primer = primer
         self.provider = 'gemini'
         self.config = config
+        genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
         self.models = self.list_models()
         self.model = self.config.get(self.provider, {}).get("model", "gemini-1.5-flash")
-        
-        self._n_user_messages = 0
-        self.client = genai.GenerativeModel(
-            model_name=self.model,
-            system_instruction=self.primer
-        )        
-        self._chat = self.client.start_chat()
-          
+        self._generative_models = {}
+        self.new_chat()
+
 
     def list_models(self):
         # I don't see a way to list models in the API
         return ['gemini-1.5-flash', 'gemini-1.5-pro']
 
-    def n_user_messages(self):
-        return self._n_user_messages
-
-    def chat(self, message):
-        current_message = ""
-        response_stream = self._chat.send_message(message, stream=True)
-        for chunk in response_stream:
-            delta = chunk.text
-            current_message += delta
-            yield delta
-
-        self._n_user_messages += 1
-        return current_message
+    def _generative_model(self):
+        """ The SDK's model, for the current model and primer (its system instruction) """
+        key = (self.model, self.primer)
+        if key not in self._generative_models:
+            self._generative_models[key] = genai.GenerativeModel(model_name=self.model, system_instruction=self.primer)
+        return self._generative_models[key]
 
     def new_chat(self, primer=None):
+        # the primer is the model's system instruction, not a message
+        self.messages = []
         if primer:
             self.primer = primer
-        self._chat = self.client.start_chat()
-        self._n_user_messages = 0
+
+    def context_messages(self):
+        """ Gemini has no system messages: the summary of evicted turns goes in the first message """
+        if not self.messages.summary or not self.messages:
+            return self.messages
+        first = self.messages[0]
+        return [Message(first.role, context.SUMMARY_PREFIX + self.messages.summary + "\n\n" + first.content)] + self.messages[1:]
+
+    def wire_message(self, message):
+        return {"role": "model" if message.role == "assistant" else "user", "parts": [message.content]}
+
+    def sampling_params(self):
+        limit = tokens.max_tokens(self.config, self.provider)
+        return {"generation_config": {"max_output_tokens": limit}} if limit else {}
+
+    def history(self):
+        return ([{"role": "system", "content": self.primer}] if self.primer else []) + super().history()
+
+    def _stream(self, contents):
+        response_stream = self.open_response = self._generative_model().generate_content(contents, stream=True, **self.sampling_params())
+        try:
+            for chunk in response_stream:
+                yield chunk.text
+        finally:
+            cancel(response_stream)  # stops the request if the response is cut short
+        self._on_usage(response_stream.usage_metadata)
+
+    async def _astream(self, contents):
+        response_stream = await self._generative_model().generate_content_async(contents, stream=True, **self.sampling_params())
+        try:
+            async for chunk in response_stream:
+                yield chunk.text
+        finally:
+            cancel(response_stream)  # releases the connection if the generator is closed early (e.g. the client went away)
+        self._on_usage(response_stream.usage_metadata)
+
+    def abort(self):
+        self.aborted = True
+        if self.open_response is not None:
+            cancel(self.open_response)  # a gRPC call can be cancelled from any thread
+
+    def _on_usage(self, usage):
+        if usage:
+            self.last_usage = {"input_tokens": usage.prompt_token_count, "output_tokens": usage.candidates_token_count}
 
 
 if __name__ == "__main__": # pragma: no cover
@@ -0,0 +1,255 @@
+""" Hedged requests and failover across providers
+
+A provider having a bad moment (slow to answer, rate limiting, failing) shouldn't hold up the chat.
+With a failover policy, a prompt is sent to the client's provider first, and:
+
+- if it fails before its first token with a transient error (429, 5xx, a dropped connection), it is
+  retried after a jittered exponential backoff (or the delay the provider asks for in Retry-After),
+  and once out of retries, or on any other error, the next provider of the policy is asked instead
+- if it hasn't produced its first token after `hedge-after` seconds, the next provider is asked too,
+  and the first one to answer is streamed, the others are cancelled
+- if a response stalls (no data for `stall-timeout` seconds), it is cut short with a TimeoutError
+
+Every attempt runs on its own copy of the conversation (the client's own branch, or a backup client
+with the same turns replayed into it), and only the response which was streamed is recorded in the
+client's conversation, so the history stays the same whichever provider answered. The client's conversation
+is then kept within its token budget (see az.context), the attempts' copies are not.
+
+Config (all optional, no failover without backup providers):
+
+    "failover": {
+        "providers": ["anthropic", "ollama:llama3.1"],  # backups, in order (provider or provider:model)
+        "hedge-after": 5,      # seconds without a first token before asking the next provider too (null: never)
+        "retries": 1,          # retries of a provider on transient errors, before failing over
+        "backoff": 0.5,        # seconds, doubled on every retry (jittered)
+        "stall-timeout": 120   # seconds without data before a response is given up (null: never)
+    }
+"""
+import email.utils
+import queue
+import random
+import threading
+import time
+
+from az.llm_provider import INTERRUPTIONS, TRUNCATED_MARK
+
+
+DEFAULT_HEDGE_AFTER = 5.0
+DEFAULT_RETRIES = 1
+DEFAULT_BACKOFF = 0.5
+DEFAULT_STALL_TIMEOUT = 120.0
+MAX_RETRY_AFTER = 30.0
+
+
+def status_code(error):
+    """ The HTTP status of a failed request (as the SDKs and requests report it), or None """
+    for status in (getattr(error, "status_code", None), getattr(getattr(error, "response", None), "status_code", None),
+                   getattr(error, "code", None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_transient(error):
+    """ Whether the request may well succeed if made again: rate limited, a server error, a connection or timeout error """
+    status = status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(name in type(error).__name__ for name in ("Connect", "Timeout"))
+
+
+def retry_delay(error, retry, backoff):
+    """ Seconds to wait before the `retry`th retry: what the provider asked for, or a jittered exponential backoff """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_AFTER)
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(retry_after)
+                return min(max(when.timestamp() - time.time(), 0), MAX_RETRY_AFTER)
+            except (TypeError, ValueError):
+                pass  # neither seconds nor a date: back off as usual
+    return random.uniform(0, backoff * 2 ** (retry - 1))  # "full jitter", so clients rate limited together don't retry together
+
+
+class Policy:
+    """ The backup providers and timings of hedged requests. `factory(provider)` creates a provider's client. """
+    def __init__(self, providers, factory, hedge_after=DEFAULT_HEDGE_AFTER, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, stall_timeout=DEFAULT_STALL_TIMEOUT):
+        self.providers = providers
+        self.factory = factory
+        self.hedge_after = hedge_after
+        self.retries = retries
+        self.backoff = backoff
+        self.stall_timeout = stall_timeout
+        self._backups = {}  # provider -> its client (created when first needed), forked for every attempt
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, factory, providers=None):
+        """ The policy configured in "failover" (with `providers` instead of its backups, if given), None if there are no backups """
+        settings = config.get("failover", {})
+        providers = providers or settings.get("providers")
+        if isinstance(providers, str):
+            providers = [p.strip() for p in providers.split(",") if p.strip()]
+        if not providers:
+            return None
+        return cls(providers, factory, settings.get("hedge-after", DEFAULT_HEDGE_AFTER), settings.get("retries", DEFAULT_RETRIES),
+                   settings.get("backoff", DEFAULT_BACKOFF), settings.get("stall-timeout", DEFAULT_STALL_TIMEOUT))
+
+    def candidates(self, client):
+        """ Functions creating the clients to ask, in order: a branch of `client`, then the backups with its conversation """
+        yield client.branch
+        for spec in self.providers:
+            provider, _, model = spec.partition(":")
+            if client.provider.startswith(provider) and not model:
+                continue  # that's the client itself
+            yield lambda provider=provider, model=model: self._backup(client, provider, model)
+
+    def _backup(self, client, provider, model):
+        with self._lock:
+            if provider not in self._backups:
+                self._backups[provider] = self.factory(provider)
+            backup = self._backups[provider].fork()
+        if model:
+            backup.model = model
+        for message, response in client.turns():
+            backup.record_turn(message, response)
+        backup.messages.summary = client.messages.summary  # of the turns which were evicted
+        return backup
+
+
+class Attempt:
+    """ A request to one provider, streamed on its own thread: its events, (attempt, kind, value) with kind
+    "chunk", "done" or "error", are put on the shared `events` queue
+    """
+    def __init__(self, make_client, message, events, policy):
+        self.make_client = make_client
+        self.message = message
+        self.events = events
+        self.policy = policy
+        self.client = None
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="azc-hedge", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        """ Stop the attempt: the response its thread is waiting on is aborted (and then closed by the thread) """
+        self._cancelled.set()
+        client = self.client
+        if client is not None and hasattr(client, "abort"):
+            client.abort()
+
+    def _run(self):
+        retry = 0
+        while True:
+            started = False
+            chunks = None
+            try:
+                self.client = self.make_client()  # a fresh one on every retry, as a failed request leaves its message behind
+                # a copy of the conversation: it is fitted in the client's own, once the response which wins is recorded there
+                self.client.fits_context = False
+                self.client.last_usage = None
+                chunks = self.client.chat(self.message)
+                for chunk in chunks:
+                    if self._cancelled.is_set():
+                        return
+                    started = True
+                    self.events.put((self, "chunk", chunk))
+                self.events.put((self, "done", None))
+                return
+            except Exception as e:
+                if started or retry >= self.policy.retries or not is_transient(e) or self._cancelled.is_set():
+                    self.events.put((self, "error", e))
+                    return
+                retry += 1
+                if self._cancelled.wait(retry_delay(e, retry, self.policy.backoff)):
+                    return
+            finally:
+                if chunks is not None:
+                    chunks.close()
+
+
+def hedged_chat(client, message, policy):
+    """ client.chat(message), hedged and failed over as set by `policy`. The response is recorded in client's
+    conversation, whichever provider gave it, and the answering client's usage is client.last_usage
+    (with "answered_by" when it's a backup).
+    """
+    candidates = policy.candidates(client)
+    events = queue.Queue()
+    running = []
+
+    def ask_next():
+        make_client = next(candidates, None)
+        if make_client is None:
+            return False
+        attempt = Attempt(make_client, message, events, policy)
+        running.append(attempt)
+        attempt.start()
+        return True
+
+    def hedge_deadline():
+        return None if policy.hedge_after is None else time.monotonic() + policy.hedge_after
+
+    def wait(deadline):
+        """ The next event, or None once `deadline` (or, without one, the stall timeout) has passed """
+        timeout = policy.stall_timeout if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            return events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    ask_next()
+    hedge_at = hedge_deadline()
+    parts = []
+    winner = None
+    try:
+        # the first attempt to answer wins
+        while winner is None:
+            event = wait(hedge_at)
+            if event is None:
+                if hedge_at is None:
+                    raise TimeoutError(f"no response in {policy.stall_timeout}s")
+                hedge_at = hedge_deadline() if ask_next() else None  # slow to answer: ask the next provider too
+                continue
+            attempt, kind, value = event
+            if kind == "error":
+                running.remove(attempt)
+                if not ask_next() and not running:
+                    raise value
+                continue
+            winner = attempt
+        for attempt in running:
+            if attempt is not winner:
+                attempt.cancel()
+
+        while kind != "done":
+            if kind == "error":
+                raise value
+            parts.append(value)
+            yield value
+            while True:
+                event = wait(None)
+                if event is None:
+                    raise TimeoutError(f"{winner.client} stalled: no data in {policy.stall_timeout}s")
+                if event[0] is winner:
+                    _, kind, value = event
+                    break
+    except (*INTERRUPTIONS, Exception) as e:
+        for attempt in running:
+            attempt.cancel()
+        if parts or isinstance(e, INTERRUPTIONS):
+            client.record_turn(message, "".join(parts) + TRUNCATED_MARK)
+            client.fit_context()
+        raise
+
+    client.record_turn(message, "".join(parts))
+    client.fit_context()
+    usage = dict(winner.client.last_usage or {})
+    if str(winner.client) != str(client):
+        usage["answered_by"] = str(winner.client)
+    client.last_usage = usage
@@ -1,10 +1,22 @@
 """ Base class for LLM providers """
+import copy
 import os
+from az import context, transport
 from dotenv import load_dotenv
 load_dotenv(os.path.expanduser("~/.config/.env" if os .path.exists(os.path.expanduser("~/.config")) else "~/.env"))
 
+# A response stream cut short by its consumer (it is closed, e.g. on ctrl-c) or by ctrl-c while waiting for it:
+# chat() then releases the connection and keeps the partial response in the history, marked with TRUNCATED_MARK
+INTERRUPTIONS = (GeneratorExit, KeyboardInterrupt)
+TRUNCATED_MARK = "\n\n[truncated]"
+
 
 class LLMProvider:
+    config = {}
+    catalog = None  # a models.ModelCatalog, for providers which fetch their models list
+    _open_response = None
+    aborted = False  # whether the response being streamed was stopped by abort()
+    fits_context = True  # whether chat() keeps the conversation within its token budget (see fit_context)
 
     def __init__(self, primer=None, model=None):
         self.name = None
@@ -18,21 +30,169 @@ class LLMProvider:
         return []
     
     def refresh_models(self):
-        """ Refresh the list of models available for this provider """
-        print("Not implemented for this provider")
+        """ Refresh the list of models available for this provider (and wait for it) """
+        if self.catalog is None:
+            print("Not implemented for this provider")
+            return
+        print("refreshing models")
+        self.catalog.refresh(wait=True)
+        if self.catalog.error:
+            print(f"Error fetching models: {self.catalog.error}. Either use a different model or restart and try again.")
+        else:
+            print(f"Got {len(self.models)} models. Type 'l' to list them.")
 
     def chat(self, message):
         """ Chat with the LLM provider 
         return a generator that yields the response text 
+        The response is added to the history, and if it is cut short, what was received of it (see INTERRUPTIONS)
+        """
+        self.aborted = False
+        reply = context.Message("assistant")
+        chunks = self._stream(self._request(message))
+        try:
+            for text in chunks:
+                reply.append(text)
+                yield text
+        except (*INTERRUPTIONS, Exception) as e:
+            if isinstance(e, INTERRUPTIONS) or self.aborted:  # an aborted response fails to be read: it was cut short too
+                reply.append(TRUNCATED_MARK)
+                self.messages.append(reply)
+            raise
+        finally:
+            self.open_response = None
+            chunks.close()  # releases the connection, also when the response is cut short
+        self.messages.append(reply)
+        return reply.content
+
+    def _request(self, message):
+        """ Add `message` to the history (fitted to the token budget), and return the request which sends it
+        (by default, the messages in the wire format)
+        """
+        self.messages.append({"role": "user", "content": message})
+        self.fit_context()
+        return self.wire_messages()
+
+    def _stream(self, request):
+        """ The text chunks of the provider's response to `request` (see _request), as they are received.
+        The HTTP response they are read from is kept in open_response, for abort().
         """
-        pass
+        raise NotImplementedError
+
+    # the async version of _stream, for providers with an async client (without it, achat() runs chat() on a worker thread)
+    _astream = None
+
+    @property
+    def open_response(self):
+        """ The HTTP response chat() is streaming, for abort() """
+        return self._open_response
+
+    @open_response.setter
+    def open_response(self, response):
+        self._open_response = response
+        if response is not None and self.aborted:
+            self.abort()  # aborted while the request was being sent
+
+    def abort(self):
+        """ Stop the response chat() is streaming, from another thread (e.g. a hedged request which is no longer needed):
+        the read it is waiting on fails at once, instead of when the next chunk comes in
+        """
+        self.aborted = True
+        transport.abort(self.open_response)
+
+    async def achat(self, message):
+        """ Async version of chat: an async generator that yields the response text, and adds it to the history the same way
+        (also when it is cut short, e.g. closed by the caller, or cancelled).
+        """
+        import asyncio  # only needed (and imported) by async callers, e.g. azc serve
+        if self._astream is None:
+            chunks = self.chat(message)
+            done = object()
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(next, chunks, done)
+                    if chunk is done:
+                        return
+                    yield chunk
+            finally:
+                chunks.close()
+        reply = context.Message("assistant")
+        chunks = self._astream(self._request(message))
+        try:
+            async for text in chunks:
+                reply.append(text)
+                yield text
+        except (*INTERRUPTIONS, asyncio.CancelledError):
+            reply.append(TRUNCATED_MARK)
+            self.messages.append(reply)
+            raise
+        finally:
+            await chunks.aclose()
+        self.messages.append(reply)
     
+    @property
+    def messages(self):
+        """ The conversation history (a context.Conversation) """
+        return self._messages
+
+    @messages.setter
+    def messages(self, value):
+        self._messages = value if isinstance(value, context.Conversation) else context.Conversation(value)
+
+    def context_messages(self):
+        """ The messages to send to the model: the history, with the summary of evicted turns after the primer """
+        summary = self.messages.summary
+        if not summary:
+            return self.messages
+        head = self.messages.n_pinned()
+        return self.messages[:head] + [context.Message("system", context.SUMMARY_PREFIX + summary)] + self.messages[head:]
+
+    # the format of the messages in the provider's API requests (by default OpenAI's)
+    wire_format = "openai"
+
+    def wire_message(self, message):
+        """ A context.Message in the provider's wire format """
+        return {"role": message.role, "content": message.content}
+
+    def wire_messages(self):
+        """ The context messages in the provider's wire format. Every message is converted once (the first time it is sent),
+        and then reused, so a request only converts what is new since the previous one.
+        """
+        return [message.wire(self.wire_format, self.wire_message) for message in self.context_messages()]
+
+    def fit_context(self):
+        """ Evict the oldest turns if the conversation is over the model's token budget,
+        and summarize them in the background if configured
+        """
+        if not self.fits_context:
+            return []
+        settings = self.config.get("context", {})
+        evicted = self.messages.fit(context.budget(self.config, self.model), settings.get("keep-turns", context.DEFAULT_KEEP_TURNS),
+                                    settings.get("headroom", context.DEFAULT_HEADROOM))
+        if evicted and settings.get("summarize"):
+            context.summarize_later(self.summarizer(), self.messages, evicted)
+        return evicted
+
+    def summarizer(self):
+        """ A client for summarizing evicted turns: a fork of this one, with the configured summary model """
+        clone = self.fork()
+        model = self.config.get(self.provider, {}).get("summary-model")
+        if model:
+            clone.model = model
+        return clone
+
     @property
     def model(self):
         return self._model
 
     @model.setter
     def model(self, value):
+        if not self.models and self.catalog is not None:
+            # the models aren't known yet (they are being fetched), trust the name
+            self._model = value
+            return
+        if value in self.models:
+            self._model = value  # e.g. gpt-4o, not gpt-4o-mini
+            return
         for m in self.models:
             if value in m:
                 self._model = m
@@ -51,9 +211,48 @@ class LLMProvider:
             # Default is to use OpenAI system prompt
             self.messages.append({"role": "system", "content": self.primer})
 
+    def history(self):
+        """ The conversation so far (as sent to the model), as a list of {"role", "content"} messages """
+        return [message.as_dict() for message in self.context_messages()]
+
+    def tokenizer(self):
+        """ (name, count(text)): the provider's tokenizer, where one is available offline, otherwise an estimate (see az.tokens) """
+        return "estimate", context.estimate_tokens
+
+    def sampling_params(self):
+        """ Parameters (other than model and messages) which affect the response """
+        return {}
+
+    def record_turn(self, message, response):
+        """ Add a user message and the assistant's response to the history, without calling the model
+        (e.g. when the response was found in a cache)
+        """
+        self.messages.append({"role": "user", "content": message})
+        self.messages.append({"role": "assistant", "content": response})
+
+    def fork(self):
+        """ A copy of this client with a new chat.
+        The copy shares the SDK client (and its connection pool) and the models list,
+        so it is cheap to create, e.g. one per prompt when running prompts concurrently.
+        """
+        clone = copy.copy(self)
+        clone.new_chat()
+        return clone
+
+    def branch(self):
+        """ A copy of this client with a copy of its conversation, which can go on without changing this one's """
+        clone = copy.copy(self)
+        clone.messages = self.messages.copy()
+        return clone
+
+    def turns(self):
+        """ The (user message, response) pairs of the conversation (as sent to the model), without the primer """
+        from az.sessions import turns
+        return list(turns(self.history()))
+
     def n_user_messages(self):
         """ Number of user messages in the history """
-        return len([m for m in self.messages if m['role'] == 'user'])
+        return self.messages.n_user
 
     def __str__(self):
         return f"{self.provider}:{self.model}"
@@ -0,0 +1,84 @@
+""" Model catalogs: the models of each provider, served from a cache and refreshed in the background
+
+Fetching the models list is a network call (sometimes a slow one), so clients don't wait for it:
+the catalog returns the cached list right away, and if it is stale (stale-while-revalidate),
+fetches a new one on a background thread. The list is updated in place, so everyone holding it
+(clients, their forks, completers) sees the new models once the refresh finishes.
+
+Config (optional): "models": {"ttl": 86400} - seconds before a cached list is refreshed
+"""
+import os
+import threading
+
+from az.cache import FileCache
+
+
+MODELS_CACHE_FILE = os.path.expanduser("~/.config/.azc_models.json" if os.path.exists(os.path.expanduser("~/.config")) else "~/.azc_models.json")
+DEFAULT_TTL = 24 * 60 * 60
+
+_catalogs = {}
+_lock = threading.RLock()   # catalogs, and the models cache (which is shared by them)
+_caches = {}
+
+
+class ModelCatalog:
+    def __init__(self, provider, fetch, cache, ttl=DEFAULT_TTL):
+        """ fetch() returns the provider's model names (from the network) """
+        self.provider = provider
+        self.fetch = fetch
+        self.cache = cache
+        self.ttl = ttl
+        with _lock:
+            self.models = cache.ordered(provider)  # in the provider's order: e.g. Ollama's first model is its default
+        self.error = None
+        self._refreshing = None
+
+    def get(self, wait_if_empty=False):
+        """ The models (a list which refreshes update in place). If they are stale, refresh them in the
+        background, or wait for the refresh with wait_if_empty=True when no models are known yet.
+        """
+        with _lock:
+            stale = self.cache.is_stale(self.provider, ttl=self.ttl)
+        if stale:
+            self.refresh(wait=wait_if_empty and not self.models)
+        return self.models
+
+    @property
+    def refreshing(self):
+        return self._refreshing is not None
+
+    def refresh(self, wait=False):
+        """ Fetch the models on a background thread (unless a refresh is already running); wait for it if asked """
+        with _lock:
+            thread = self._refreshing
+            if thread is None:
+                thread = self._refreshing = threading.Thread(target=self._refresh, name=f"azc-models-{self.provider}", daemon=True)
+                thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _refresh(self):
+        try:
+            models = list(self.fetch())
+            with _lock:
+                self.cache.set(self.provider, models, ttl=self.ttl)
+            self.models[:] = models
+            self.error = None
+        except Exception as e:
+            # keep serving the models we have, the error is reported by explicit refreshes
+            self.error = e
+        finally:
+            with _lock:
+                self._refreshing = None
+
+
+def catalog(provider, fetch, config={}, source=None):
+    """ The catalog of `provider` (at `source`, e.g. its URL): one per process, shared by all its clients """
+    with _lock:
+        key = (provider, source, MODELS_CACHE_FILE)
+        if key not in _catalogs:
+            if MODELS_CACHE_FILE not in _caches:
+                _caches[MODELS_CACHE_FILE] = FileCache(MODELS_CACHE_FILE)
+            _catalogs[key] = ModelCatalog(provider, fetch, _caches[MODELS_CACHE_FILE], ttl=config.get("models", {}).get("ttl", DEFAULT_TTL))
+        return _catalogs[key]
@@ -1,17 +1,22 @@
 import json
 import os
 
-import requests
-
 from az.llm_provider import LLMProvider
+from az import models, tokens, transport
+
 
+DEFAULT_KEEP_ALIVE = "30m"  # Ollama's default is 5 minutes
 
 class OllamaClient(LLMProvider):
-    def __init__(self, primer=None):
+    def __init__(self, config={}, primer=None):
         self.provider = "ollama"
+        self.config = config
         self.base_url = os.environ.get("OLLAMA_URL")
-        self.models = self.list_models()  # List available models on initialization
-        self.model = (
+        self.session = transport.requests_session(config)
+        self.timeout = transport.request_timeout(config)
+        self.catalog = models.catalog(self.provider, self._fetch_models, config, source=self.base_url)
+        self.models = self.list_models()  # From the cache, refreshed in the background
+        self.model = self.config.get(self.provider, {}).get("model") or (
             self.models[0] if self.models else None
         )  # Set the first model as default
         self.messages = []
@@ -20,9 +25,16 @@ class OllamaClient(LLMProvider):
             self.messages.append({"role": "system", "content": self.primer})
 
     def list_models(self):
+        """List the models available, from the cache (only waits for Ollama's /api/tags when nothing is cached yet)"""
+        models = self.catalog.get(wait_if_empty=True)
+        if not models and self.catalog.error:
+            raise self.catalog.error
+        return models
+
+    def _fetch_models(self):
         """List all models available from Ollama's /api/tags endpoint"""
         url = f"{self.base_url}/api/tags"
-        response = requests.get(url)
+        response = self.session.get(url, timeout=self.timeout)
 
         if response.status_code == 200:
             models_data = response.json()["models"]  # Extract the list of models
@@ -34,42 +46,71 @@ class OllamaClient(LLMProvider):
                 f"Failed to list models: {response.status_code} {response.text}"
             )
 
-    def chat(self, message):
-        """Chat with the model using Ollama's API"""
-        self.messages.append({"role": "user", "content": message})
-        current_message = ""
-
-        # Update the URL to the correct chat endpoint
+    def _request(self, message):
         url = f"{self.base_url}/api/chat"
         payload = {
             "model": self.model,  # The model to use for chat
-            "messages": self.messages,  # The chat history including the primer
+            "messages": super()._request(message),  # The chat history including the primer
+            # keep the model loaded between turns, so the context of the conversation so far
+            # (its KV cache) is reused rather than evaluated again
+            "keep_alive": self.config.get("ollama", {}).get("keep-alive", DEFAULT_KEEP_ALIVE),
+            **self.sampling_params(),
         }
-
+        return url, payload
+
+    def sampling_params(self):
+        options = {}
+        limit = tokens.max_tokens(self.config, self.provider)
+        if limit:
+            options["num_predict"] = limit
+        if self.config.get("ollama", {}).get("num-ctx"):
+            options["num_ctx"] = self.config["ollama"]["num-ctx"]
+        return {"options": options} if options else {}
+
+    def _parse_line(self, line):
+        """ Parse a line of the streamed (NDJSON) response, return its content, or None for the final ('done') line """
+        response_json = json.loads(line)
+        if response_json.get("done", False):
+            # the final line has the stats of the whole response
+            self.last_usage = {
+                "input_tokens": response_json.get("prompt_eval_count"),
+                "output_tokens": response_json.get("eval_count"),
+            }
+            if response_json.get("eval_duration"):
+                self.last_usage["generation_seconds"] = response_json["eval_duration"] / 1e9
+            return None
+        return response_json.get("message", {}).get("content", "")
+
+    def _stream(self, request):
+        """Stream the response from Ollama's API"""
+        url, payload = request
         # Sending the chat request and streaming the response
-        response_stream = requests.post(url, json=payload, stream=True)
-
-        # Loop through the response lines (streamed chunks)
-        for chunk in response_stream.iter_lines():
-            if chunk:
-                # Each chunk is a valid JSON object
-                response_json = json.loads(chunk.decode("utf-8"))
-
-                # Check if it's the final chunk with 'done' flag
-                if response_json.get("done", False):
-                    print("Final response:", response_json)  # For debugging purposes
-                    break
-
-                # Get the content of the message if available
-                content = response_json.get("message", {}).get("content", "")
-                current_message += content  # Append the content to the full message
-
-                yield content  # Yield the content incrementally if needed
-
-        # Add the final assistant message to the conversation history
-        self.messages.append({"role": "assistant", "content": current_message})
-
-        return current_message  # Return the final assembled message
+        response_stream = self.session.post(url, json=payload, stream=True, timeout=self.timeout)
+        self.open_response = response_stream
+        try:
+            response_stream.raise_for_status()  # e.g. 503 while the model is loading: an error to retry, not an empty response
+
+            # Loop through the response lines (streamed chunks)
+            for chunk in response_stream.iter_lines():
+                if chunk:
+                    content = self._parse_line(chunk.decode("utf-8"))
+                    if content is None:
+                        break
+                    yield content  # Yield the content incrementally
+        finally:
+            response_stream.close()  # gives the connection back to the session's pool
+
+    async def _astream(self, request):
+        """Stream the response from Ollama's API, without blocking the event loop"""
+        url, payload = request
+        async with transport.async_http_client(self.config).stream("POST", url, json=payload) as response_stream:
+            response_stream.raise_for_status()
+            async for line in response_stream.aiter_lines():
+                if line:
+                    content = self._parse_line(line)
+                    if content is None:
+                        break
+                    yield content
 
 
 if __name__ == "__main__": # pragma: no cover
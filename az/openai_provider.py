@@ -1,22 +1,17 @@
-import os
-
-
 from az.llm_provider import LLMProvider
-from openai import OpenAI, NotFoundError
-from az.cache import FileCache
-
-
+from openai import OpenAI, AsyncOpenAI
+from az import models, tokens, transport
 
-MODELS_CACHE_FILE = os.path.expanduser("~/.config/.azc_models.json" if os.path.exists(os.path.expanduser("~/.config")) else "~/.azc_models.json")
 
 class OpenAIClient(LLMProvider):
     def __init__(self, config={}, primer=None):
         self.provider = 'openai'
-        self.client = OpenAI()
-        self.models_cache = FileCache(MODELS_CACHE_FILE)
+        self.config = config
+        self.client = OpenAI(http_client=transport.http_client(config))
+        self.async_client = AsyncOpenAI(http_client=transport.async_http_client(config))
+        self.catalog = models.catalog(self.provider, self._fetch_models, config, source=str(self.client.base_url))
         
         self.list_models()
-        self.config = config
         self.model = self.config.get("openai", {}).get("model", "gpt-4o-mini")
         self.messages = []
         
@@ -26,41 +21,66 @@ class OpenAIClient(LLMProvider):
           
 
     def list_models(self):
-        self.models = self.models_cache.get(self.provider)
-        if len(self.models) == 0:
-            self.refresh_models()
+        """ The models, from the cache (refreshed in the background when stale) """
+        self.models = self.catalog.get()
         return self.models
 
+    def _fetch_models(self):
+        # sometimes this gets a 404, refresh_models() reports it
+        return [m.id for m in self.client.models.list().data]
 
-    def refresh_models(self):
-        print("refreshing models")
-        try:
-            models = [m.id for m in self.client.models.list().data]
-            self.models = models
-            self.models_cache.set(self.provider, models)
-            print(f"Got {len(self.models)} models. Type 'l' to list them.")
-        except NotFoundError as e:
-            # sometimes I get a 404 on this
-            print(f"Error fetching models: {e}. Either use a different model or restart and try again.")
 
+    def _request(self, message):
+        return dict(model=self.model, messages=super()._request(message), stream=True, stream_options={"include_usage": True}, **self.sampling_params())
 
-    def chat(self, message):
-        self.messages.append({"role": "user", "content": message})
-        current_message = ""
-        response_stream = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=self.messages,
-                    stream=True
-                )
-        for chunk in response_stream:
-            delta = chunk.choices[0].delta
-            content = getattr(delta, 'content', '')
-            if content:
-                current_message += content
-                yield content
+    def sampling_params(self):
+        limit = tokens.max_tokens(self.config, self.provider)
+        return {"max_tokens": limit} if limit else {}
 
-        self.messages.append({"role": "assistant", "content": current_message})
-        return current_message
+    def tokenizer(self):
+        encoding = tokens.tiktoken_encoding(self.model)
+        if encoding is None:
+            return super().tokenizer()
+        return encoding.name, lambda text: len(encoding.encode(text, disallowed_special=()))
+
+    def _on_usage(self, usage):
+        self.last_usage = {"input_tokens": usage.prompt_tokens, "output_tokens": usage.completion_tokens}
+        # prompts of 1024 tokens or more are cached automatically, by prefix: the primer comes first,
+        # then the turns in order, and evicting turns in blocks (see context.Conversation.fit) keeps the prefix stable
+        details = getattr(usage, "prompt_tokens_details", None)  # not in this SDK version's model, so it may be a dict
+        cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+        if cached is not None:
+            self.last_usage["cached_tokens"] = cached
+
+    def _text(self, chunk):
+        """ The text of a streamed chunk (None if it has none) """
+        if chunk.usage:
+            # the last chunk (with no choices) has the usage of the whole response
+            self._on_usage(chunk.usage)
+        if chunk.choices:
+            return getattr(chunk.choices[0].delta, 'content', '')
+        return None
+
+    def _stream(self, request):
+        response_stream = self.client.chat.completions.create(**request)
+        self.open_response = response_stream.response
+        try:
+            for chunk in response_stream:
+                text = self._text(chunk)
+                if text:
+                    yield text
+        finally:
+            response_stream.close()
+
+    async def _astream(self, request):
+        response_stream = await self.async_client.chat.completions.create(**request)
+        try:
+            async for chunk in response_stream:
+                text = self._text(chunk)
+                if text:
+                    yield text
+        finally:
+            await response_stream.close()
 
 
 if __name__ == "__main__": # pragma: no cover
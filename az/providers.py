@@ -0,0 +1,93 @@
+""" Provider registry
+
+Maps provider names to the module and class implementing them.
+Provider SDKs (openai, anthropic, google.generativeai) are slow to import, so a
+provider module is only imported the first time that provider is requested.
+"""
+import importlib
+import os
+import time
+
+import az.llm_provider  # noqa: F401 - loads the .env file, which decides which providers are configured
+
+
+# provider name -> (module, class, environment variable that enables it)
+PROVIDERS = {
+    'openai': ('az.openai_provider', 'OpenAIClient', 'OPENAI_API_KEY'),
+    'ollama': ('az.ollama_provider', 'OllamaClient', 'OLLAMA_URL'),
+    'anthropic': ('az.anthropic_provider', 'AnthropicClient', 'ANTHROPIC_API_KEY'),
+    'gemini': ('az.gemini_provider', 'GeminiClient', 'GEMINI_API_KEY'),
+}
+
+_provider_classes = {}
+
+
+def configured_providers(environ=None):
+    """ Names of the providers which have their environment variable set """
+    environ = os.environ if environ is None else environ
+    return [name for name, (_, _, env_var) in PROVIDERS.items() if env_var in environ]
+
+
+def resolve_provider(provider_hint, providers):
+    """ Find the full provider name from a (possibly partial) name, e.g. 'op' -> 'openai' """
+    for provider_name in providers:
+        if provider_hint in provider_name:
+            return provider_name
+    raise ValueError(f"Cannot find provider with <{provider_hint}>")
+
+
+def provider_class(provider_name):
+    """ The client class for a provider, importing its module on first use """
+    if provider_name not in _provider_classes:
+        module_name, class_name, _ = PROVIDERS[provider_name]
+        module = importlib.import_module(module_name)
+        _provider_classes[provider_name] = getattr(module, class_name)
+    return _provider_classes[provider_name]
+
+
+DEFAULT_IDLE_TIMEOUT = 30 * 60  # seconds
+
+
+class ClientPool:
+    """ Live clients by provider name, so that switching back to a provider reuses its client,
+    with its connections, models list and conversation.
+
+    Clients which haven't been used for idle_timeout seconds (None: never) are dropped, except the current one,
+    and on_evict(client) is called with each, to drop whatever else refers to it.
+    """
+    def __init__(self, create, idle_timeout=DEFAULT_IDLE_TIMEOUT, on_evict=None):
+        self.create = create
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self.current = None
+        self._clients = {}    # provider name -> client
+        self._last_used = {}  # provider name -> time it was last the current client
+
+    def get(self, provider_name):
+        """ The client of a provider (which becomes the current one), and whether it was just created """
+        now = time.monotonic()
+        if self.current is not None:
+            self._last_used[self.current] = now
+        self.evict_idle(now)
+        created = provider_name not in self._clients
+        if created:
+            self._clients[provider_name] = self.create(provider_name)
+        self.current = provider_name
+        self._last_used[provider_name] = now
+        return self._clients[provider_name], created
+
+    def evict_idle(self, now=None):
+        if self.idle_timeout is None:
+            return
+        now = time.monotonic() if now is None else now
+        for name in [n for n, used in self._last_used.items() if n != self.current and now - used > self.idle_timeout]:
+            client = self._clients.pop(name)
+            del self._last_used[name]
+            if self.on_evict:
+                self.on_evict(client)
+
+    def __contains__(self, provider_name):
+        return provider_name in self._clients
+
+    def __len__(self):
+        return len(self._clients)
@@ -0,0 +1,61 @@
+""" Raw output: responses written to stdout as plain text, as they stream in
+
+Used with --raw, and by default with -b when stdout isn't a terminal (e.g. `azc -b "..." | jq`):
+no markdown rendering, no panel, and rich isn't even imported.
+"""
+import threading
+
+
+class RawWriter:
+    """ Writes chunks to a text stream in batches: as soon as `max_size` characters are buffered,
+    or `max_delay` seconds after the first buffered chunk, whichever comes first.
+    """
+    def __init__(self, out, max_size=4096, max_delay=0.05):
+        self.out = out
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._buffer = []
+        self._size = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def write(self, chunk):
+        with self._lock:
+            self._buffer.append(chunk)
+            self._size += len(chunk)
+            if self._size >= self.max_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            self.out.write("".join(self._buffer))
+            self._buffer = []
+            self._size = 0
+            self.out.flush()
+
+    def close(self):
+        self.flush()
+
+
+class Text:
+    """ A response collected as plain text (instead of render.StreamingMarkdown) """
+    def __init__(self):
+        self._chunks = []
+
+    def append(self, chunk):
+        self._chunks.append(chunk)
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
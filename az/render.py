@@ -0,0 +1,140 @@
+""" Rendering of assistant responses with rich """
+import re
+import threading
+
+from rich.align import Align
+from rich.box import Box
+from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.segment import Segment
+
+
+# An empty box border makes it easier to copy and paste.
+EMPTY: Box = Box(
+    "    \n"
+    "    \n"
+    "    \n"
+    "    \n"
+    "    \n"
+    "    \n"
+    "    \n"
+    "    \n",
+    ascii=True,
+)
+
+
+def response_panel(renderable, title=None, **kwargs):
+    """ The panel an assistant response is displayed in """
+    return Panel(
+        Align.left(renderable),
+        title=title,
+        style="yellow",
+        expand=True,
+        box=EMPTY,
+        **kwargs
+    )
+
+
+FENCE_RE = re.compile(r'^\s*(`{3,}|~{3,})')
+LIST_ITEM_RE = re.compile(r'^(?:([-*+])|\d+[.)])(?:\s|$)')
+
+
+class _Block:
+    """ A chunk of markdown source which is rendered on its own """
+    __slots__ = ('text', 'list_kind', '_cache')
+
+    def __init__(self, text):
+        self.text = text
+        match = LIST_ITEM_RE.match(text)
+        self.list_kind = None if match is None else ('bullet' if match.group(1) else 'ordered')
+        self._cache = None
+
+    def render_lines(self, console, options, **markdown_kwargs):
+        if self._cache is None or self._cache[0] != options.max_width:
+            lines = console.render_lines(Markdown(self.text, **markdown_kwargs), options, pad=False, new_lines=False)
+            # rich starts some elements (e.g. lists) with an empty line, separators are added by the caller
+            while lines and not any(segment.text for segment in lines[0]):
+                lines.pop(0)
+            self._cache = (options.max_width, lines)
+        return self._cache[1]
+
+
+class StreamingMarkdown:
+    """ Markdown for text which arrives in chunks (a streamed response)
+
+    Re-parsing the whole response for every chunk is quadratic in the response length.
+    Instead, the text is split into blocks (paragraphs, fenced code blocks, list items, ...):
+    once a block is complete it is parsed and rendered once (per width) and the rendered lines are
+    reused, and only the open block at the end is parsed again when the display is refreshed.
+    """
+    def __init__(self, text="", **markdown_kwargs):
+        self.markdown_kwargs = markdown_kwargs
+        self._lock = threading.Lock()  # Live renders from its own refresh thread
+        self._chunks = []
+        self._blocks = []
+        self._tail = ""          # source of the open block
+        self._tail_block = None
+        self._scan_pos = 0       # position in the tail of the first line we did not look at yet
+        self._fence = None       # the fence marker while inside a fenced code block
+        self._blank = False      # a blank line was seen since the last non blank line
+        if text:
+            self.append(text)
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def append(self, chunk):
+        with self._lock:
+            self._chunks.append(chunk)
+            self._tail += chunk
+            self._tail_block = None
+            while True:
+                end = self._tail.find('\n', self._scan_pos)
+                if end == -1:
+                    break
+                start, self._scan_pos = self._scan_pos, end + 1
+                self._scan_line(self._tail[start:end], start, end + 1)
+
+    def _scan_line(self, line, start, end):
+        stripped = line.strip()
+        if self._fence:
+            if stripped.startswith(self._fence) and not stripped.strip(self._fence[0]):
+                self._fence = None
+                self._close_block(end)
+            return
+        if not stripped:
+            self._blank = True
+            return
+        fence = FENCE_RE.match(line)
+        at_margin = line[0] not in ' \t'
+        if at_margin and (self._blank or fence or (LIST_ITEM_RE.match(line) and LIST_ITEM_RE.match(self._tail.lstrip('\n')))):
+            self._close_block(start)
+        self._blank = False
+        if fence:
+            self._fence = fence.group(1)
+
+    def _close_block(self, pos):
+        text = self._tail[:pos].strip('\n')
+        self._tail = self._tail[pos:]
+        self._scan_pos -= pos
+        if text.strip():
+            self._blocks.append(_Block(text))
+
+    def __rich_console__(self, console, options):
+        with self._lock:
+            blocks = list(self._blocks)
+            if self._tail_block is None and self._tail.strip('\n'):
+                self._tail_block = _Block(self._tail.strip('\n'))
+            if self._tail_block is not None:
+                blocks.append(self._tail_block)
+
+        options = options.update(height=None)
+        previous = None
+        for block in blocks:
+            if previous is not None and not (block.list_kind and block.list_kind == previous.list_kind):
+                yield Segment.line()
+            for line in block.render_lines(console, options, **self.markdown_kwargs):
+                yield from line
+                yield Segment.line()
+            previous = block
@@ -0,0 +1,127 @@
+""" On-disk cache of model responses
+
+A response is cached under a hash of everything that determines it: the provider, the model,
+the full conversation (including the new message) and the sampling parameters.
+On a hit, the cached text is replayed through the same generator interface as LLMProvider.chat,
+and the turn is added to the client's history, as if the model had been called.
+
+Each response is a small JSON file in the cache directory. The least recently used files are evicted
+once the directory grows beyond its size limit.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import closing
+
+from az.cache import write_atomically
+
+
+RESPONSE_CACHE_DIR = os.path.expanduser("~/.config/.azc_responses" if os.path.exists(os.path.expanduser("~/.config")) else "~/.azc_responses")
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=RESPONSE_CACHE_DIR, ttl=None, max_size=100 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size = None  # total size of the cache files, computed on first put
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(client, message):
+        request = {
+            "provider": client.provider,
+            "model": client.model,
+            "primer": getattr(client, "primer", None),  # not in the history of every provider (e.g. Anthropic's is sent on its own)
+            "messages": client.history() + [{"role": "user", "content": message}],
+            "params": client.sampling_params(),
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """ The cached response, or None """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if self.ttl is not None and time.time() - entry["created"] > self.ttl:
+            return None
+        try:
+            os.utime(path)  # the modification time is the last use, for LRU eviction
+        except FileNotFoundError:
+            pass
+        return entry["response"]
+
+    def put(self, key, response):
+        data = json.dumps({"created": time.time(), "response": response})
+        write_atomically(self._path(key), data)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry.stat().st_size for entry in self._entries())
+            else:
+                self._size += len(data.encode())
+            if self._size > self.max_size:
+                self._evict()
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.json')]
+
+    def _evict(self):
+        """ Remove the least recently used responses until the cache is down to 90% of its size limit """
+        files = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        self._size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        for entry in self._entries():
+            os.remove(entry.path)
+        self._size = 0
+
+
+def replay(response, chunk_size=None):
+    """ Yield a cached response, in chunks of chunk_size characters if given (like a streamed response) """
+    if not chunk_size:
+        yield response
+        return
+    for i in range(0, len(response), chunk_size):
+        yield response[i:i + chunk_size]
+
+
+def cached_chat(client, message, cache, chunk_size=None, chat=None):
+    """ client.chat(message) (or chat(client, message)), served from the cache when the same request was made before """
+    key = cache.key(client, message)
+    response = cache.get(key)
+    if response is not None:
+        client.record_turn(message, response)
+        yield from replay(response, chunk_size)
+        return
+
+    chunks = []
+    with closing(chat(client, message) if chat else client.chat(message)) as response:  # closing this stream early closes the client's
+        for chunk in response:
+            chunks.append(chunk)
+            yield chunk
+    # only complete responses get here (not ones interrupted or failed midway)
+    cache.put(key, "".join(chunks))
@@ -0,0 +1,113 @@
+""" Full-text search over past prompts and responses
+
+Every completed chat (prompt, response, provider, model, time, latency) is added to a SQLite
+database with an FTS5 index, as soon as the response is complete, so finding a past answer is
+an indexed lookup rather than asking the model again.
+
+Rows are added by a background thread, so a chat never waits for the disk.
+"""
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+SEARCH_DB = os.path.expanduser("~/.config/.azc_search.db" if os.path.exists(os.path.expanduser("~/.config")) else "~/.azc_search.db")
+DEFAULT_LIMIT = 20
+
+MARK_START, MARK_END = "\x02", "\x03"  # around the words found, in snippets (shown as markdown bold)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    provider TEXT,
+    model TEXT,
+    latency REAL,
+    session TEXT,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5(prompt, response, content='chats', content_rowid='id');
+"""
+
+
+def match_expression(query):
+    """ A free-text query as an FTS5 expression: every word must appear (a trailing * keeps its prefix meaning) """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, path=None):
+        self.path = path or SEARCH_DB
+        self.error = None  # the last error of the writer thread
+        self._connection = None
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="azc-search")
+
+    def _connect(self):
+        # the one connection is shared by the writer thread and searches, serialized by self._lock
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")  # other azc processes may search while this one writes
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def add(self, prompt, response, provider=None, model=None, timestamp=None, latency=None, session=None):
+        """ Index a completed chat. Returns right away, the writing is done on a background thread. """
+        row = (timestamp or time.time(), provider, model and str(model), latency, session, prompt, response)
+        self._writer.submit(self._add, row)
+
+    def _add(self, row):
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    rowid = connection.execute("INSERT INTO chats (time, provider, model, latency, session, prompt, response) "
+                                               "VALUES (?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+                    connection.execute("INSERT INTO chats_fts (rowid, prompt, response) VALUES (?, ?, ?)", (rowid, row[-2], row[-1]))
+        except Exception as e:
+            self.error = e
+
+    def flush(self):
+        """ Wait until everything added so far is indexed """
+        self._writer.submit(lambda: None).result()
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """ The chats matching every word of `query`, best matches first: dicts with the chat's fields
+        and "snippet", the part of the response (or the prompt) where the words were found
+        """
+        expression = match_expression(query)
+        if not expression:
+            return []
+        with self._lock:
+            cursor = self._connect().execute(
+                "SELECT chats.*, snippet(chats_fts, 1, ?1, ?2, '…', 16), snippet(chats_fts, 0, ?1, ?2, '…', 16) "
+                "FROM chats_fts JOIN chats ON chats.id = chats_fts.rowid "
+                "WHERE chats_fts MATCH ?3 ORDER BY rank LIMIT ?4", (MARK_START, MARK_END, expression, limit))
+            columns = [c[0] for c in cursor.description[:-2]]
+            rows = cursor.fetchall()
+        results = []
+        for row in rows:
+            result = dict(zip(columns, row))
+            response_snippet, prompt_snippet = row[-2:]
+            snippet = response_snippet if MARK_START in response_snippet else prompt_snippet
+            result["snippet"] = snippet.replace(MARK_START, "**").replace(MARK_END, "**")
+            results.append(result)
+        return results
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,324 @@
+""" `azc serve`: an OpenAI compatible endpoint over the configured providers
+
+Tools which speak the OpenAI API (base URL http://127.0.0.1:8000/v1) get every provider azc knows:
+
+- GET /v1/models: the models of all the providers
+- POST /v1/chat/completions: routed by the requested model (a model name, part of one, or
+  provider:model) to its provider, streamed as server-sent events or not
+
+Requests are served concurrently on one event loop, with the providers' async clients (and so the
+shared, kept-alive upstream connections, see az.transport). Every provider has a limit on the requests
+it serves at once, further requests wait for their turn, and once too many are waiting they are
+turned away (429).
+
+Config (all optional):
+
+    "serve": {"concurrency": {"default": 8, "ollama": 2}, "queue": 64}
+"""
+import asyncio
+import contextlib
+import json
+import os
+import time
+from http import HTTPStatus
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_QUEUE = 64
+MAX_BODY = 16 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, type="invalid_request_error"):
+        super().__init__(message)
+        self.status = status
+        self.type = type
+
+    def body(self):
+        return {"error": {"message": str(self), "type": self.type, "code": self.status}}
+
+
+def text_of(content):
+    """ The text of an OpenAI message content: a string, or a list of parts """
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def parse_conversation(messages):
+    """ OpenAI messages -> (system prompt or None, [(user message, assistant response), ...], prompt).
+    Consecutive messages of the same role are joined.
+    """
+    if messages is not None and not isinstance(messages, list):
+        raise HTTPError(400, "messages must be a list")
+    system, turns, user, assistant = [], [], [], []
+    for message in messages or []:
+        if not isinstance(message, dict):
+            raise HTTPError(400, "every message must be an object, with a role and a content")
+        role, text = message.get("role"), text_of(message.get("content"))
+        if role in ("system", "developer"):
+            system.append(text)
+        elif role == "user":
+            if assistant:
+                turns.append(("\n\n".join(user), "\n\n".join(assistant)))
+                user, assistant = [], []
+            user.append(text)
+        elif role == "assistant" and user:
+            assistant.append(text)
+    if not user or assistant:
+        raise HTTPError(400, "the last message must be a user message")
+    return "\n\n".join(system) or None, turns, "\n\n".join(user)
+
+
+class Backend:
+    """ A provider's (warm) client, and its limit of concurrent requests """
+    def __init__(self, client, concurrency=DEFAULT_CONCURRENCY, queue=DEFAULT_QUEUE):
+        self.client = client
+        self.queue = queue
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(concurrency)
+
+    @property
+    def name(self):
+        return self.client.provider
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """ Wait for a free slot (in turn), or fail right away if too many requests are waiting already """
+        if self._slots.locked() and self.waiting >= self.queue:
+            raise HTTPError(429, f"too many requests for {self.name}, try again later", "rate_limit_error")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def conversation(self, model, messages):
+        """ A new chat (a fork of the client, sharing its connections) with the history of the request;
+        returns it and the prompt to send
+        """
+        system, turns, prompt = parse_conversation(messages)
+        client = self.client.fork()
+        client.model = model
+        client.new_chat(primer=system)
+        for message, response in turns:
+            client.record_turn(message, response)
+        return client, prompt
+
+
+class Gateway:
+    def __init__(self, clients, config={}):
+        settings = config.get("serve", {})
+        concurrency = settings.get("concurrency", {})
+        if isinstance(concurrency, int):
+            concurrency = {"default": concurrency}
+        self.backends = {client.provider: Backend(client, concurrency.get(client.provider, concurrency.get("default", DEFAULT_CONCURRENCY)),
+                                                  settings.get("queue", DEFAULT_QUEUE))
+                         for client in clients}
+        self.server = None
+        self._connections = set()  # the writers of the open connections
+
+    def models(self):
+        return [(backend, model) for backend in self.backends.values() for model in backend.client.models]
+
+    def route(self, model):
+        """ The backend and full model name for a requested model: 'provider:model', a model name, or part of one """
+        if not model or not isinstance(model, str):
+            raise HTTPError(400, "a model is required")
+        provider, _, name = model.partition(":")
+        if provider in self.backends and name:
+            return self.backends[provider], name
+        if model in self.backends:
+            return self.backends[model], self.backends[model].client.model
+        models = self.models()
+        for backend, candidate in models:
+            if candidate == model:
+                return backend, candidate
+        for backend, candidate in models:
+            if model in candidate:
+                return backend, candidate
+        raise HTTPError(404, f"model {model} not found", "not_found_error")
+
+    async def start(self, host="127.0.0.1", port=8000):
+        self.server = await asyncio.start_server(self._connection, host, port)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host="127.0.0.1", port=8000):
+        await self.start(host, port)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        """ Stop listening, and close the open connections """
+        self.server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def _connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                keep_alive = await self._dispatch(method, path, body, writer) and keep_alive
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            await send_json(writer, e.status, e.body(), keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            # a request this doesn't handle well (rather than one it rejects) still gets an answer
+            with contextlib.suppress(ConnectionError):
+                await send_json(writer, 500, HTTPError(500, f"{type(e).__name__}: {e}", "server_error").body(), keep_alive=False)
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _dispatch(self, method, path, body, writer):
+        """ Serve a request, return whether the connection can be kept open """
+        try:
+            if path == "/v1/models" and method == "GET":
+                data = [{"id": model, "object": "model", "created": 0, "owned_by": backend.name} for backend, model in self.models()]
+                await send_json(writer, 200, {"object": "list", "data": data})
+                return True
+            if path == "/v1/chat/completions" and method == "POST":
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    raise HTTPError(400, "the body must be JSON")
+                if not isinstance(request, dict):
+                    raise HTTPError(400, "the body must be a JSON object")
+                return await self._chat_completion(request, writer)
+            raise HTTPError(404, f"no such endpoint: {method} {path}", "not_found_error")
+        except HTTPError as e:
+            await send_json(writer, e.status, e.body())
+            return True
+
+    async def _chat_completion(self, request, writer):
+        backend, model = self.route(request.get("model"))
+        completion_id = "chatcmpl-" + os.urandom(12).hex()
+        created = int(time.time())
+
+        def completion(object, choice, usage=None):
+            data = {"id": completion_id, "object": object, "created": created, "model": model, "choices": [choice] if choice else []}
+            if usage is not None:
+                data["usage"] = usage
+            return data
+
+        async with backend.slot():
+            try:
+                client, prompt = backend.conversation(model, request.get("messages"))
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+            client.last_usage = None
+            chunks = client.achat(prompt)
+            try:
+                if request.get("stream"):
+                    await self._stream(client, chunks, writer, completion, include_usage=(request.get("stream_options") or {}).get("include_usage"))
+                    return False
+                try:
+                    text = "".join([chunk async for chunk in chunks])
+                except Exception as e:
+                    raise HTTPError(502, f"{backend.name}: {e}", "upstream_error")
+                choice = {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                await send_json(writer, 200, completion("chat.completion", choice, usage(client.last_usage)))
+                return True
+            finally:
+                await chunks.aclose()  # closes the upstream response, if it was cut short
+
+    async def _stream(self, client, chunks, writer, completion, include_usage=False):
+        """ The response as server-sent events. A failure before the first chunk is an HTTP error,
+        after it the error is sent as an event and the stream is cut short.
+        """
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = ""
+        except Exception as e:
+            raise HTTPError(502, f"{client.provider}: {e}", "upstream_error")
+
+        def chunk_event(delta, finish_reason=None):
+            return completion("chat.completion.chunk", {"index": 0, "delta": delta, "finish_reason": finish_reason})
+
+        await send_headers(writer, 200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "Connection": "close"})
+        try:
+            await send_event(writer, chunk_event({"role": "assistant", "content": first}))
+            async for chunk in chunks:
+                await send_event(writer, chunk_event({"content": chunk}))
+            await send_event(writer, chunk_event({}, "stop"))
+            if include_usage:
+                await send_event(writer, completion("chat.completion.chunk", None, usage(client.last_usage)))
+            await send_event(writer, "[DONE]")
+        except ConnectionError:
+            pass  # the client is gone
+        except Exception as e:
+            with contextlib.suppress(ConnectionError):
+                await send_event(writer, HTTPError(502, f"{client.provider}: {e}", "upstream_error").body())
+
+
+def usage(last_usage):
+    last_usage = last_usage or {}
+    prompt, completion = last_usage.get("input_tokens") or 0, last_usage.get("output_tokens") or 0
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+async def read_request(reader):
+    """ (method, path, headers, body) of the next HTTP/1.1 request on the connection, None once it is closed """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, f"invalid Content-Length: {headers['content-length']}")
+    if length > MAX_BODY:
+        raise HTTPError(413, "the request is too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target.split("?", 1)[0], headers, body
+
+
+async def send_headers(writer, status, headers):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"] + [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+
+async def send_json(writer, status, data, keep_alive=True):
+    body = json.dumps(data).encode()
+    await send_headers(writer, status, {"Content-Type": "application/json", "Content-Length": len(body),
+                                        "Connection": "keep-alive" if keep_alive else "close"})
+    writer.write(body)
+    await writer.drain()
+
+
+async def send_event(writer, data):
+    writer.write(f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode())
+    await writer.drain()
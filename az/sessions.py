@@ -0,0 +1,149 @@
+""" Saved chats (sessions), which can be resumed later
+
+Every session is an append-only JSONL file of its messages. An index file maps each session id to
+the length of its file and its metadata (provider, model, title, number of turns, times), so
+listing sessions only reads the index, and resuming one only reads its own file.
+
+Messages are written by a background thread, so a chat never waits for the disk.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from az.cache import file_lock, write_atomically
+
+
+SESSIONS_DIR = os.path.expanduser("~/.config/.azc_sessions" if os.path.exists(os.path.expanduser("~/.config")) else "~/.azc_sessions")
+TITLE_LENGTH = 60
+
+
+class SessionStore:
+    def __init__(self, directory=None):
+        self.directory = directory or SESSIONS_DIR
+        self.index_file = os.path.join(self.directory, "index.json")
+        self.error = None  # the last error of the writer thread
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id():
+        return time.strftime("%Y%m%d-%H%M%S") + "-" + os.urandom(2).hex()
+
+    def session_file(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def append(self, session_id, messages, **metadata):
+        """ Append messages ({"role", "content"}) to a session, and set its metadata (e.g. provider and model).
+        Returns right away, the writing is done on a background thread.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="azc-sessions", daemon=True)
+                self._thread.start()
+        self._queue.put((session_id, list(messages), metadata, time.time()))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            items = [item for item in batch if item is not None]
+            try:
+                if items:
+                    self._write(items)
+            except Exception as e:
+                self.error = e
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(items) < len(batch):
+                return
+
+    def _write(self, items):
+        os.makedirs(self.directory, exist_ok=True)
+        updates = {}
+        for session_id, messages, metadata, timestamp in items:
+            with open(self.session_file(session_id), "ab") as f:
+                for message in messages:
+                    f.write((json.dumps(dict(message, time=timestamp)) + "\n").encode())
+                offset = f.tell()
+            update = updates.setdefault(session_id, {"turns": 0, "created": timestamp})
+            update.update(metadata, offset=offset, updated=timestamp)
+            update["turns"] += sum(1 for m in messages if m["role"] == "user")
+            if "title" not in update:
+                first = next((m["content"] for m in messages if m["role"] == "user"), None)
+                if first:
+                    update["title"] = " ".join(first.split())[:TITLE_LENGTH]
+
+        # the index is shared with other azc processes
+        with file_lock(self.index_file):
+            index = self._read_index()
+            for session_id, update in updates.items():
+                entry = index.setdefault(session_id, {"created": update["created"], "turns": 0})
+                entry["turns"] += update.pop("turns")
+                update.pop("created")
+                if "title" in entry:
+                    update.pop("title", None)
+                entry.update(update)
+            write_atomically(self.index_file, json.dumps(index))
+
+    def _read_index(self):
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def flush(self):
+        """ Wait until everything appended so far is written """
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def sessions(self):
+        """ All the sessions, most recently updated first: dicts with "id" and the session's metadata """
+        index = self._read_index()
+        return sorted(({"id": session_id, **entry} for session_id, entry in index.items()),
+                      key=lambda s: s.get("updated", 0), reverse=True)
+
+    def resolve(self, session_id):
+        """ The full id of a session from its id, a unique prefix of it, or 'last' """
+        index = self._read_index()
+        if session_id == "last" and index:
+            return max(index, key=lambda s: index[s].get("updated", 0))
+        if session_id in index:
+            return session_id
+        matches = [s for s in index if s.startswith(session_id)]
+        if len(matches) == 1:
+            return matches[0]
+        raise ValueError(f"{'No' if not matches else 'More than one'} session matching <{session_id}>")
+
+    def load(self, session_id):
+        """ The metadata and messages of a session (only its indexed part, in case a write was cut short) """
+        entry = self._read_index()[session_id]
+        with open(self.session_file(session_id), "rb") as f:
+            data = f.read(entry["offset"])
+        messages = [json.loads(line) for line in data.decode().splitlines() if line]
+        return entry, [{"role": m["role"], "content": m["content"]} for m in messages]
+
+
+def turns(messages):
+    """ (user message, assistant response) pairs of a conversation """
+    pending = None
+    for message in messages:
+        if message["role"] == "user":
+            pending = message["content"]
+        elif message["role"] == "assistant" and pending is not None:
+            yield pending, message["content"]
+            pending = None
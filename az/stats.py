@@ -0,0 +1,176 @@
+""" Latency and throughput of responses
+
+measure() wraps a response stream (e.g. client.chat(message)) and records time to first token,
+total duration, chunks, characters and tokens. Token counts come from the provider when it reports
+usage (client.last_usage, set at the end of the stream), otherwise they are estimated from the text.
+"""
+import time
+
+
+CHARS_PER_TOKEN = 4  # rough estimate, when the provider doesn't report usage
+
+
+class ChatStats:
+    def __init__(self, provider=None, model=None):
+        self.provider = provider
+        self.model = model
+        self.start = time.perf_counter()
+        self.first_chunk = None
+        self.end = None
+        self.chunks = 0
+        self.chars = 0
+        self.usage = {}
+
+    def on_chunk(self, chunk):
+        if self.first_chunk is None:
+            self.first_chunk = time.perf_counter()
+        self.chunks += 1
+        self.chars += len(chunk)
+
+    def on_end(self, usage=None):
+        self.end = time.perf_counter()
+        self.usage = usage or {}
+
+    @property
+    def ttft(self):
+        """ Time to first token (seconds) """
+        return None if self.first_chunk is None else self.first_chunk - self.start
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def input_tokens(self):
+        return self.usage.get("input_tokens")
+
+    @property
+    def cached_tokens(self):
+        """ Input tokens served from the provider's prompt cache (None if the provider doesn't report them) """
+        return self.usage.get("cached_tokens")
+
+    @property
+    def cache_hit_rate(self):
+        if self.cached_tokens is None or not self.input_tokens:
+            return None
+        return self.cached_tokens / self.input_tokens
+
+    @property
+    def answered_by(self):
+        """ The backup provider which answered (see az.hedge), None if it was the client's own """
+        return self.usage.get("answered_by")
+
+    @property
+    def output_tokens(self):
+        if self.usage.get("output_tokens") is not None:
+            return self.usage["output_tokens"]
+        return round(self.chars / CHARS_PER_TOKEN)
+
+    @property
+    def tokens_estimated(self):
+        return self.usage.get("output_tokens") is None
+
+    @property
+    def tokens_per_second(self):
+        """ Output tokens per second of generation (after the first token) """
+        if self.usage.get("generation_seconds"):
+            generation = self.usage["generation_seconds"]
+        elif self.first_chunk is not None:
+            generation = (self.end or time.perf_counter()) - self.first_chunk
+        else:
+            return None
+        return self.output_tokens / generation if generation > 0 else None
+
+    def as_dict(self):
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "ttft": self.ttft,
+            "duration": self.duration,
+            "chunks": self.chunks,
+            "chars": self.chars,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "tokens_estimated": self.tokens_estimated,
+            "tokens_per_second": self.tokens_per_second,
+            "answered_by": self.answered_by,
+        }
+
+    def summary(self):
+        """ A compact one-line summary, e.g. 'TTFT 0.42s · 3.10s · 512 tok · 171 tok/s · 92% cached' """
+        parts = []
+        if self.ttft is not None:
+            parts.append(f"TTFT {self.ttft:.2f}s")
+        parts.append(f"{self.duration:.2f}s")
+        parts.append(f"{'~' if self.tokens_estimated else ''}{self.output_tokens} tok")
+        if self.tokens_per_second is not None:
+            parts.append(f"{self.tokens_per_second:.0f} tok/s")
+        if self.cache_hit_rate is not None:
+            parts.append(f"{self.cache_hit_rate:.0%} cached")
+        if self.answered_by:
+            parts.append(f"via {self.answered_by}")
+        return " · ".join(parts)
+
+
+class MeasuredChat:
+    """ Iterates a response stream, recording its ChatStats in self.stats """
+    def __init__(self, client, chunks):
+        self.client = client
+        self.chunks = chunks
+        self._chunks = iter(chunks)
+        self.stats = ChatStats(getattr(client, "provider", None), getattr(client, "model", None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._chunks)
+        except BaseException:
+            self._end()
+            raise
+        self.stats.on_chunk(chunk)
+        return chunk
+
+    def close(self):
+        """ Stop the response stream early (closing it releases the provider's connection) """
+        close = getattr(self.chunks, "close", None)
+        if close:
+            close()
+        self._end()
+
+    def _end(self):
+        if self.stats.end is None:
+            self.stats.on_end(getattr(self.client, "last_usage", None))
+
+
+def measure(client, chunks):
+    """ Wrap the response stream `chunks` of `client`; the stats are in the returned object's .stats """
+    # don't report the usage of a previous response, if this one is served without calling the provider
+    client.last_usage = None
+    return MeasuredChat(client, chunks)
+
+
+class StatsReport:
+    """ Aggregated stats of the responses of a session, per provider:model """
+    def __init__(self):
+        self.responses = {}
+
+    def add(self, stats):
+        self.responses.setdefault(f"{stats.provider}:{stats.model}", []).append(stats)
+
+    def rows(self):
+        for name, responses in self.responses.items():
+            ttfts = [s.ttft for s in responses if s.ttft is not None]
+            rates = [s.tokens_per_second for s in responses if s.tokens_per_second is not None]
+            cached = [s for s in responses if s.cache_hit_rate is not None]
+            yield {
+                "model": name,
+                "responses": len(responses),
+                "mean_ttft": sum(ttfts) / len(ttfts) if ttfts else None,
+                "mean_duration": sum(s.duration for s in responses) / len(responses),
+                "output_tokens": sum(s.output_tokens for s in responses),
+                "mean_tokens_per_second": sum(rates) / len(rates) if rates else None,
+                "cache_hit_rate": sum(s.cached_tokens for s in cached) / sum(s.input_tokens for s in cached) if cached else None,
+            }
@@ -0,0 +1,154 @@
+""" Token counts and costs of requests, before they are sent
+
+Clients count tokens with their provider's tokenizer where one is available offline (Anthropic's
+SDK has one, OpenAI's models use tiktoken if it is installed), otherwise they are estimated from
+the length of the text. Counts are kept with the messages (see context.Message.count_tokens), so
+counting the next request only counts the text which is new.
+
+The counts give the size and (by the models' prices) the cost of the next request, shown while
+typing, and warnings before a request which won't fit the model's context window, or which costs
+more than expected, is sent.
+
+Config (all optional):
+
+    "tokens": {
+        "prices": {"gpt-4o-mini": [0.15, 0.6]},  # $ per million input and output tokens, by (part of) the model name
+        "context-windows": {"llama3.1": 8192},   # tokens, by (part of) the model name
+        "warn-cost": 0.10                        # warn before requests whose input costs more ($, null: never)
+    },
+    "max-tokens": 4096,                          # the longest response, for all providers
+    "anthropic": {"max-tokens": 8192},           # or for one (Anthropic requires one: 4096 by default)
+    "ollama": {"num-ctx": 8192}                  # the context window Ollama runs its models with
+"""
+
+
+MESSAGE_OVERHEAD = 4  # tokens of each message's role and separators
+DEFAULT_WARN_COST = 0.10
+DEFAULT_MAX_TOKENS = {"anthropic": 4096}
+
+# $ per million input and output tokens
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o1-preview": (15.00, 60.00),
+    "o1-mini": (3.00, 12.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-5-haiku": (1.00, 5.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+FREE_PROVIDERS = ("ollama",)  # models run locally
+
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "o1": 128000,
+    "claude-3": 200000,
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+}
+
+_encodings = {}
+
+
+def by_model(table, model):
+    """ The entry of the longest (part of a) model name in `table` found in `model`, or None """
+    matches = [name for name in table if name in (model or "")]
+    return table[max(matches, key=len)] if matches else None
+
+
+def tiktoken_encoding(model):
+    """ tiktoken's encoding for an OpenAI model, None if tiktoken (an optional dependency) isn't installed,
+    or doesn't know the model, or can't load its encoding (it is downloaded once, then cached)
+    """
+    if model not in _encodings:
+        try:
+            import tiktoken
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def max_tokens(config, provider):
+    """ The configured limit of the length of responses (None: the provider's default) """
+    return config.get(provider, {}).get("max-tokens") or config.get("max-tokens") or DEFAULT_MAX_TOKENS.get(provider)
+
+
+def context_window(config, provider, model):
+    """ Tokens the model can take (request and response), None if unknown """
+    if provider == "ollama":
+        return config.get("ollama", {}).get("num-ctx")  # otherwise, whatever the model's Modelfile says
+    return by_model({**CONTEXT_WINDOWS, **config.get("tokens", {}).get("context-windows", {})}, model)
+
+
+def price(config, provider, model):
+    """ ($ per million input tokens, $ per million output tokens) of a model, None if unknown """
+    if provider in FREE_PROVIDERS:
+        return (0.0, 0.0)
+    return by_model({**PRICES, **config.get("tokens", {}).get("prices", {})}, model)
+
+
+def cost(config, provider, model, input_tokens, output_tokens=0):
+    """ The cost ($) of a request, None if the model's price is unknown """
+    prices = price(config, provider, model)
+    if prices is None:
+        return None
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1e6
+
+
+def count(client, message=""):
+    """ Tokens of the client's next request: its conversation so far, and `message` """
+    tokenizer, count_text = client.tokenizer()
+    total = sum(m.count_tokens(tokenizer, count_text) + MESSAGE_OVERHEAD for m in client.context_messages())
+    return total + (count_text(message) + MESSAGE_OVERHEAD if message else 0)
+
+
+def short(n):
+    """ e.g. 950 -> '950', 12345 -> '12.3k' """
+    return f"{n / 1000:.1f}k" if n >= 1000 else str(n)
+
+
+def dollars(amount):
+    if 0 < amount < 0.0001:
+        return "<$0.0001"
+    return f"${amount:.2f}" if amount >= 0.01 or amount == 0 else f"${amount:.4f}"
+
+
+def readout(client, message="", config={}):
+    """ The size and cost of the next request, e.g. '~1.2k tok · $0.0004' ('' for clients which can't count) """
+    if not hasattr(client, "tokenizer"):
+        return ""
+    n = count(client, message)
+    request_cost = cost(config, client.provider, client.model, n)
+    return f"~{short(n)} tok" + (f" · {dollars(request_cost)}" if request_cost else "")
+
+
+def preflight(client, message, config={}):
+    """ Warnings about the client's request with `message`, before it is sent: too large for the model, or costly """
+    warnings = []
+    if not hasattr(client, "tokenizer"):
+        return warnings  # not an LLMProvider (e.g. a stand-in), nothing to count
+    n = count(client, message)
+    reserved = max_tokens(config, client.provider) or 0  # for the response
+    window = context_window(config, client.provider, client.model)
+    if window and n + reserved > window:
+        response = f" (+{short(reserved)} for the response)" if reserved else ""
+        warnings.append(f"the request is ~{short(n)} tokens{response}, over the {short(window)} context window of {client.model}: "
+                        "it may be cut short or rejected")
+    warn_cost = config.get("tokens", {}).get("warn-cost", DEFAULT_WARN_COST)
+    request_cost = cost(config, client.provider, client.model, n)  # the input alone, the response adds to it
+    if warn_cost is not None and request_cost is not None and request_cost > warn_cost:
+        warnings.append(f"the request will cost more than {dollars(request_cost)}")
+    return warnings
+
+
+def stats_cost(config, stats):
+    """ The cost ($) of a response, by its stats.ChatStats, None if the model's price is unknown """
+    return cost(config, stats.provider, stats.model, stats.input_tokens or 0, stats.output_tokens or 0)
+
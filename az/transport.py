@@ -0,0 +1,104 @@
+""" HTTP transport shared by all the providers
+
+One connection pool per process (per kind of client), so that connections are kept alive and reused
+across requests, conversations, forks and provider switches, instead of every call opening a new one.
+Pool limits and timeouts come from the "http" section of the config:
+
+    "http": {"max-connections": 20, "max-keepalive-connections": 10, "keepalive-expiry": 30,
+             "timeout": 600, "connect-timeout": 10, "http2": false}
+
+HTTP/2 is only used when enabled and the `h2` package is installed (pip install httpx[http2]).
+Gemini is not covered: its SDK talks gRPC over its own long-lived channel.
+"""
+import importlib.util
+import socket
+import threading
+
+
+DEFAULTS = {
+    "max-connections": 20,
+    "max-keepalive-connections": 10,
+    "keepalive-expiry": 30,
+    "timeout": 600,
+    "connect-timeout": 10,
+    "http2": False,
+}
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def settings(config={}):
+    return {**DEFAULTS, **config.get("http", {})}
+
+
+def _shared(kind, create, config):
+    with _lock:
+        if kind not in _clients:
+            _clients[kind] = create(settings(config))
+        return _clients[kind]
+
+
+def _httpx_options(s):
+    import httpx
+    return dict(
+        limits=httpx.Limits(
+            max_connections=s["max-connections"],
+            max_keepalive_connections=s["max-keepalive-connections"],
+            keepalive_expiry=s["keepalive-expiry"],
+        ),
+        timeout=httpx.Timeout(s["timeout"], connect=s["connect-timeout"]),
+        http2=bool(s["http2"]) and importlib.util.find_spec("h2") is not None,
+        follow_redirects=True,
+    )
+
+
+def http_client(config={}):
+    """ The shared httpx.Client (used by the OpenAI and Anthropic SDKs) """
+    import httpx
+    return _shared("httpx", lambda s: httpx.Client(**_httpx_options(s)), config)
+
+
+def async_http_client(config={}):
+    """ The shared httpx.AsyncClient (used by the async SDK clients and Ollama).
+    Like any asyncio connection pool, it must be used from a single event loop.
+    """
+    import httpx
+    return _shared("httpx-async", lambda s: httpx.AsyncClient(**_httpx_options(s)), config)
+
+
+def requests_session(config={}):
+    """ The shared requests.Session (used by Ollama) """
+    def create(s):
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=s["max-keepalive-connections"], pool_maxsize=s["max-connections"])
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    return _shared("requests", create, config)
+
+
+def request_timeout(config={}):
+    """ (connect, read) timeout for requests calls """
+    s = settings(config)
+    return (s["connect-timeout"], s["timeout"])
+
+
+def abort(response):
+    """ Stop a streamed (httpx or requests) response from another thread. Closing it doesn't wake up a read blocked
+    on it, nor tell the server, so its connection is shut down instead (HTTP/2 connections, shared by other requests, are left open).
+    """
+    if response is None:
+        return
+    if hasattr(response, "extensions"):  # httpx
+        stream = response.extensions.get("network_stream")
+        sock = stream.get_extra_info("socket") if stream is not None and response.http_version == "HTTP/1.1" else None
+    else:  # requests
+        sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
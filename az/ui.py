@@ -0,0 +1,93 @@
+""" Interactive terminal UI pieces (prompt_toolkit)
+
+Kept out of az.az so that non-interactive runs (e.g. `azc -b`) don't pay for importing them.
+"""
+from prompt_toolkit.formatted_text import HTML
+from prompt_toolkit.history import FileHistory
+from prompt_toolkit.completion import Completer, Completion
+from prompt_toolkit.key_binding import KeyBindings
+
+import readline # needed for prompt editing
+
+
+bindings = KeyBindings()
+
+
+def is_command(string: str) -> bool:
+    if string.strip().lower() in ('exit', 'quit', 'q', 'p', 'l', 'm', 'p', 'n', 'h', 'r', '?', ''): return True
+    elif string.strip().startswith("p "): return True
+    elif string.strip() == "f" or string.strip().startswith("f "): return True
+    elif string.strip() == "sessions" or string.strip().startswith("sessions "): return True
+    elif string.strip() == "/search" or string.strip().startswith("/search "): return True
+    else: return False
+
+
+# Bind 'Control+n' to insert a newline
+@bindings.add('c-n')
+def insert_newline(event):
+    event.current_buffer.insert_text('\n')
+
+
+def enable_double_enter():
+    """ Require pressing enter twice to submit a prompt (commands are submitted right away) """
+    @bindings.add('enter')
+    def _(event):
+        buffer = event.current_buffer
+        accepted = False
+        if buffer.document.text.strip() == '':
+            accepted = True
+        elif is_command(buffer.document.text):
+            accepted = True
+        elif buffer.document.text.endswith('\n') and buffer.document.is_cursor_at_the_end:
+            accepted = True
+        else:
+            accepted = False
+        if accepted:
+            buffer.validate_and_handle()
+        else:
+            buffer.insert_text('\n')
+
+
+class CommandsCompleter(Completer):
+    """
+    This completer handles the 'p' command for changing provider, and the providers list of the 'f' (fan-out) command
+    """
+    def __init__(self, providers):
+        self.providers = providers
+
+    def get_completions(self, document, complete_event):
+        text = document.current_line
+        if text.startswith('p '):
+            for provider in self.providers:
+                yield Completion(
+                f'p {provider}', start_position=-1000,
+                display=HTML(f'{provider}'),
+                style='bg:ansiyellow')
+        elif text.startswith('f '):
+            current = text[2:].split(',')[-1].strip()
+            for provider in self.providers:
+                if provider.startswith(current):
+                    yield Completion(provider, start_position=-len(current), display=HTML(f'{provider}'), style='bg:ansiyellow')
+
+
+class ModelsCompleter(Completer):
+    """
+    Completes model names of the client for the 'm' command (its models list may still be refreshing in the background)
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor.strip()
+        for model in list(self.client.models):
+            if text in model:
+                yield Completion(model, start_position=-len(document.text_before_cursor), display=HTML(f'{model}'))
+
+
+class FilteredHistory(FileHistory):
+    """
+    This class is a custom history class that filters out commands we don't want to save
+    """
+    def store_string(self, string: str) -> None:
+        if not is_command(string):
+                super().store_string(string)
@@ -0,0 +1,71 @@
+""" Benchmark: rendering a streamed markdown response
+
+Feeds a ~50 KB markdown response chunk by chunk and reports the CPU time spent rendering it:
+- before: a new Markdown(whole response so far) for every chunk (what az.az.main used to do)
+- after: az.render.StreamingMarkdown (finished blocks are parsed and rendered once)
+
+In both cases the display is "refreshed" (rendered to an off-screen console) every
+`--refresh-every` chunks, to simulate Live refreshing twice a second while chunks keep arriving.
+
+usage (from the repository root): python -m benchmarks.bench_render [--size 50000] [--chunk-size 20] [--refresh-every 50]
+"""
+import argparse
+import io
+import time
+
+from rich.console import Console
+from rich.markdown import Markdown
+
+from az.render import StreamingMarkdown, response_panel
+from benchmarks.stand_ins import sample_response
+
+
+def chunked(text, chunk_size):
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+def new_console():
+    return Console(file=io.StringIO(), width=100, height=50, color_system="truecolor", force_terminal=True)
+
+
+def render_before(chunks, refresh_every):
+    console = new_console()
+    current_message = ""
+    for i, chunk in enumerate(chunks, 1):
+        current_message += chunk
+        panel = response_panel(Markdown(current_message), border_style="none")
+        if i % refresh_every == 0:
+            console.print(panel)
+    console.print(panel)
+
+
+def render_after(chunks, refresh_every):
+    console = new_console()
+    response = StreamingMarkdown()
+    panel = response_panel(response, border_style="none")
+    for i, chunk in enumerate(chunks, 1):
+        response.append(chunk)
+        if i % refresh_every == 0:
+            console.print(panel)
+    console.print(panel)
+
+
+def cpu_time(fn, *args):
+    start = time.process_time()
+    fn(*args)
+    return time.process_time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50_000, help="response size in characters")
+    parser.add_argument("--chunk-size", type=int, default=20, help="characters per streamed chunk")
+    parser.add_argument("--refresh-every", type=int, default=50, help="render the display every N chunks")
+    args = parser.parse_args()
+
+    chunks = chunked(sample_response(args.size), args.chunk_size)
+    print(f"{args.size} characters in {len(chunks)} chunks, refresh every {args.refresh_every} chunks")
+    before = cpu_time(render_before, chunks, args.refresh_every)
+    print(f"before (Markdown per chunk):  {before:8.2f} s CPU")
+    after = cpu_time(render_after, chunks, args.refresh_every)
+    print(f"after (StreamingMarkdown):    {after:8.2f} s CPU  ({before / after:.0f}x faster)")
@@ -0,0 +1,204 @@
+""" Offline benchmark suite
+
+Runs every scenario against local stand-in provider servers (see benchmarks/stand_ins.py, run in a
+separate process so that their CPU time isn't counted), through:
+- client: the real OpenAIClient/OllamaClient, consuming the stream without rendering it
+- main: the full `azc -b <prompt>` render loop (az.az.main, writing to an off-screen terminal)
+- raw: `azc -b --raw <prompt>`, which writes the response as it streams, without rendering it
+
+and reports, per scenario: time to first token, duration, CPU time, render overhead
+(main CPU - client CPU) and peak memory (traced in a separate run, as tracing slows things down).
+Results are written as JSON, to compare between commits:
+
+    python -m benchmarks.run                        # writes benchmarks/results/<commit>.json
+    python -m benchmarks.run --compare benchmarks/results/<older commit>.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+
+SCENARIOS = [
+    {"name": "ollama-small-chunks", "kind": "ollama", "chunk_size": 2, "delay": 0.0002, "length": 20_000},
+    {"name": "ollama-long-response", "kind": "ollama", "chunk_size": 8, "delay": 0.0, "length": 50_000},
+    {"name": "openai-typical", "kind": "openai", "chunk_size": 4, "delay": 0.001, "length": 5_000, "ttft": 0.05},
+    {"name": "openai-long-response", "kind": "openai", "chunk_size": 16, "delay": 0.0, "length": 50_000},
+]
+
+# metrics where higher is worse, compared by --compare
+COMPARED_METRICS = ["ttft", "client_cpu", "main_cpu", "render_overhead_cpu", "raw_cpu", "peak_memory_kb"]
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _serve(scenario, connection):
+    from benchmarks.stand_ins import StandInServer
+    options = {k: v for k, v in scenario.items() if k not in ("name",)}
+    server = StandInServer(**options)
+    connection.send(server.url)
+    server.serve_forever()
+
+
+class StandInProcess:
+    """ A stand-in server for `scenario`, in a child process """
+    def __init__(self, scenario):
+        self.scenario = scenario
+
+    def __enter__(self):
+        parent, child = multiprocessing.Pipe()
+        self.process = multiprocessing.get_context("spawn").Process(target=_serve, args=(self.scenario, child), daemon=True)
+        self.process.start()
+        self.url = parent.recv()
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+def client_factory(scenario, url, models_cache_file):
+    """ A function creating a real client for the scenario's provider, talking to the stand-in at `url` """
+    env = {"OLLAMA_URL": url} if scenario["kind"] == "ollama" else {"OPENAI_API_KEY": "stand-in", "OPENAI_BASE_URL": url}
+
+    def create():
+        with patch.dict(os.environ, env), patch("az.models.MODELS_CACHE_FILE", models_cache_file):
+            from az.providers import provider_class
+            return provider_class(scenario["kind"])({}, primer="be brief")
+    return create
+
+
+def run_client(create_client):
+    from az.stats import measure
+    client = create_client()
+    cpu = time.process_time()
+    measured = measure(client, client.chat("benchmark"))
+    for _ in measured:
+        pass
+    return {
+        "ttft": measured.stats.ttft,
+        "duration": measured.stats.duration,
+        "chunks": measured.stats.chunks,
+        "client_cpu": time.process_time() - cpu,
+    }
+
+
+def run_main(create_client, raw=False):
+    import az.az
+    client = create_client()
+    out = io.StringIO()
+    cpu, start = time.process_time(), time.perf_counter()
+    with patch.dict(os.environ, {"FORCE_COLOR": "1", "COLUMNS": "100", "LINES": "50"}), \
+         patch("az.az.provider_factory", return_value=client), \
+         patch("az.az.providers", [client.provider]), \
+         patch("sys.argv", ["azc", "-b", "--raw" if raw else "--no-raw", "benchmark"]), \
+         patch("sys.stdout", out):
+        az.az.main()
+    prefix = "raw" if raw else "main"
+    return {f"{prefix}_duration": time.perf_counter() - start, f"{prefix}_cpu": time.process_time() - cpu}
+
+
+def peak_memory_kb(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(scenario, models_cache_file):
+    with StandInProcess(scenario) as server:
+        create_client = client_factory(scenario, server.url, models_cache_file)
+        run_client(create_client)  # warm up (imports, connections, models cache)
+        result = run_client(create_client)
+        result.update(run_main(create_client))
+        result.update(run_main(create_client, raw=True))
+        result["render_overhead_cpu"] = result["main_cpu"] - result["client_cpu"]
+        result["peak_memory_kb"] = peak_memory_kb(run_main, create_client)
+    return result
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(scenarios):
+    # the runs' chats are saved and indexed in the temporary directory, not the user's, and don't go to their daemon
+    with tempfile.TemporaryDirectory() as tmp, \
+         patch("az.sessions.SESSIONS_DIR", os.path.join(tmp, "sessions")), \
+         patch("az.search.SEARCH_DB", os.path.join(tmp, "search.db")), \
+         patch("az.daemon.SOCKET_PATH", os.path.join(tmp, "azc.sock")):
+        models_cache_file = os.path.join(tmp, "models.json")
+        return {
+            "commit": current_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "scenarios": {s["name"]: dict(run_scenario(s, models_cache_file), config=s) for s in scenarios},
+        }
+
+
+def compare(baseline, results, threshold):
+    """ Print the change of every metric, return the regressions larger than threshold (a fraction) """
+    regressions = []
+    print(f"\n{'scenario':24} {'metric':20} {baseline['commit']:>10} {results['commit']:>10}  change")
+    for name, scenario in results["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = baseline["scenarios"][name].get(metric), scenario.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = " <-- regression" if change > threshold else ""
+            print(f"{name:24} {metric:20} {old:10.3f} {new:10.3f}  {change:+7.1%}{flag}")
+            if flag:
+                regressions.append((name, metric, change))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'scenario':24} {'ttft':>8} {'duration':>9} {'client cpu':>11} {'main cpu':>9} {'render cpu':>11} {'raw cpu':>8} {'peak KB':>8}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:24} {r['ttft']:8.3f} {r['duration']:9.3f} {r['client_cpu']:11.3f} {r['main_cpu']:9.3f} "
+              f"{r['render_overhead_cpu']:11.3f} {r['raw_cpu']:8.3f} {r['peak_memory_kb']:8d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--scenario", action="append", help="Only run this scenario (can be repeated)")
+    parser.add_argument("-o", "--output", help="Where to write the results (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare with the results in this file, exit with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change which counts as a regression (default: 0.2)")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or s["name"] in args.scenario]
+    results = run(scenarios)
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
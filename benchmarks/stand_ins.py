@@ -0,0 +1,188 @@
+""" Local stand-ins for provider HTTP APIs, for benchmarks and tests (no network access needed)
+
+- OpenAI compatible: GET /v1/models, POST /v1/chat/completions (streamed as server-sent events, or not)
+- Ollama: GET /api/tags, POST /api/chat (streamed as newline delimited JSON)
+
+The response is `length` characters of markdown, sent in chunks of `chunk_size` characters,
+`delay` seconds apart, after waiting `ttft` seconds. The first chat requests can fail instead, with the
+HTTP statuses in `errors` (e.g. [429, 503]), one each.
+
+    with StandInServer("ollama", chunk_size=4, delay=0.001) as server:
+        os.environ["OLLAMA_URL"] = server.url
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+SECTION = """## Section {n}
+
+Some explanation of step {n}, with *emphasis*, **bold text** and `inline code`.
+It goes on for a couple of lines so that paragraphs wrap in the terminal like a real answer would.
+
+- first point about {n}
+- second point, which is a bit longer than the first one
+- third point
+
+```python
+def step_{n}(items):
+    total = 0
+    for item in items:
+        total += item * {n}
+    return total
+```
+
+1. do this
+2. then that
+
+"""
+
+
+def sample_response(size):
+    """ `size` characters of markdown, like a long answer with code """
+    text = ""
+    n = 1
+    while len(text) < size:
+        text += SECTION.format(n=n)
+        n += 1
+    return text[:size]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    server: "StandInServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        data = data.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _chunks(self):
+        server = self.server
+        time.sleep(server.ttft)
+        text = server.response_text
+        for i in range(0, len(text), server.chunk_size):
+            if i and server.delay:
+                time.sleep(server.delay)
+            yield text[i:i + server.chunk_size]
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path, None))
+        if self.path == "/v1/models":
+            self._send_json({"object": "list", "data": [{"id": m, "object": "model", "created": 0, "owned_by": "stand-in"} for m in self.server.models]})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": m} for m in self.server.models]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        request = self._read_json()
+        self.server.requests.append(("POST", self.path, request))
+        if self.server.errors:
+            self._send_json({"error": {"message": "stand-in failure", "type": "server_error"}}, self.server.errors.pop(0))
+        elif self.path == "/v1/chat/completions":
+            self._openai_chat(request)
+        elif self.path == "/api/chat":
+            self._ollama_chat(request)
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _openai_chat(self, request):
+        model = request.get("model")
+        n_chunks = 0
+
+        def event(choices, usage=None):
+            return "data: " + json.dumps({"id": "chatcmpl-stand-in", "object": "chat.completion.chunk", "created": 0,
+                                          "model": model, "choices": choices, "usage": usage}) + "\n\n"
+
+        if not request.get("stream"):
+            text = "".join(self._chunks())
+            self._send_json({"id": "chatcmpl-stand-in", "object": "chat.completion", "created": 0, "model": model,
+                             "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                             "usage": {"prompt_tokens": 10, "completion_tokens": len(text) // 4, "total_tokens": 10 + len(text) // 4}})
+            return
+
+        self._start_stream("text/event-stream")
+        for chunk in self._chunks():
+            n_chunks += 1
+            self._write_chunk(event([{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]))
+        self._write_chunk(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if request.get("stream_options", {}).get("include_usage"):
+            self._write_chunk(event([], {"prompt_tokens": 10, "completion_tokens": n_chunks, "total_tokens": 10 + n_chunks}))
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_stream()
+
+    def _ollama_chat(self, request):
+        model = request.get("model")
+        start = time.perf_counter_ns()
+        n_chunks = 0
+        self._start_stream("application/x-ndjson")
+        for chunk in self._chunks():
+            n_chunks += 1
+            self._write_chunk(json.dumps({"model": model, "message": {"role": "assistant", "content": chunk}, "done": False}) + "\n")
+        self._write_chunk(json.dumps({"model": model, "message": {"role": "assistant", "content": ""}, "done": True,
+                                      "prompt_eval_count": 10, "eval_count": n_chunks,
+                                      "eval_duration": time.perf_counter_ns() - start}) + "\n")
+        self._end_stream()
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, kind="openai", chunk_size=4, delay=0.0, length=2000, ttft=0.0, models=None, errors=()):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.ttft = ttft
+        self.response_text = sample_response(length)
+        self.models = models or (["gpt-4o-mini", "gpt-4o"] if kind == "openai" else ["llama3.1:latest"])
+        self.requests = []
+        self.errors = list(errors)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1" if self.kind == "openai" else f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,83 @@
+import re
+import time
+
+import pytest
+
+from az.llm_provider import LLMProvider
+
+
+class EchoLLM(LLMProvider):
+    """ A provider which answers with `reply` (formatted with the client and the message), a word at a time,
+    or with the chunks of `reply` if it is a list, `delay` seconds apart
+    """
+    def __init__(self, name="echo", reply="echo {message}", models=None, primer=None, delay=0):
+        self.provider = name
+        self.models = models or [f"{name}-1", f"{name}-2"]
+        self.model = self.models[0]
+        self.reply = reply
+        self.delay = delay
+        self.primer = primer
+        self.new_chat()
+
+    def _stream(self, request):
+        message = self.messages[-1]["content"]
+        chunks = self.reply if isinstance(self.reply, list) else re.findall(r"\S+\s*", self.reply.format(client=self, message=message))
+        for chunk in chunks:
+            time.sleep(self.delay)
+            yield chunk
+
+
+@pytest.fixture
+def providers():
+    """ The providers azc is configured with in tests using `clients` (override or parametrize it to change them) """
+    return ["alpha", "beta"]
+
+
+@pytest.fixture
+def reply():
+    """ The reply of the `clients` (see EchoLLM) """
+    return "echo {message}"
+
+
+@pytest.fixture
+def clients(monkeypatch, providers, reply):
+    """ azc creates an EchoLLM for each of `providers` it uses: the list of the clients it created """
+    created = []
+
+    def factory(name):
+        created.append(EchoLLM(name, reply))
+        return created[-1]
+
+    monkeypatch.setattr('az.az.providers', providers)
+    monkeypatch.setattr('az.az.default_provider', lambda: None)
+    monkeypatch.setattr('az.az.provider_factory', factory)
+    return created
+
+
+@pytest.fixture(autouse=True)
+def models_cache(tmp_path, monkeypatch):
+    """ Keep the models lists fetched by tests out of the user's models cache """
+    monkeypatch.setattr("az.models.MODELS_CACHE_FILE", str(tmp_path / "models.json"))
+    monkeypatch.setattr("az.models._catalogs", {})
+    monkeypatch.setattr("az.models._caches", {})
+
+
+@pytest.fixture(autouse=True)
+def sessions_dir(tmp_path, monkeypatch):
+    """ Save the chats of tests in a temporary directory """
+    monkeypatch.setattr("az.sessions.SESSIONS_DIR", str(tmp_path / "sessions"))
+    return tmp_path / "sessions"
+
+
+@pytest.fixture(autouse=True)
+def search_db(tmp_path, monkeypatch):
+    """ Index the chats of tests in a temporary database """
+    monkeypatch.setattr("az.search.SEARCH_DB", str(tmp_path / "search.db"))
+    return tmp_path / "search.db"
+
+
+@pytest.fixture(autouse=True)
+def daemon_socket(tmp_path, monkeypatch):
+    """ Tests don't talk to a daemon which may be running, unless they start one on this socket """
+    monkeypatch.setattr("az.daemon.SOCKET_PATH", str(tmp_path / "azc.sock"))
+    return str(tmp_path / "azc.sock")
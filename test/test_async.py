@@ -0,0 +1,218 @@
+import asyncio
+import json
+
+import httpx
+
+from az.llm_provider import LLMProvider, TRUNCATED_MARK
+from az.ollama_provider import OllamaClient
+from az.openai_provider import OpenAIClient
+from az.anthropic_provider import AnthropicClient
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+class SyncOnlyLLM(LLMProvider):
+    def __init__(self):
+        self.provider = 'sync'
+        self.messages = []
+        self.primer = None
+
+    def chat(self, message):
+        self.messages.append({"role": "user", "content": message})
+        for word in message.split():
+            yield word
+        self.messages.append({"role": "assistant", "content": message})
+
+
+def test_default_achat_runs_chat():
+    client = SyncOnlyLLM()
+    assert asyncio.run(collect(client.achat("one two three"))) == ["one", "two", "three"]
+    assert client.n_user_messages() == 1
+
+
+def test_many_conversations_on_one_loop():
+    client = SyncOnlyLLM()
+
+    async def run_all():
+        conversations = [client.fork() for _ in range(50)]
+        return await asyncio.gather(*[collect(c.achat(f"hello {i}")) for i, c in enumerate(conversations)])
+
+    results = asyncio.run(run_all())
+    assert results == [["hello", str(i)] for i in range(50)]
+
+
+def mock_async_client(handler, **kwargs):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), **kwargs)
+
+
+def sse(events):
+    return "".join(f"event: {event}\ndata: {json.dumps(data)}\n\n" if event else f"data: {data}\n\n" for event, data in events)
+
+
+def test_ollama_achat(monkeypatch):
+    def handler(request):
+        assert request.url.path == "/api/chat"
+        assert json.loads(request.content)["messages"][-1] == {"role": "user", "content": "hi"}
+        lines = [{"message": {"content": "Hel"}}, {"message": {"content": "lo"}}, {"done": True}]
+        return httpx.Response(200, text="".join(json.dumps(line) + "\n" for line in lines))
+
+    monkeypatch.setenv("OLLAMA_URL", "http://ollama.test")
+    monkeypatch.setattr(OllamaClient, "list_models", lambda self: ["llama3:latest"])
+    monkeypatch.setattr("az.transport._clients", {"httpx-async": mock_async_client(handler)})
+    client = OllamaClient(primer="be brief")
+
+    assert asyncio.run(collect(client.achat("hi"))) == ["Hel", "lo"]
+    assert client.messages[-1] == {"role": "assistant", "content": "Hello"}
+    assert client.n_user_messages() == 1
+
+
+def test_openai_achat(monkeypatch):
+    from openai import AsyncOpenAI
+
+    def chunk(content):
+        return json.dumps({"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+                           "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]})
+
+    def handler(request):
+        assert json.loads(request.content)["messages"][-1] == {"role": "user", "content": "hi"}
+        body = sse([(None, chunk("Hel")), (None, chunk("lo")), (None, "[DONE]")])
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    def list_models(self):
+        self.models = ["gpt-4o-mini"]
+        return self.models
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(OpenAIClient, "list_models", list_models)
+    client = OpenAIClient()
+    client.async_client = AsyncOpenAI(base_url="http://openai.test/v1", http_client=mock_async_client(handler))
+
+    assert asyncio.run(collect(client.achat("hi"))) == ["Hel", "lo"]
+    assert client.messages[-1] == {"role": "assistant", "content": "Hello"}
+
+
+def test_anthropic_achat(monkeypatch):
+    from anthropic import AsyncAnthropic
+
+    message = {"id": "msg_1", "type": "message", "role": "assistant", "content": [], "model": "claude-3-5-sonnet-20240620",
+               "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 5, "output_tokens": 1}}
+
+    def delta(text):
+        return ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}})
+
+    def handler(request):
+        body = sse([
+            ("message_start", {"type": "message_start", "message": message}),
+            ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+            delta("Hel"),
+            delta("lo"),
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 2}}),
+            ("message_stop", {"type": "message_stop"}),
+        ])
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    client = AnthropicClient(primer="be brief")
+    client.async_client = AsyncAnthropic(base_url="http://anthropic.test", http_client=mock_async_client(handler))
+
+    assert asyncio.run(collect(client.achat("hi"))) == ["Hel", "lo"]
+    assert client.messages == [
+        {"role": "user", "content": "be brief\n\nhi"},
+        {"role": "assistant", "content": "Hello"},
+    ]
+
+
+async def first_chunk_then_disconnect(chunks):
+    first = await chunks.__anext__()
+    await chunks.aclose()
+    return first
+
+
+def test_achat_cut_short_keeps_what_was_received(monkeypatch):
+    def handler(request):
+        lines = [{"message": {"content": "Hel"}}, {"message": {"content": "lo"}}, {"done": True}]
+        return httpx.Response(200, text="".join(json.dumps(line) + "\n" for line in lines))
+
+    monkeypatch.setenv("OLLAMA_URL", "http://ollama.test")
+    monkeypatch.setattr(OllamaClient, "list_models", lambda self: ["llama3:latest"])
+    monkeypatch.setattr("az.transport._clients", {"httpx-async": mock_async_client(handler)})
+    client = OllamaClient(primer="be brief")
+    assert asyncio.run(first_chunk_then_disconnect(client.achat("hi"))) == "Hel"
+    assert client.messages[1:] == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "Hel" + TRUNCATED_MARK}]
+
+    class StreamingLLM(LLMProvider):  # without an async client: achat() runs chat() on a worker thread
+        def __init__(self):
+            self.provider = 'streaming'
+            self.models = ['streaming-1']
+            self.model = 'streaming-1'
+            self.messages = []
+            self.primer = None
+
+        def _stream(self, request):
+            yield from request[-1]["content"].split()
+
+    client = StreamingLLM()
+    assert asyncio.run(first_chunk_then_disconnect(client.achat("one two"))) == "one"
+    assert client.messages == [{"role": "user", "content": "one two"}, {"role": "assistant", "content": "one" + TRUNCATED_MARK}]
+
+
+def test_openai_achat_closes_the_upstream_response_on_disconnect(monkeypatch):
+    from openai import AsyncOpenAI
+    closed = []
+
+    class Upstream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for content in ("Hel", "lo", "there"):
+                chunk = {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+                         "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+
+        async def aclose(self):
+            closed.append(True)
+
+    def handler(request):
+        return httpx.Response(200, stream=Upstream(), headers={"content-type": "text/event-stream"})
+
+    def list_models(self):
+        self.models = ["gpt-4o-mini"]
+        return self.models
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(OpenAIClient, "list_models", list_models)
+    client = OpenAIClient()
+    client.async_client = AsyncOpenAI(base_url="http://openai.test/v1", http_client=mock_async_client(handler))
+
+    assert asyncio.run(first_chunk_then_disconnect(client.achat("hi"))) == "Hel"
+    assert closed
+
+
+def test_gemini_achat_cancels_the_request_on_disconnect(monkeypatch):
+    import google.generativeai as genai
+    from az.gemini_provider import GeminiClient
+    cancelled = []
+
+    class Call:
+        def cancel(self):
+            cancelled.append(True)
+
+    class Response:
+        _iterator = Call()
+
+        async def __aiter__(self):
+            for text in ("Bon", "jour"):
+                yield type("Chunk", (), {"text": text})
+
+    class FakeModel:
+        def __init__(self, model_name, system_instruction):
+            pass
+
+        async def generate_content_async(self, contents, stream):
+            return Response()
+
+    monkeypatch.setattr(genai, "GenerativeModel", FakeModel)
+    client = GeminiClient()
+    assert asyncio.run(first_chunk_then_disconnect(client.achat("hi"))) == "Bon"
+    assert cancelled
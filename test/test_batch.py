@@ -0,0 +1,121 @@
+import io
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from az.az import main
+from az.batch import read_prompts, run_batch, write_results
+from conftest import EchoLLM
+
+
+class SleepyLLM(EchoLLM):
+    """ Echoes the prompt back, first sleeping for that many seconds if the prompt is a number """
+    def __init__(self):
+        super().__init__("echo", "{message} ({client.messages.n_user})", models=['echo-1'])
+        # shared by the forks of this client
+        self.lock = threading.Lock()
+        self.running = {"now": 0, "max": 0}
+
+    def _stream(self, request):
+        with self.lock:
+            self.running["now"] += 1
+            self.running["max"] = max(self.running["max"], self.running["now"])
+        try:
+            message = self.messages[-1]["content"]
+            if message == "fail":
+                raise RuntimeError("boom")
+            if message.replace('.', '').isdigit():
+                time.sleep(float(message))
+            yield from super()._stream(request)
+        finally:
+            with self.lock:
+                self.running["now"] -= 1
+
+
+def test_read_prompts():
+    lines = ["hello\n", "\n", '{"prompt": "second", "label": "x"}\n', '{"id": "a", "prompt": "third"}']
+    assert list(read_prompts(lines)) == [
+        {"id": 1, "prompt": "hello"},
+        {"id": 3, "prompt": "second", "label": "x"},
+        {"id": "a", "prompt": "third"},
+    ]
+
+
+def test_read_prompts_requires_prompt_field():
+    assert list(read_prompts(['{"text": "no prompt"}', '{braces} explain'])) == [
+        {"id": 1, "text": "no prompt", "error": 'line 1: JSON input must have a "prompt" field'},
+        {"id": 2, "prompt": "{braces} explain"},
+    ]
+
+
+def test_invalid_lines_dont_stop_the_batch():
+    results = list(run_batch(SleepyLLM(), read_prompts(['{"text": "no prompt"}', '{braces} explain', '0.0'])))
+    assert "error" in results[0]
+    assert [r["response"] for r in results[1:]] == ["{braces} explain (1)", "0.0 (1)"]
+
+
+def test_results_in_input_order():
+    client = SleepyLLM()
+    prompts = [{"id": i, "prompt": p} for i, p in enumerate(["0.2", "0.0", "0.1"])]
+    results = list(run_batch(client, prompts, workers=3))
+    assert [r["id"] for r in results] == [0, 1, 2]
+    # each prompt runs in its own conversation
+    assert [r["response"] for r in results] == ["0.2 (1)", "0.0 (1)", "0.1 (1)"]
+    assert client.messages == []
+
+
+def test_results_in_completion_order():
+    prompts = [{"id": i, "prompt": p} for i, p in enumerate(["0.3", "0.0", "0.15"])]
+    results = list(run_batch(SleepyLLM(), prompts, workers=3, ordered=False))
+    assert [r["id"] for r in results] == [1, 2, 0]
+
+
+def test_workers_are_bounded():
+    client = SleepyLLM()
+    prompts = [{"id": i, "prompt": "0.02"} for i in range(20)]
+    results = list(run_batch(client, prompts, workers=3))
+    assert len(results) == 20
+    assert client.running["max"] == 3
+
+
+def test_errors_are_reported_per_prompt():
+    prompts = [{"id": 1, "prompt": "fail"}, {"id": 2, "prompt": "ok"}]
+    out = io.StringIO()
+    n_errors = write_results(run_batch(SleepyLLM(), prompts), out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert n_errors == 1
+    assert lines[0] == {"id": 1, "prompt": "fail", "error": "RuntimeError: boom"}
+    assert lines[1]["response"] == "ok (1)"
+
+
+@pytest.fixture
+def configured_provider(monkeypatch):
+    monkeypatch.setattr('az.az.providers', ['echo'])
+
+
+def test_prompts_file(configured_provider, tmp_path):
+    prompts_file = tmp_path / "prompts.txt"
+    prompts_file.write_text("first\nsecond\n")
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('az.az.provider_factory', return_value=SleepyLLM()), \
+         patch('sys.argv', ['azc', '--prompts', str(prompts_file), '--workers', '2']):
+        assert main() == 0
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert results == [
+        {"id": 1, "prompt": "first", "response": "first (1)"},
+        {"id": 2, "prompt": "second", "response": "second (1)"},
+    ]
+
+
+def test_prompts_from_stdin(configured_provider):
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('sys.stdin', io.StringIO('{"prompt": "fail"}\n')), \
+         patch('az.az.provider_factory', return_value=SleepyLLM()), \
+         patch('sys.argv', ['azc', '--prompts', '-']):
+        assert main() == 1
+    assert json.loads(out.getvalue())["error"] == "RuntimeError: boom"
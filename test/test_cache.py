@@ -1,5 +1,8 @@
+import json
+import multiprocessing
 import pytest
 import tempfile
+import time
 import os
 
 
@@ -18,6 +21,12 @@ def test_set_and_get(file_cache):
     file_cache.set('test_key', ['value1', 'value2'])
     assert file_cache.get('test_key') == {'value1', 'value2'}
 
+def test_ordered(file_cache):
+    file_cache.set('test_key', ['value2', 'value1'])
+    assert file_cache.ordered('test_key') == ['value2', 'value1']
+    assert FileCache(file_cache.cache_file).ordered('test_key') == ['value2', 'value1']
+    assert file_cache.ordered('missing') == []
+
 def test_update(file_cache):
     file_cache.set('test_key', ['value1'])
     file_cache.update('test_key', ['value2', 'value3'])
@@ -33,4 +42,93 @@ def test_persistence(file_cache):
     cache_file = file_cache.cache_file
     del file_cache
     new_cache = FileCache(cache_file)
-    assert new_cache.get('test_key') == {'value1'}
\ No newline at end of file
+    assert new_cache.get('test_key') == {'value1'}
+
+def test_ttl(file_cache, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+    file_cache.set('fresh', ['value1'])
+    file_cache.set('short', ['value1'], ttl=10)
+    assert file_cache.is_stale('missing')
+    assert not file_cache.is_stale('short')
+
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert file_cache.is_stale('short')
+    assert not file_cache.is_stale('fresh')
+    # stale values are still served until they are refreshed
+    assert file_cache.get('short') == {'value1'}
+    file_cache.set('short', ['value2'], ttl=10)
+    assert not file_cache.is_stale('short')
+
+
+def test_default_ttl_is_persisted(file_cache, monkeypatch):
+    cache = FileCache(file_cache.cache_file, ttl=60)
+    cache.set('test_key', ['value1'])
+    later = time.time() + 61
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert FileCache(file_cache.cache_file).is_stale('test_key')
+
+
+def test_deferred_writes(file_cache):
+    file_cache.set('test_key', ['value1'])
+    mtime = os.stat(file_cache.cache_file).st_mtime_ns
+    with file_cache.deferred():
+        file_cache.update('test_key', ['value2'])
+        file_cache.set('other_key', ['value3'])
+        assert file_cache.get('test_key') == {'value1', 'value2'}
+        assert os.stat(file_cache.cache_file).st_mtime_ns == mtime
+    assert FileCache(file_cache.cache_file).get('test_key') == {'value1', 'value2'}
+    assert FileCache(file_cache.cache_file).get('other_key') == {'value3'}
+
+
+def test_no_autoflush(file_cache):
+    cache = FileCache(file_cache.cache_file, autoflush=False)
+    cache.set('test_key', ['value1'])
+    assert FileCache(file_cache.cache_file).get('test_key') == set()
+    cache.flush()
+    assert FileCache(file_cache.cache_file).get('test_key') == {'value1'}
+
+
+def test_reads_original_format(file_cache):
+    with open(file_cache.cache_file, 'w') as f:
+        json.dump({'openai': ['gpt-4', 'gpt-4o-mini']}, f)
+    cache = FileCache(file_cache.cache_file)
+    assert cache.get('openai') == {'gpt-4', 'gpt-4o-mini'}
+    assert not cache.is_stale('openai')
+
+
+def test_writers_do_not_lose_updates(file_cache):
+    other = FileCache(file_cache.cache_file)
+    file_cache.update('test_key', ['value1'])
+    other.update('test_key', ['value2'])
+    other.set('other_key', ['value3'])
+    file_cache.update('test_key', ['value4'])
+    assert file_cache.get('test_key') == {'value1', 'value2', 'value4'}
+    assert file_cache.get('other_key') == {'value3'}
+
+
+def hammer(cache_file, worker, n):
+    cache = FileCache(cache_file)
+    for i in range(n):
+        if i % 5 == 0:
+            with cache.deferred():
+                cache.update('shared', [f'{worker}-{i}'])
+                cache.set(f'worker-{worker}', [str(i)])
+        else:
+            cache.update('shared', [f'{worker}-{i}'])
+        # whatever we read must be a complete file
+        assert len(FileCache(cache_file).get('shared')) > 0
+
+
+@pytest.mark.slow
+def test_many_processes(file_cache):
+    n_workers, n = 8, 40
+    file_cache.set('shared', ['initial'])
+    with multiprocessing.get_context('spawn').Pool(n_workers) as pool:
+        pool.starmap(hammer, [(file_cache.cache_file, worker, n) for worker in range(n_workers)])
+
+    cache = FileCache(file_cache.cache_file)
+    assert cache.get('shared') == {'initial'} | {f'{w}-{i}' for w in range(n_workers) for i in range(n)}
+    for worker in range(n_workers):
+        assert cache.get(f'worker-{worker}') == {str(n - 5)}
+    assert os.listdir(os.path.dirname(file_cache.cache_file)) == ['test_cache.json']
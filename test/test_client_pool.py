@@ -0,0 +1,90 @@
+import io
+from unittest.mock import patch
+
+import pytest
+
+from az.az import main
+from az.llm_provider import LLMProvider
+from az.providers import ClientPool
+
+
+class NamedLLM(LLMProvider):
+    def __init__(self, name):
+        self.provider = name
+        self.models = [f'{name}-1']
+        self.model = f'{name}-1'
+        self.primer = None
+        self.new_chat()
+
+    def chat(self, message):
+        self.messages.append({"role": "user", "content": message})
+        yield f"{self.provider}: {message}"
+        self.messages.append({"role": "assistant", "content": f"{self.provider}: {message}"})
+
+
+def test_clients_are_reused():
+    created = []
+    pool = ClientPool(lambda name: created.append(name) or NamedLLM(name))
+    a, a_created = pool.get("a")
+    b, _ = pool.get("b")
+    again, again_created = pool.get("a")
+    assert again is a
+    assert (a_created, again_created) == (True, False)
+    assert created == ["a", "b"]
+
+
+def test_idle_clients_are_evicted(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("az.providers.time.monotonic", lambda: now[0])
+    pool = ClientPool(NamedLLM, idle_timeout=60)
+    pool.get("a")
+    now[0] = 10
+    pool.get("b")   # a was used until now
+    now[0] = 65
+    pool.get("b")
+    assert "a" in pool
+    now[0] = 71
+    pool.get("b")
+    assert "a" not in pool
+    now[0] = 1000
+    pool.get("b")
+    assert "b" in pool  # the current client is never evicted
+
+
+def test_evicted_clients_are_let_go(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("az.providers.time.monotonic", lambda: now[0])
+    evicted = []
+    pool = ClientPool(NamedLLM, idle_timeout=60, on_evict=evicted.append)
+    a, _ = pool.get("a")
+    pool.get("b")
+    now[0] = 100
+    pool.get("b")
+    assert evicted == [a]
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    created = []
+
+    def factory(hint):
+        created.append(hint)
+        return NamedLLM(hint)
+
+    monkeypatch.setattr('az.az.providers', ['alpha', 'beta'])
+    monkeypatch.setattr('az.az.default_provider', lambda: None)
+    monkeypatch.setattr('az.az.provider_factory', factory)
+    return created
+
+
+def test_switching_back_keeps_the_conversation(clients):
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('prompt_toolkit.PromptSession.prompt', side_effect=["one", "p be", "two", "p al", "three", "n", "p beta", EOFError]), \
+         patch('sys.argv', ['azc']):
+        main()
+    assert clients == ["alpha", "beta"]
+    output = out.getvalue()
+    assert "alpha:alpha-1 (2nd message)" in output
+    assert "using: alpha:alpha-1 (continuing the chat" in output
+    assert "using: beta:beta-1 (continuing the chat" in output
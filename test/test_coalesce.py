@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from az.coalesce import CoalescedStream, coalesce
+
+
+def timed(chunks, delay=0.0, first_delay=0.0):
+    time.sleep(first_delay)
+    for chunk in chunks:
+        yield chunk
+        time.sleep(delay)
+
+
+def test_fast_chunks_are_joined_for_a_slow_consumer():
+    stream = CoalescedStream(timed("x" * 200), max_size=10_000, max_delay=0.01)
+    received = []
+    for chunk in stream:
+        received.append(chunk)
+        time.sleep(0.02)  # rendering
+    assert "".join(received) == "x" * 200
+    assert len(received) < 20
+
+
+def test_chunks_are_handed_over_by_size_and_time():
+    stream = CoalescedStream(timed(["ab"] * 20, delay=0.005), max_size=6, max_delay=10)
+    chunks = list(stream)
+    assert chunks[0] == "ab"  # the first chunk right away
+    assert all(len(chunk) >= 6 for chunk in chunks[1:-1])
+    assert "".join(chunks) == "ab" * 20
+
+    start = time.monotonic()
+    chunks = list(CoalescedStream(timed(["a"] * 3, delay=0.05), max_size=1000, max_delay=0.01))
+    assert chunks == ["a", "a", "a"]
+    assert time.monotonic() - start < 0.5
+
+
+def test_errors_come_after_the_text_received_before_them():
+    def failing():
+        yield "partial"
+        raise ConnectionError("gone")
+
+    stream = coalesce(failing(), {"stream": {"coalesce-delay": 0}})
+    assert next(stream) == "partial"
+    with pytest.raises(ConnectionError):
+        next(stream)
+
+
+def test_close_closes_the_source():
+    closed = []
+
+    def source():
+        try:
+            while True:
+                yield "chunk"
+                time.sleep(0.01)
+        finally:
+            closed.append(True)
+
+    stream = CoalescedStream(source())
+    assert next(stream).startswith("chunk")
+    stream.close()
+    assert closed == [True]
+
+    never_read = CoalescedStream(source())
+    never_read.close()
+    assert never_read.chunks.gi_frame is None  # closed, without being started
+
+
+def test_close_aborts_a_stalled_read():
+    aborted = threading.Event()
+    closed = []
+
+    def stalled():
+        try:
+            yield "partial"
+            if aborted.wait(10):  # e.g. waiting on the socket, until the response is aborted
+                raise ConnectionError("aborted")
+        finally:
+            closed.append(True)
+
+    stream = CoalescedStream(stalled(), abort=aborted.set)
+    assert next(stream) == "partial"
+    start = time.monotonic()
+    stream.close()
+    assert time.monotonic() - start < 0.5
+    assert closed == [True]
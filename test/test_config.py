@@ -1,3 +1,4 @@
+import os
 import pytest
 from az.config import load_config, default_provider, default_model
 
@@ -69,3 +70,62 @@ def test_load_config_with_invalid_json(config_file, tmp_path):
     with pytest.raises(ValueError):  # Assuming the function raises a ValueError for invalid JSON
         load_config(str(temp_config))
 
+
+
+from az import config as config_module
+from az.config import Config, config_paths
+
+
+@pytest.fixture
+def no_check_interval(monkeypatch):
+    monkeypatch.setattr(config_module, "CHECK_INTERVAL", 0)
+
+
+def test_config_paths_precedence(tmp_path):
+    paths = config_paths({"XDG_CONFIG_HOME": str(tmp_path / "xdg"), "XDG_CONFIG_DIRS": "/etc/a:/etc/b"}, cwd=str(tmp_path))
+    assert paths[:2] == ["/etc/b/azc/config.json", "/etc/a/azc/config.json"]
+    assert paths[-2:] == [str(tmp_path / "xdg" / "azc" / "config.json"), str(tmp_path / "config.json")]
+
+
+def test_config_files_are_merged(tmp_path):
+    user, project = tmp_path / "user.json", tmp_path / "project.json"
+    user.write_text('{"default-provider": "ollama", "openai": {"model": "gpt-4o", "summary-model": "gpt-4o-mini"}}')
+    project.write_text('{"openai": {"model": "o1"}}')
+    config = Config([str(user), str(tmp_path / "missing.json"), str(project)])
+    assert config["default-provider"] == "ollama"
+    assert config["openai"] == {"model": "o1", "summary-model": "gpt-4o-mini"}
+
+
+def test_config_is_read_once(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    path.write_text('{"default-provider": "ollama"}')
+    config = Config([str(path)])
+    reads = []
+    monkeypatch.setattr(config_module, "load_config", lambda filename: reads.append(filename) or {"default-provider": "ollama"})
+    for _ in range(100):
+        assert config.get("default-provider") == "ollama"
+    assert len(reads) == 1
+
+
+def test_config_reloads_when_changed(tmp_path, no_check_interval):
+    path = tmp_path / "config.json"
+    path.write_text('{"default-provider": "ollama"}')
+    config = Config([str(path)])
+    assert config["default-provider"] == "ollama"
+
+    path.write_text('{"default-provider": "gemini"}')
+    os.utime(path, ns=(0, 1))  # make sure the mtime changes, whatever the file system's resolution
+    assert config["default-provider"] == "gemini"
+
+    path.write_text('{"default-provider": ')
+    os.utime(path, ns=(0, 2))
+    assert config["default-provider"] == "gemini"  # the last good config
+    assert isinstance(config.error, ValueError)
+
+    path.unlink()
+    assert config.get("default-provider") is None
+
+
+def test_shared_config(monkeypatch):
+    monkeypatch.setattr(config_module, "_config", None)
+    assert load_config() is config_module.get_config()
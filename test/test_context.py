@@ -0,0 +1,198 @@
+from unittest.mock import patch
+
+from az import context
+from az.context import Conversation, Message, budget
+from conftest import EchoLLM
+
+
+def turn(n, size=400):
+    return [{"role": "user", "content": f"question {n} " + "x" * size}, {"role": "assistant", "content": f"answer {n} " + "y" * size}]
+
+
+class RecordingLLM(EchoLLM):
+    """ Echoes the messages back (and summarizes them as SUMMARY), and keeps the requests it got """
+    def __init__(self, config={}, primer="be brief"):
+        self.config = config
+        super().__init__("echo", "{message}", models=['echo-1', 'cheap-1'], primer=primer)
+        self.requests = []
+
+    def _request(self, message):
+        request = super()._request(message)
+        self.requests.append((self.model, list(self.context_messages())))
+        return request
+
+    def _stream(self, request):
+        if self.messages[-1]["content"].startswith("Summarize"):
+            yield "SUMMARY"
+        else:
+            yield from super()._stream(request)
+
+
+def test_counts_as_messages_are_added():
+    conversation = Conversation([{"role": "system", "content": "be brief"}])
+    for n in range(3):
+        conversation.extend(turn(n))
+    assert conversation.n_user == 3
+    assert conversation.tokens == sum(context.estimate_tokens(m["content"]) for m in conversation)
+    conversation.pop()
+    assert conversation.n_user == 3 and len(conversation) == 6
+
+
+def test_fit_keeps_primer_and_recent_turns():
+    conversation = Conversation([{"role": "system", "content": "be brief"}])
+    for n in range(10):
+        conversation.extend(turn(n))
+    evicted = conversation.fit(budget=600, keep_turns=2)
+    assert conversation[0] == {"role": "system", "content": "be brief"}
+    assert [m["content"].split()[1] for m in conversation[1::2]] == ["8", "9"]
+    assert len(evicted) == 16
+    assert conversation.n_user == 10
+    assert conversation.fit(budget=600) == []
+
+
+def test_fit_evicts_only_as_much_as_needed():
+    conversation = Conversation()
+    for n in range(4):
+        conversation.extend(turn(n))
+    conversation.fit(budget=conversation.tokens - 10, keep_turns=1)
+    assert conversation[0]["content"].startswith("question 1")
+
+
+def test_budget_by_model():
+    config = {"context": {"budget": 1000, "budgets": {"llama3": 4000, "llama3.1": 6000}}}
+    assert budget(config, "llama3.1:latest") == 6000
+    assert budget(config, "llama3:latest") == 4000
+    assert budget(config, "mistral") == 1000
+    assert budget({}, "gpt-4o-mini") == context.DEFAULT_BUDGETS["gpt-4o"]
+
+
+def test_requests_stay_within_budget():
+    client = RecordingLLM({"context": {"budget": 500}})
+    for n in range(20):
+        list(client.chat(f"message {n} " + "z" * 400))
+    model, sent = client.requests[-1]
+    assert sent[0]["role"] == "system"
+    assert sum(context.estimate_tokens(m["content"]) for m in sent) <= 500
+    assert client.n_user_messages() == 20
+
+
+def test_evicted_turns_are_summarized():
+    client = RecordingLLM({"context": {"budget": 500, "summarize": True}})
+    summarizer = RecordingLLM()
+    summarizer.model = "cheap"
+    with patch.object(RecordingLLM, "summarizer", return_value=summarizer):
+        for n in range(3):
+            list(client.chat(f"message {n} " + "z" * 800))
+    context._summaries.shutdown(wait=True)
+    context._summaries = None
+
+    assert summarizer.requests[0][1][-1]["content"].startswith("Summarize")
+    assert client.messages.summary == "SUMMARY"
+    sent = client.context_messages()
+    assert sent[0]["content"] == "be brief"
+    assert sent[1] == {"role": "system", "content": context.SUMMARY_PREFIX + "SUMMARY"}
+
+
+def test_hedged_requests_stay_within_budget():
+    from az.hedge import Policy, hedged_chat
+    client = RecordingLLM({"context": {"budget": 200, "keep-turns": 1, "summarize": True}})
+    backup = RecordingLLM()
+    summarizer = RecordingLLM()
+    with patch.object(RecordingLLM, "summarizer", return_value=summarizer):
+        for n in range(6):
+            list(hedged_chat(client, f"message {n} " + "z" * 300, Policy(["backup"], lambda name: backup)))
+    context._summaries.shutdown(wait=True)
+    context._summaries = None
+
+    assert client.messages.tokens <= 200
+    assert client.messages.summary == "SUMMARY"
+    assert len(summarizer.requests) == client.messages.evicted_turns == 5  # one for every turn evicted, none lost
+    assert client.n_user_messages() == 6
+
+
+def test_summarizer_uses_summary_model():
+    client = RecordingLLM({"echo": {"summary-model": "cheap"}})
+    list(client.chat("hi"))
+    summarizer = client.summarizer()
+    assert summarizer.model == "cheap-1"
+    assert summarizer.n_user_messages() == 0
+    assert client.model == "echo-1"
+
+
+def test_anthropic_primer_survives_eviction(monkeypatch):
+    from az.anthropic_provider import AnthropicClient
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    client = AnthropicClient({"context": {"budget": 300}}, primer="be brief")
+    for n in range(4):
+        client.record_turn(f"question {n} " + "x" * 400, "answer")
+    client._add_user_message("last")
+    client.fit_context()
+    sent = client.context_messages()
+    assert sent[0]["role"] == "user"
+    assert sent[0]["content"].startswith("be brief\n\n")
+    assert sent[-1] == {"role": "user", "content": "last"}
+
+
+def test_message_joins_its_chunks():
+    message = Message("assistant")
+    for chunk in ("one ", "two ", "three"):
+        message.append(chunk)
+    assert message.content == "one two three"
+    assert message._parts == ["one two three"]
+    assert message == {"role": "assistant", "content": "one two three"} == Message.of(message.as_dict())
+    assert message["role"] == "assistant" and message.tokens == context.estimate_tokens("one two three")
+
+
+def test_dicts_become_messages():
+    conversation = Conversation([{"role": "system", "content": "be brief"}])
+    conversation.append({"role": "user", "content": "hi"})
+    conversation[1:] = [{"role": "user", "content": "hello"}]
+    assert all(isinstance(m, Message) for m in conversation)
+    assert conversation.n_user == 1
+
+
+def test_only_new_messages_are_converted():
+    converted = []
+
+    class CountingLLM(RecordingLLM):
+        def wire_message(self, message):
+            converted.append(message.content)
+            return super().wire_message(message)
+
+    client = CountingLLM()
+    for n in range(3):
+        client.messages.append({"role": "user", "content": f"message {n}"})
+        client.wire_messages()
+        client.messages.append({"role": "assistant", "content": f"answer {n}"})
+    assert converted == ["be brief", "message 0", "answer 0", "message 1", "answer 1", "message 2"]
+    assert client.wire_messages()[-2:] == [{"role": "user", "content": "message 2"}, {"role": "assistant", "content": "answer 2"}]
+
+
+def test_gemini_conversation(monkeypatch):
+    import google.generativeai as genai
+    from az.gemini_provider import GeminiClient
+    requests = []
+
+    class FakeModel:
+        def __init__(self, model_name, system_instruction):
+            self.system_instruction = system_instruction
+
+        def generate_content(self, contents, stream):
+            requests.append((self.system_instruction, list(contents)))
+            response = [type("Chunk", (), {"text": text}) for text in ("Bon", "jour")]
+            return type("Response", (), {"__iter__": lambda self: iter(response), "usage_metadata": None})()
+
+    monkeypatch.setattr(genai, "GenerativeModel", FakeModel)
+    client = GeminiClient(primer="be brief")
+    client.record_turn("hi", "hello")
+    assert "".join(client.chat("in French?")) == "Bonjour"
+    assert requests == [("be brief", [{"role": "user", "parts": ["hi"]}, {"role": "model", "parts": ["hello"]},
+                                      {"role": "user", "parts": ["in French?"]}])]
+    assert client.n_user_messages() == 2
+    assert client.turns() == [("hi", "hello"), ("in French?", "Bonjour")]
+    assert client.history()[0] == {"role": "system", "content": "be brief"}
+    # the conversation can go on with another provider
+    other = RecordingLLM()
+    for message, response in client.turns():
+        other.record_turn(message, response)
+    assert other.messages[1:] == client.messages
@@ -0,0 +1,86 @@
+import argparse
+import io
+import json
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from az.az import main, make_responder
+from az.daemon import ConfigMismatch, Connection, Daemon, is_running
+from az.providers import ClientPool
+from conftest import EchoLLM
+
+
+@pytest.fixture
+def reply():
+    return "{client} says {message}"
+
+
+@pytest.fixture
+def daemon(clients, reply, daemon_socket):
+    args = argparse.Namespace(cache=None, cache_ttl=None, failover=None)
+    server = Daemon(daemon_socket, make_responder(args, ClientPool(lambda name: EchoLLM(name, reply))))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(argv):
+    out, err = io.StringIO(), io.StringIO()
+    with patch('sys.stdout', out), patch('sys.stderr', err), patch('sys.argv', ['azc'] + argv):
+        code = main()
+    return code, out.getvalue(), err.getvalue()
+
+
+def test_one_shot_prompts_go_to_the_daemon(daemon, clients):
+    code, out, err = run(['-b', '-p', 'be', '-m', '2', '--stats', 'hello there'])
+    assert (code, out) == (0, "beta:beta-2 says hello there\n")
+    assert json.loads(err)["model"] == "beta-2"
+    assert run(['-b', 'again'])[1] == "alpha:alpha-1 says again\n"
+    assert clients == []  # no client in the one-shot processes
+
+
+def test_daemon_errors(daemon):
+    code, out, err = run(['-b', '-m', 'gamma', 'hi'])
+    assert (code, out) == (1, "")
+    assert "gamma not found" in err
+
+
+def test_the_provider_and_model_are_chosen_by_the_callers_config(daemon, clients):
+    with patch('az.az.config', {"alpha": {"model": "2"}}):
+        assert run(['-b', 'hi'])[1] == "alpha:alpha-2 says hi\n"
+    assert clients == []
+
+
+def test_a_daemon_with_another_config_is_not_used(daemon, clients, daemon_socket):
+    with pytest.raises(ConfigMismatch), Connection(daemon_socket) as connection:
+        list(connection.chat({"prompt": "hi", "config": "of another project"}))
+    # the caller's config and then the daemon's
+    with patch('az.az.config_digest', side_effect=["caller", "daemon"]):
+        assert run(['-b', 'hi']) == (0, "alpha:alpha-1 says hi\n", "")
+    assert [client.provider for client in clients] == ["alpha"]  # answered in process
+
+
+def test_without_a_daemon_the_prompt_runs_in_process(clients, daemon_socket):
+    open(daemon_socket, "w").close()  # left behind by a daemon which is gone
+    assert run(['-b', 'hi'])[1] == "alpha:alpha-1 says hi\n"
+    assert [client.provider for client in clients] == ["alpha"]
+
+
+def test_one_daemon_at_a_time(daemon, daemon_socket):
+    assert is_running(daemon_socket)
+    with pytest.raises(RuntimeError):
+        Daemon(daemon_socket, None)
+
+
+def test_a_socket_of_another_user_is_not_used(daemon, clients, daemon_socket, monkeypatch):
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+    assert run(['-b', 'hi'])[1] == "alpha:alpha-1 says hi\n"
+    assert [client.provider for client in clients] == ["alpha"]  # answered in process, the prompt wasn't sent to the socket
+    with pytest.raises(RuntimeError, match="not a socket of this user"):
+        Daemon(daemon_socket, None)
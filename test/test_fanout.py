@@ -0,0 +1,113 @@
+import io
+import json
+import os
+import signal
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from az.az import main
+from az.fanout import Stream, fan_out, parse_targets
+from az.llm_provider import LLMProvider
+from az.providers import resolve_provider
+
+
+class SlowLLM(LLMProvider):
+    """ Answers every message with its name, after `delay` seconds """
+    def __init__(self, name, delay=0.0):
+        self.provider = name
+        self.models = [f'{name}-1', f'{name}-2']
+        self.model = f'{name}-1'
+        self.delay = delay
+        self.primer = None
+        self.new_chat()
+
+    def chat(self, message):
+        self.messages.append({"role": "user", "content": message})
+        time.sleep(self.delay)
+        yield f"{self.provider} says "
+        time.sleep(self.delay)
+        yield f"hi to {message}"
+        self.messages.append({"role": "assistant", "content": f"{self.provider} says hi to {message}"})
+
+
+def test_parse_targets():
+    assert parse_targets("openai, anthropic,ollama:llama3.1:latest", []) == [
+        ("openai", None), ("anthropic", None), ("ollama", "llama3.1:latest")]
+    assert parse_targets("", ["openai", "ollama"]) == [("openai", None), ("ollama", None)]
+    assert parse_targets("all", ["openai"]) == [("openai", None)]
+
+
+def test_streams_run_concurrently():
+    streams = [Stream(SlowLLM(name, delay=0.2)) for name in ("a", "b", "c")]
+    start = time.perf_counter()
+    fan_out(streams, "you")
+    assert time.perf_counter() - start < 0.8  # the sum of the latencies would be 1.2s
+    assert [s.response.text for s in streams] == ["a says hi to you", "b says hi to you", "c says hi to you"]
+    assert all(s.stats.ttft >= 0.2 and s.status().startswith("TTFT") for s in streams)
+
+
+def test_error_in_one_stream():
+    class FailingLLM(SlowLLM):
+        def chat(self, message):
+            raise ConnectionError("down")
+            yield
+
+    streams = [Stream(FailingLLM("a")), Stream(SlowLLM("b"))]
+    fan_out(streams, "you")
+    assert "down" in streams[0].status()
+    assert streams[1].response.text == "b says hi to you"
+
+
+def test_ctrl_c_stops_a_stalled_stream_at_once(monkeypatch):
+    from az import transport
+    from az.llm_provider import TRUNCATED_MARK
+    from az.openai_provider import OpenAIClient
+    from benchmarks.stand_ins import StandInServer
+    monkeypatch.setattr(transport, "_clients", {})
+    with StandInServer("openai", ttft=30) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+        stalled = OpenAIClient({"openai": {"model": "gpt-4o-mini"}})
+        streams = [Stream(stalled), Stream(SlowLLM("b"))]
+        threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT)).start()
+        start = time.monotonic()
+        with pytest.raises(KeyboardInterrupt):
+            fan_out(streams, "you")
+        assert time.monotonic() - start < 2
+    assert streams[0].truncated and not streams[0].error
+    assert stalled.messages[-2:] == [{"role": "user", "content": "you"}, {"role": "assistant", "content": TRUNCATED_MARK}]
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    clients = {"alpha": SlowLLM("alpha"), "beta": SlowLLM("beta")}
+    monkeypatch.setattr('az.az.providers', list(clients))
+    monkeypatch.setattr('az.az.default_provider', lambda: None)
+    monkeypatch.setattr('az.az.provider_factory', lambda hint: clients[resolve_provider(hint, list(clients))])
+    return clients
+
+
+def test_fan_out_flag(clients):
+    out, err = io.StringIO(), io.StringIO()
+    with patch('sys.stdout', out), patch('sys.stderr', err), \
+         patch('sys.argv', ['azc', '-b', '--stats', '-f', 'al,beta:beta-2', 'there']):
+        main()
+    assert "alpha says hi to there" in out.getvalue()
+    assert "beta says hi to there" in out.getvalue()
+    assert clients["beta"].model == "beta-2"
+    assert sorted(json.loads(line)["provider"] for line in err.getvalue().splitlines()) == ["alpha", "beta"]
+
+
+def test_fan_out_command_keeps_conversations(clients):
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('prompt_toolkit.PromptSession.prompt', side_effect=["f", "one", "two", "p alpha", "three", EOFError]), \
+         patch('sys.argv', ['azc']):
+        main()
+    assert clients["alpha"].n_user_messages() == 3
+    assert clients["beta"].n_user_messages() == 2
+    assert "beta says hi to two" in out.getvalue()
+    assert "beta says hi to three" not in out.getvalue()
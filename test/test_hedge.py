@@ -0,0 +1,180 @@
+import io
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from az import transport
+from az.az import main
+from az.hedge import Policy, hedged_chat, is_transient, retry_delay
+from az.llm_provider import LLMProvider, TRUNCATED_MARK
+from benchmarks.stand_ins import StandInServer
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class FakeLLM(LLMProvider):
+    """ Answers with its name after `ttft` seconds, or fails with `errors` (one per request) first """
+    def __init__(self, name, ttft=0.0, errors=()):
+        self.provider = name
+        self.models = [f'{name}-1']
+        self.model = f'{name}-1'
+        self.primer = "be brief"
+        self.ttft = ttft
+        self.errors = list(errors)
+        self.requests = []
+        self.new_chat()
+
+    def branch(self):
+        clone = super().branch()
+        clone.requests = self.requests  # shared, to count the requests of all the attempts
+        return clone
+
+    def chat(self, message):
+        self.messages.append({"role": "user", "content": message})
+        self.requests.append(self.history())
+        if self.errors:
+            raise self.errors.pop(0)
+        time.sleep(self.ttft)
+        for chunk in (f"{self.provider} ", "says ", f"hi to {message}"):
+            yield chunk
+        self.messages.append({"role": "assistant", "content": f"{self.provider} says hi to {message}"})
+        self.last_usage = {"output_tokens": 3}
+
+
+def policy(backups, **settings):
+    return Policy(list(backups), lambda name: backups[name], **{"backoff": 0.01, **settings})
+
+
+def test_is_transient():
+    assert is_transient(Unavailable())
+    assert is_transient(ConnectionError())
+    assert not is_transient(ValueError())
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    assert not is_transient(BadRequest())
+
+
+def test_retry_delay():
+    assert 0 <= retry_delay(Unavailable(), 3, 0.5) <= 2.0
+
+    class RateLimited(Exception):
+        class response:
+            headers = {"retry-after": "2"}
+
+    assert retry_delay(RateLimited(), 1, 0.5) == 2.0
+
+    class Unclear(Exception):
+        class response:
+            headers = {"retry-after": "soon"}
+
+    assert 0 <= retry_delay(Unclear(), 1, 0.5) <= 0.5  # neither seconds nor a date: backoff
+
+
+def test_primary_answers_in_time():
+    primary, backup = FakeLLM("a"), FakeLLM("b")
+    assert "".join(hedged_chat(primary, "you", policy({"b": backup}, hedge_after=1))) == "a says hi to you"
+    assert primary.turns() == [("you", "a says hi to you")]
+    assert backup.requests == []
+    assert "answered_by" not in primary.last_usage
+
+
+def test_hedge_to_a_faster_provider():
+    primary, backup = FakeLLM("a", ttft=1), FakeLLM("b")
+    primary.record_turn("before", "earlier answer")
+    start = time.perf_counter()
+    response = "".join(hedged_chat(primary, "you", policy({"b": backup}, hedge_after=0.1)))
+    assert time.perf_counter() - start < 0.8
+    assert response == "b says hi to you"
+    # the backup got the conversation so far, and its answer went into the client's conversation
+    assert backup.requests[0][-3:] == [{"role": "user", "content": "before"}, {"role": "assistant", "content": "earlier answer"},
+                                      {"role": "user", "content": "you"}]
+    assert primary.turns() == [("before", "earlier answer"), ("you", "b says hi to you")]
+    assert primary.last_usage == {"output_tokens": 3, "answered_by": "b:b-1"}
+
+
+def test_retry_then_fail_over():
+    primary, backup = FakeLLM("a", errors=[Unavailable(), Unavailable()]), FakeLLM("b")
+    assert "".join(hedged_chat(primary, "you", policy({"b": backup}, retries=1))) == "b says hi to you"
+    assert len(primary.requests) == 2
+    assert primary.turns() == [("you", "b says hi to you")]
+
+
+def test_retry_succeeds():
+    primary, backup = FakeLLM("a", errors=[Unavailable()]), FakeLLM("b")
+    assert "".join(hedged_chat(primary, "you", policy({"b": backup}, retries=1))) == "a says hi to you"
+    assert len(primary.requests) == 2
+    assert backup.requests == []
+
+
+def test_no_retry_of_other_errors():
+    primary, backup = FakeLLM("a", errors=[ValueError("bad request")]), FakeLLM("b")
+    assert "".join(hedged_chat(primary, "you", policy({"b": backup}, retries=3))) == "b says hi to you"
+    assert len(primary.requests) == 1
+
+
+def test_all_fail():
+    primary, backup = FakeLLM("a", errors=[Unavailable()]), FakeLLM("b", errors=[ValueError("down")])
+    with pytest.raises(ValueError, match="down"):
+        "".join(hedged_chat(primary, "you", policy({"b": backup}, retries=0)))
+    assert primary.turns() == [] and primary.n_user_messages() == 0
+
+
+def test_closed_midway():
+    primary = FakeLLM("a")
+    chunks = hedged_chat(primary, "you", policy({}))
+    assert next(chunks) == "a "
+    chunks.close()
+    assert primary.turns() == [("you", "a " + TRUNCATED_MARK)]
+
+
+def test_stall_timeout():
+    primary = FakeLLM("a", ttft=1)
+    with pytest.raises(TimeoutError):
+        "".join(hedged_chat(primary, "you", policy({}, hedge_after=None, stall_timeout=0.1)))
+
+
+def test_fail_over_between_stand_ins(monkeypatch):
+    monkeypatch.setattr(transport, "_clients", {})
+    with StandInServer("ollama", length=100, errors=[503, 503]) as ollama_server, StandInServer("openai", length=120) as openai_server:
+        monkeypatch.setenv("OLLAMA_URL", ollama_server.url)
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", openai_server.url)
+        from az.ollama_provider import OllamaClient
+        from az.openai_provider import OpenAIClient
+        client = OllamaClient(primer="be brief")
+        backup = Policy(["openai"], lambda name: OpenAIClient(primer="be brief"), retries=1, backoff=0.01)
+        assert "".join(hedged_chat(client, "hi", backup)) == openai_server.response_text
+    assert len([r for r in ollama_server.requests if r[1] == "/api/chat"]) == 2
+    assert client.turns() == [("hi", openai_server.response_text)]
+
+
+@pytest.mark.parametrize("kind", ["openai", "ollama"])
+def test_the_slower_request_is_aborted(monkeypatch, kind):
+    monkeypatch.setattr(transport, "_clients", {})
+    with StandInServer(kind, length=100, ttft=30) as server:
+        monkeypatch.setenv("OLLAMA_URL", server.url)
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+        from az.ollama_provider import OllamaClient
+        from az.openai_provider import OpenAIClient
+        client = (OpenAIClient if kind == "openai" else OllamaClient)(primer="be brief")
+        backups = policy({"b": FakeLLM("b")}, hedge_after=0.2)
+        assert "".join(hedged_chat(client, "you", backups)) == "b says hi to you"
+        start = time.monotonic()
+        while any(t.name == "azc-hedge" for t in threading.enumerate()) and time.monotonic() - start < 5:
+            time.sleep(0.01)
+        assert time.monotonic() - start < 2  # not left waiting for its first token
+
+
+def test_failover_flag():
+    clients = {"a": FakeLLM("a", errors=[ValueError("down")]), "b": FakeLLM("b")}
+    with patch('az.az.provider_factory', side_effect=lambda name: clients[name]), patch('az.az.providers', ['a', 'b']), \
+            patch('sys.argv', ['azc', '-b', '-p', 'a', '--failover', 'b', 'you']), patch('sys.stdout', new_callable=io.StringIO) as stdout:
+        main()
+    assert stdout.getvalue().strip() == "b says hi to you"
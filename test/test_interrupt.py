@@ -0,0 +1,115 @@
+import io
+import os
+import signal
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from az import transport
+from az.az import main
+from az.llm_provider import LLMProvider, TRUNCATED_MARK
+from az.stats import measure
+from benchmarks.stand_ins import StandInServer
+
+
+class InterruptedLLM(LLMProvider):
+    """ Gets a ctrl-c in the middle of its first response, while waiting for the rest of it """
+    def __init__(self, name):
+        self.provider = name
+        self.models = [f'{name}-1']
+        self.model = f'{name}-1'
+        self.primer = None
+        self.interrupt = True
+        self.aborts = threading.Event()
+        self.new_chat()
+
+    def _stream(self, request):
+        yield "partial "
+        if self.interrupt:
+            self.interrupt = False
+            self.ctrl_c()
+            # the read waits for the next chunk, until the response is aborted
+            if self.aborts.wait(10):
+                raise ConnectionError("aborted")
+        yield "answer"
+
+    def ctrl_c(self):
+        os.kill(os.getpid(), signal.SIGINT)
+
+    def abort(self):
+        super().abort()
+        self.aborts.set()
+
+
+def test_ctrl_c_stops_the_response_not_azc(monkeypatch):
+    client = InterruptedLLM('alpha')
+    monkeypatch.setattr('az.az.providers', ['alpha'])
+    monkeypatch.setattr('az.az.default_provider', lambda: None)
+    monkeypatch.setattr('az.az.provider_factory', lambda hint: client)
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('prompt_toolkit.PromptSession.prompt', side_effect=["first", "second", EOFError]), \
+         patch('sys.argv', ['azc']):
+        main()
+    assert "(interrupted)" in out.getvalue()
+    assert [m["content"] for m in client.messages] == ["first", "partial " + TRUNCATED_MARK, "second", "partial answer"]
+
+
+class StalledLLM(InterruptedLLM):
+    """ Stalls after its first chunk, and gets a ctrl-c meanwhile """
+    def ctrl_c(self):
+        threading.Timer(0.1, super().ctrl_c).start()
+
+
+def test_ctrl_c_on_a_stalled_response_stops_it_at_once(monkeypatch):
+    client = StalledLLM('alpha')
+    monkeypatch.setattr('az.az.providers', ['alpha'])
+    monkeypatch.setattr('az.az.default_provider', lambda: None)
+    monkeypatch.setattr('az.az.provider_factory', lambda hint: client)
+    start = time.monotonic()
+    with patch('sys.stdout', io.StringIO()), \
+         patch('prompt_toolkit.PromptSession.prompt', side_effect=["first", EOFError]), \
+         patch('sys.argv', ['azc']):
+        main()
+    assert time.monotonic() - start < 5
+    assert [m["content"] for m in client.messages] == ["first", "partial " + TRUNCATED_MARK]
+
+
+def test_closing_a_measured_stream_closes_the_response():
+    closed = []
+
+    def chunks():
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            closed.append(True)
+
+    measured = measure(LLMProvider(), chunks())
+    assert next(measured) == "a"
+    measured.close()
+    assert closed and measured.stats.end is not None
+
+
+@pytest.mark.parametrize("kind", ["openai", "ollama"])
+def test_closed_stream_keeps_the_partial_response(kind, monkeypatch):
+    monkeypatch.setattr(transport, "_clients", {})
+    with StandInServer(kind, chunk_size=4, delay=0.01, length=100) as server:
+        if kind == "openai":
+            monkeypatch.setenv("OPENAI_API_KEY", "test")
+            monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+            from az.openai_provider import OpenAIClient
+            client = OpenAIClient({"openai": {"model": "gpt-4o-mini"}})
+        else:
+            monkeypatch.setenv("OLLAMA_URL", server.url)
+            from az.ollama_provider import OllamaClient
+            client = OllamaClient()
+        response = client.chat("first")
+        partial = next(response) + next(response)
+        response.close()
+        assert client.messages[-1] == {"role": "assistant", "content": partial + TRUNCATED_MARK}
+        # the connection was given back, the chat goes on
+        assert "".join(client.chat("second")) == server.response_text
+        assert [m["role"] for m in client.messages[-4:]] == ["user", "assistant", "user", "assistant"]
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from az import models
+from az.cache import FileCache
+from benchmarks.stand_ins import StandInServer
+
+
+class SlowFetch:
+    """ A models list fetch which doesn't return until released """
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FileCache(str(tmp_path / "models.json"))
+
+
+def test_stale_models_are_served_while_refreshing(cache):
+    cache.set("p", ["old"])
+    fetch = SlowFetch(["new-b", "new-a"])
+    catalog = models.ModelCatalog("p", fetch, cache, ttl=0)
+
+    start = time.perf_counter()
+    listed = catalog.get()
+    assert time.perf_counter() - start < 0.5
+    assert listed == ["old"]
+    assert catalog.refreshing
+
+    fetch.release.set()
+    catalog.refresh(wait=True)
+    assert listed == ["new-b", "new-a"]  # updated in place, in the provider's order
+    assert cache.get("p") == {"new-a", "new-b"}
+
+
+def test_fresh_models_are_not_fetched(cache):
+    cache.set("p", ["m1"])
+    fetch = SlowFetch(["m2"])
+    assert models.ModelCatalog("p", fetch, cache).get() == ["m1"]
+    assert fetch.calls == 0
+
+
+def test_only_one_refresh_at_a_time(cache):
+    fetch = SlowFetch(["m"])
+    catalog = models.ModelCatalog("p", fetch, cache)
+    threads = {catalog.refresh() for _ in range(3)}
+    assert len(threads) == 1
+    fetch.release.set()
+    catalog.refresh(wait=True)
+    assert fetch.calls == 1
+
+
+def test_failed_refresh_keeps_the_models(cache):
+    cache.set("p", ["m1"], ttl=0)
+    fetch = SlowFetch(ConnectionError("offline"))
+    fetch.release.set()
+    catalog = models.ModelCatalog("p", fetch, cache)
+    catalog.refresh(wait=True)
+    assert catalog.get() == ["m1"]
+    assert isinstance(catalog.error, ConnectionError)
+
+
+def test_openai_startup_does_not_wait_for_models(monkeypatch):
+    with StandInServer("openai") as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+        from az.openai_provider import OpenAIClient
+        client = OpenAIClient({"openai": {"model": "gpt-4o-mini"}})
+        assert client.model == "gpt-4o-mini"
+        client.catalog.refresh(wait=True)
+        assert client.models == ["gpt-4o-mini", "gpt-4o"]
+        assert OpenAIClient().models is client.models  # the same catalog, no other fetch
+        assert [path for _, path, _ in server.requests] == ["/v1/models"]
+
+
+def test_ollama_waits_for_models_only_when_none_are_cached(monkeypatch):
+    with StandInServer("ollama") as server:
+        monkeypatch.setenv("OLLAMA_URL", server.url)
+        from az.ollama_provider import OllamaClient
+        assert OllamaClient().model == "llama3.1:latest"
+        monkeypatch.setattr("az.models._catalogs", {})
+        server.models = ["other:latest"]
+        client = OllamaClient()
+        assert client.model == "llama3.1:latest"  # from the cache
+        client.catalog.refresh(wait=True)
+        assert client.models == ["other:latest"]
+
+
+def test_ollama_default_is_its_first_model(monkeypatch):
+    with StandInServer("ollama", models=["zephyr:latest", "llama3.1:latest"]) as server:
+        monkeypatch.setenv("OLLAMA_URL", server.url)
+        from az.ollama_provider import OllamaClient
+        assert OllamaClient().model == "zephyr:latest"
+        monkeypatch.setattr("az.models._catalogs", {})
+        monkeypatch.setattr("az.models._caches", {})
+        assert OllamaClient().model == "zephyr:latest"  # from the cache file
+    assert len([path for _, path, _ in server.requests if path == "/api/tags"]) == 1
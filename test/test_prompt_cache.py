@@ -0,0 +1,105 @@
+import json
+
+import httpx
+
+from az.context import Conversation
+from az.stats import ChatStats, StatsReport
+from benchmarks.stand_ins import StandInServer
+
+
+def sse(events):
+    return "".join(f"event: {event}\ndata: {json.dumps(data)}\n\n" for event, data in events)
+
+
+def anthropic_response(text, usage):
+    message = {"id": "msg_1", "type": "message", "role": "assistant", "content": [], "model": "claude-3-5-sonnet-20240620",
+               "stop_reason": None, "stop_sequence": None, "usage": usage}
+    return sse([
+        ("message_start", {"type": "message_start", "message": message}),
+        ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+        ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}),
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 2}}),
+        ("message_stop", {"type": "message_stop"}),
+    ])
+
+
+def test_anthropic_caches_the_stable_prefix(monkeypatch):
+    import anthropic
+    from az.anthropic_provider import AnthropicClient
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        usage = {"input_tokens": 10, "output_tokens": 1, "cache_read_input_tokens": 1500, "cache_creation_input_tokens": 90}
+        return httpx.Response(200, text=anthropic_response("ok", usage), headers={"content-type": "text/event-stream"})
+
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    client = AnthropicClient(primer="be brief")
+    client.client = anthropic.Anthropic(base_url="http://anthropic.test", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    for message in ["one", "two", "three"]:
+        assert "".join(client.chat(message)) == "ok"
+
+    assert "prompt-caching" in requests[-1].headers["anthropic-beta"]
+    sent = json.loads(requests[-1].content)["messages"]
+    assert [isinstance(m["content"], list) for m in sent] == [True, False, True, False, True]
+    assert sent[0]["content"][0] == {"type": "text", "text": "be brief\n\none", "cache_control": {"type": "ephemeral"}}
+    # the history itself is left as it was
+    assert client.messages[0] == {"role": "user", "content": "be brief\n\none"}
+    assert client.last_usage == {"input_tokens": 1600, "output_tokens": 2, "cached_tokens": 1500}
+
+
+def test_anthropic_prompt_cache_can_be_turned_off(monkeypatch):
+    from az.anthropic_provider import AnthropicClient
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    client = AnthropicClient({"anthropic": {"prompt-cache": False}})
+    assert client._request("hi")["messages"] == [{"role": "user", "content": "hi"}]
+
+
+def test_openai_cached_tokens(monkeypatch):
+    from openai.types import CompletionUsage
+    from az.openai_provider import OpenAIClient
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    def list_models(self):
+        self.models = ["gpt-4o-mini"]
+
+    monkeypatch.setattr(OpenAIClient, "list_models", list_models)
+    client = OpenAIClient()
+    client._on_usage(CompletionUsage.construct(prompt_tokens=2000, completion_tokens=5, total_tokens=2005,
+                                               prompt_tokens_details={"cached_tokens": 1792}))
+    assert client.last_usage == {"input_tokens": 2000, "output_tokens": 5, "cached_tokens": 1792}
+
+
+def test_ollama_keeps_the_model_loaded(monkeypatch):
+    from az.ollama_provider import OllamaClient
+    with StandInServer("ollama") as server:
+        monkeypatch.setenv("OLLAMA_URL", server.url)
+        client = OllamaClient({"ollama": {"keep-alive": "1h"}})
+        "".join(client.chat("hi"))
+    method, path, payload = server.requests[-1]
+    assert (path, payload["keep_alive"]) == ("/api/chat", "1h")
+
+
+def test_eviction_leaves_headroom():
+    conversation = Conversation()
+    for n in range(10):
+        conversation.extend([{"role": "user", "content": f"question {n} " + "x" * 200}, {"role": "assistant", "content": "answer"}])
+    budget = conversation.tokens - 10
+    conversation.fit(budget, keep_turns=2, headroom=0.25)
+    assert conversation.tokens <= 0.75 * budget
+    # so the next turns fit without evicting (and changing the prefix) again
+    conversation.extend([{"role": "user", "content": "more " + "x" * 200}, {"role": "assistant", "content": "answer"}])
+    assert conversation.fit(budget, keep_turns=2, headroom=0.25) == []
+
+
+def test_cache_hits_in_stats():
+    report = StatsReport()
+    for cached in (0, 900):
+        stats = ChatStats("p", "m")
+        stats.on_end({"input_tokens": 1000, "output_tokens": 10, "cached_tokens": cached})
+        report.add(stats)
+    assert stats.summary().endswith("90% cached")
+    assert stats.as_dict()["cached_tokens"] == 900
+    [row] = report.rows()
+    assert row["cache_hit_rate"] == 0.45
+    assert "cached" not in ChatStats("p", "m").summary()
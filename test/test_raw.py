@@ -0,0 +1,69 @@
+import io
+import time
+from unittest.mock import patch
+
+import pytest
+
+from az.az import main
+from az.raw import RawWriter
+
+
+class CountingOut(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_writes_are_batched_by_size():
+    out = CountingOut()
+    writer = RawWriter(out, max_size=10, max_delay=60)
+    for chunk in ["abcd", "efgh", "ijkl", "m"]:
+        writer.write(chunk)
+    assert out.getvalue() == "abcdefghijkl"
+    assert out.flushes == 1
+    writer.close()
+    assert out.getvalue() == "abcdefghijklm"
+
+
+def test_writes_are_flushed_after_a_delay():
+    out = CountingOut()
+    writer = RawWriter(out, max_size=1000, max_delay=0.02)
+    writer.write("hello")
+    assert out.getvalue() == ""
+    time.sleep(0.2)
+    assert out.getvalue() == "hello"
+    writer.close()
+    assert out.flushes == 1
+
+
+@pytest.fixture
+def providers():
+    return ["chunks"]
+
+
+def run(argv, stdin=None):
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('sys.stdin', stdin or io.StringIO()), \
+         patch('sys.argv', ['azc'] + argv):
+        main()
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("reply", [["- one\n", "- two"]])
+def test_batch_to_a_pipe_is_raw(clients):
+    assert run(['-b', 'hi']) == "- one\n- two\n"
+
+
+@pytest.mark.parametrize("reply", [["ok"]])
+def test_prompt_from_stdin(clients):
+    assert run(['--raw'], stdin=io.StringIO("the question")) == "ok\n"
+    assert clients[0].messages[-2] == {"role": "user", "content": "the question"}
+
+
+@pytest.mark.parametrize("reply", [["- one\n", "- two"]])
+def test_no_raw_renders_markdown(clients):
+    assert "•" in run(['-b', '--no-raw', 'hi'])
@@ -0,0 +1,71 @@
+import io
+import random
+
+import pytest
+from rich.console import Console
+from rich.markdown import Markdown
+
+from az.render import StreamingMarkdown
+
+
+DOCUMENTS = [
+    "just a paragraph",
+    "para one\nstill para one\n\npara two",
+    "- a\n- b\n- c\n\nafter the list",
+    "1. x\n\n2. y\n\n3. z\n",
+    "- item one\n  continued\n\n  more of item one\n- item two\n  - nested\n  - nested too\n",
+    "Here is code:\n```python\nx = 1\n\n\ny = 2\n```\nand some text after it",
+    "# Heading\ntext\n\n> quote\n> more quote\n\n---\n\n| a | b |\n|---|---|\n| 1 | 2 |\n",
+    "~~~\n```not a fence close\n~~~\n\n**done**",
+]
+
+
+def render(renderable):
+    console = Console(file=io.StringIO(), width=60, color_system=None)
+    console.print(renderable)
+    # rich starts documents which begin with a list with an empty line
+    return console.file.getvalue().lstrip("\n")
+
+
+def stream(text, seed):
+    rnd = random.Random(seed)
+    response = StreamingMarkdown()
+    i = 0
+    while i < len(text):
+        n = rnd.randint(1, 7)
+        response.append(text[i:i + n])
+        i += n
+    return response
+
+
+@pytest.mark.parametrize("text", DOCUMENTS)
+@pytest.mark.parametrize("seed", range(5))
+def test_same_output_as_markdown(text, seed):
+    response = stream(text, seed)
+    assert response.text == text
+    assert render(response) == render(Markdown(text))
+
+
+def test_render_while_streaming():
+    text = DOCUMENTS[5]
+    response = StreamingMarkdown()
+    for i in range(len(text)):
+        response.append(text[i])
+        assert render(response) == render(Markdown(text[:i + 1]))
+
+
+def test_finished_blocks_are_not_parsed_again(monkeypatch):
+    response = StreamingMarkdown("para one\n\n- a\n- b\n\n```\ncode\n```\n")
+    render(response)
+
+    parsed = []
+    original_init = Markdown.__init__
+    def counting_init(self, markup, *args, **kwargs):
+        parsed.append(markup)
+        original_init(self, markup, *args, **kwargs)
+    monkeypatch.setattr(Markdown, "__init__", counting_init)
+
+    response.append("the open")
+    response.append(" tail")
+    render(response)
+    assert parsed == ["the open tail"]
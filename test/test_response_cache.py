@@ -0,0 +1,114 @@
+import os
+import time
+
+import pytest
+
+from az.llm_provider import LLMProvider
+from az.response_cache import ResponseCache, cached_chat
+
+
+class CountingLLM(LLMProvider):
+    def __init__(self, primer=None):
+        self.provider = 'counting'
+        self.models = ['small', 'large']
+        self.model = 'small'
+        self.primer = primer
+        self.calls = 0
+        self.new_chat()
+
+    def chat(self, message):
+        self.calls += 1
+        self.messages.append({"role": "user", "content": message})
+        response = f"answer {self.calls} to {message}"
+        for word in response.split(" "):
+            yield word + " "
+        self.messages.append({"role": "assistant", "content": response + " "})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "responses"))
+
+
+def ask(client, message, cache, **kwargs):
+    return "".join(cached_chat(client, message, cache, **kwargs))
+
+
+def test_hit_replays_response_and_records_turn(cache):
+    client = CountingLLM(primer="be brief")
+    first = ask(client, "hi", cache)
+
+    other = CountingLLM(primer="be brief")
+    assert ask(other, "hi", cache) == first
+    assert other.calls == 0
+    assert other.messages == client.messages
+
+
+def test_key_covers_the_request(cache):
+    client = CountingLLM()
+    ask(client, "hi", cache)
+    # a different model, primer or history is a different request
+    changed_model = CountingLLM()
+    changed_model.model = 'large'
+    ask(changed_model, "hi", cache)
+    changed_primer = CountingLLM(primer="be brief")
+    ask(changed_primer, "hi", cache)
+    # second message of the conversation
+    ask(client, "hi", cache)
+    assert (client.calls, changed_model.calls, changed_primer.calls) == (2, 1, 1)
+
+
+def test_key_covers_a_primer_sent_apart(cache):
+    # like Anthropic's, a primer which isn't part of the history
+    class SystemPromptLLM(CountingLLM):
+        def history(self):
+            return [m for m in super().history() if m["role"] != "system"]
+
+    ask(SystemPromptLLM(primer="be brief"), "hi", cache)
+    other = SystemPromptLLM(primer="be verbose")
+    ask(other, "hi", cache)
+    assert other.calls == 1
+
+
+def test_chunked_replay(cache):
+    client = CountingLLM()
+    response = ask(client, "hello", cache)
+    chunks = list(cached_chat(CountingLLM(), "hello", cache, chunk_size=4))
+    assert "".join(chunks) == response
+    assert all(len(chunk) <= 4 for chunk in chunks)
+
+
+def test_interrupted_response_is_not_cached(cache):
+    chunks = cached_chat(CountingLLM(), "hi", cache)
+    next(chunks)
+    chunks.close()
+    client = CountingLLM()
+    ask(client, "hi", cache)
+    assert client.calls == 1
+
+
+def test_ttl(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    ask(CountingLLM(), "hi", cache)
+    later = time.time() + 61
+    monkeypatch.setattr(time, 'time', lambda: later)
+    client = CountingLLM()
+    ask(client, "hi", cache)
+    assert client.calls == 1
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("key0", "x" * 100)
+    entry_size = os.path.getsize(os.path.join(str(tmp_path), "key0.json"))
+    cache = ResponseCache(str(tmp_path), max_size=entry_size * 10.5)
+    for i in range(10):
+        cache.put(f"key{i}", "x" * 100)
+        os.utime(os.path.join(str(tmp_path), f"key{i}.json"), (i, i))
+    assert cache.get("key0") is not None  # used now, so it's the most recent
+    cache.put("key10", "x" * 100)
+
+    remaining = {entry.name[:-len(".json")] for entry in os.scandir(str(tmp_path))}
+    assert "key0" in remaining and "key10" in remaining
+    assert "key1" not in remaining
+    assert sum(entry.stat().st_size for entry in os.scandir(str(tmp_path))) <= entry_size * 10.5 * 0.9
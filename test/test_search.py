@@ -0,0 +1,73 @@
+import argparse
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+
+from az.az import config, main, make_responder
+from az.config import digest
+from az.providers import ClientPool
+from az.search import SearchIndex, match_expression
+from conftest import EchoLLM
+
+
+def test_match_expression():
+    assert match_expression('what\'s "up" pyth*') == '"what\'s" """up""" "pyth"*'
+    assert match_expression("  * ") == ""
+
+
+def test_add_and_search(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    index.add("How do I reverse a list in Python?", "Use reversed(items) or items[::-1]", provider="openai", model="gpt-4o", latency=1.5)
+    index.add("Capital of France?", "Paris", provider="anthropic", model="claude", session="s1")
+    index.flush()
+    results = index.search("revers* python")
+    assert [r["prompt"] for r in results] == ["How do I reverse a list in Python?"]
+    assert (results[0]["model"], results[0]["latency"]) == ("gpt-4o", 1.5)
+    assert results[0]["snippet"] == "Use **reversed**(items) or items[::-1]"
+    assert index.search("france")[0]["snippet"] == "Capital of **France**?"
+    assert index.search("nothing like this") == []
+    assert index.search("AND OR (") == []
+    index.close()
+
+
+@pytest.fixture
+def providers():
+    return ["alpha"]
+
+
+@pytest.fixture
+def reply():
+    return "the answer to {message} is **42**"
+
+
+def test_chats_are_searchable(clients):
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('prompt_toolkit.PromptSession.prompt', side_effect=["life, the universe", "/search universe", EOFError]), \
+         patch('sys.argv', ['azc']):
+        main()
+    assert "Found" in out.getvalue() and "alpha:alpha-1" in out.getvalue()
+
+    out = io.StringIO()
+    with patch('sys.stdout', out), patch('sys.argv', ['azc', '--search', 'universe']):
+        main()
+    result = json.loads(out.getvalue())
+    assert (result["provider"], result["model"], result["prompt"]) == ("alpha", "alpha-1", "life, the universe")
+    assert result["latency"] is not None and result["session"]
+
+
+def test_one_shot_batch_and_daemon_chats_are_searchable(clients, reply, tmp_path, search_db):
+    with patch('sys.stdout', io.StringIO()), patch('sys.argv', ['azc', '-b', 'one shot']):
+        main()
+    prompts = tmp_path / "prompts.txt"
+    prompts.write_text("from a file\n")
+    with patch('sys.stdout', io.StringIO()), patch('sys.argv', ['azc', '--prompts', str(prompts)]):
+        main()
+    index = SearchIndex()
+    args = argparse.Namespace(cache=None, cache_ttl=None, failover=None)
+    "".join(make_responder(args, ClientPool(lambda name: EchoLLM(name, reply)), index)({"prompt": "via the daemon", "config": digest(config)}))
+    index.flush()
+    assert [r["prompt"] for r in index.search("42")] == ["one shot", "from a file", "via the daemon"]
+    index.close()
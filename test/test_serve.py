@@ -0,0 +1,132 @@
+import asyncio
+import json
+import socket
+import threading
+
+import httpx
+import pytest
+from openai import OpenAI, NotFoundError
+
+from az import transport
+from az.serve import Gateway, parse_conversation, HTTPError
+from benchmarks.stand_ins import StandInServer
+
+
+class Running:
+    """ A gateway served on its own event loop thread """
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(gateway.start("127.0.0.1", 0), self.loop).result()
+        self.url = f"http://127.0.0.1:{gateway.port}/v1"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.gateway.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    monkeypatch.setattr(transport, "_clients", {})
+    with StandInServer("openai", length=300) as openai_server, StandInServer("ollama", length=200, delay=0.002) as ollama_server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", openai_server.url)
+        monkeypatch.setenv("OLLAMA_URL", ollama_server.url)
+        from az.openai_provider import OpenAIClient
+        from az.ollama_provider import OllamaClient
+        yield {"openai": (OpenAIClient, openai_server), "ollama": (OllamaClient, ollama_server)}
+
+
+@pytest.fixture
+def gateway(backends):
+    def start(config={}):
+        clients = [create() for create, _ in backends.values()]
+        for client in clients:
+            client.list_models()
+        running = Running(Gateway(clients, config))
+        started.append(running)
+        return running, OpenAI(base_url=running.url, api_key="unused", max_retries=0)
+
+    started = []
+    yield start
+    for running in started:
+        running.stop()
+
+
+def test_parse_conversation():
+    messages = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "one"},
+                {"role": "assistant", "content": [{"type": "text", "text": "1"}]}, {"role": "user", "content": "two"}]
+    assert parse_conversation(messages) == ("be brief", [("one", "1")], "two")
+    with pytest.raises(HTTPError):
+        parse_conversation(messages[:3])
+
+
+def test_models(gateway):
+    _, client = gateway()
+    models = {m.id: m.owned_by for m in client.models.list().data}
+    assert models == {"gpt-4o-mini": "openai", "gpt-4o": "openai", "llama3.1:latest": "ollama"}
+
+
+def test_chat_completions_are_routed_by_model(gateway, backends):
+    _, client = gateway()
+    messages = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hi"},
+                {"role": "assistant", "content": "hello"}, {"role": "user", "content": "more"}]
+    completion = client.chat.completions.create(model="gpt-4o", messages=messages)
+    assert completion.choices[0].message.content == backends["openai"][1].response_text
+    assert completion.model == "gpt-4o"
+    _, _, sent = backends["openai"][1].requests[-1]
+    assert sent["model"] == "gpt-4o"
+    assert sent["messages"] == messages
+
+    stream = client.chat.completions.create(model="llama3", messages=messages, stream=True, stream_options={"include_usage": True})
+    chunks = list(stream)
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == backends["ollama"][1].response_text
+    assert chunks[-1].usage is not None
+    _, path, sent = backends["ollama"][1].requests[-1]
+    assert (path, sent["model"], sent["messages"][0]) == ("/api/chat", "llama3.1:latest", messages[0])
+
+
+def test_unknown_model(gateway):
+    _, client = gateway()
+    with pytest.raises(NotFoundError):
+        client.chat.completions.create(model="nope", messages=[{"role": "user", "content": "hi"}])
+
+
+def test_concurrency_limit_and_queue(gateway):
+    running, _ = gateway({"serve": {"concurrency": {"ollama": 1}, "queue": 1}})
+    body = {"model": "ollama:llama3.1", "messages": [{"role": "user", "content": "hi"}]}
+    results = []
+
+    def request():
+        results.append(httpx.post(running.url + "/chat/completions", json=body, timeout=30).status_code)
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # one served right away, one waits its turn, one is turned away
+    assert sorted(results) == [200, 200, 429]
+
+
+def test_bad_requests_are_answered(gateway, monkeypatch):
+    running, _ = gateway()
+    url = running.url + "/chat/completions"
+    assert httpx.post(url, content=b"[]").status_code == 400
+    response = httpx.post(url, json={"model": "gpt-4o", "messages": ["hi"]})
+    assert response.status_code == 400 and "must be an object" in response.json()["error"]["message"]
+    assert httpx.post(url, json={"model": 4, "messages": [{"role": "user", "content": "hi"}]}).status_code == 400
+
+    with socket.create_connection(("127.0.0.1", running.gateway.port)) as sock:
+        sock.sendall(b"POST /v1/chat/completions HTTP/1.1\r\nContent-Length: lots\r\n\r\n")
+        assert sock.recv(1024).startswith(b"HTTP/1.1 400 ")
+
+    def broken(*args):
+        raise RuntimeError("a bug")
+
+    monkeypatch.setattr("az.serve.Backend.conversation", broken)
+    response = httpx.post(url, json={"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]})
+    assert response.status_code == 500 and "a bug" in response.json()["error"]["message"]
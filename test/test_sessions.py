@@ -0,0 +1,76 @@
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+
+from az.az import main
+from az.sessions import SessionStore, turns
+
+
+def exchange(message):
+    return [{"role": "user", "content": message}, {"role": "assistant", "content": f"echo {message}"}]
+
+
+def test_append_and_load(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.append("s1", exchange("one"), provider="alpha", model="alpha-1")
+    store.append("s1", exchange("two"), provider="alpha", model="alpha-2")
+    store.append("s2", exchange("other"), provider="beta", model="beta-1")
+    store.flush()
+    entry, messages = store.load("s1")
+    assert messages == exchange("one") + exchange("two")
+    assert (entry["turns"], entry["title"], entry["model"]) == (2, "one", "alpha-2")
+    assert [s["id"] for s in store.sessions()] == ["s2", "s1"]
+    assert list(turns(messages)) == [("one", "echo one"), ("two", "echo two")]
+    store.close()
+
+
+def test_load_ignores_unindexed_writes(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.append("s1", exchange("one"))
+    store.close()
+    with open(store.session_file("s1"), "a") as f:
+        f.write(json.dumps({"role": "user", "content": "cut sh"})[:20])
+    assert store.load("s1")[1] == exchange("one")
+
+
+def test_resolve(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.append("20240101-aaaa", exchange("one"))
+    store.append("20240102-bbbb", exchange("two"))
+    store.close()
+    assert store.resolve("20240101") == "20240101-aaaa"
+    assert store.resolve("last") == "20240102-bbbb"
+    with pytest.raises(ValueError):
+        store.resolve("2024")
+    with pytest.raises(ValueError):
+        store.resolve("nope")
+
+
+def run(argv, inputs):
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('prompt_toolkit.PromptSession.prompt', side_effect=inputs + [EOFError]), \
+         patch('sys.argv', ['azc'] + argv):
+        main()
+    return out.getvalue()
+
+
+def test_resume_last_chat(clients):
+    run([], ["p be", "m", "beta-2", "first", "second"])
+    output = run(['--resume', 'last'], ["third"])
+    assert "beta:beta-2 (2 turns)" in output
+    assert "beta:beta-2 (3rd message)" in output
+    entry = SessionStore().sessions()[0]
+    assert (entry["turns"], entry["title"]) == (3, "first")
+
+
+def test_sessions_command(clients):
+    run([], ["a question"])
+    output = run([], ["sessions"])
+    assert "a question" in output
+    session_id = SessionStore().sessions()[0]["id"]
+    output = run([], [f"sessions {session_id[:-2]}", "more"])
+    assert "alpha:alpha-1 (2nd message)" in output
+    assert len(SessionStore().sessions()) == 1
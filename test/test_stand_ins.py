@@ -0,0 +1,32 @@
+import pytest
+
+from benchmarks import run
+from benchmarks.stand_ins import StandInServer, sample_response
+
+
+@pytest.fixture
+def models_cache_file(tmp_path):
+    return str(tmp_path / "models.json")
+
+
+@pytest.mark.parametrize("kind", ["openai", "ollama"])
+def test_client_streams_from_stand_in(kind, models_cache_file):
+    with StandInServer(kind, chunk_size=7, length=500) as server:
+        client = run.client_factory({"kind": kind}, server.url, models_cache_file)()
+        assert "".join(client.chat("hi")) == sample_response(500)
+        assert client.last_usage["output_tokens"] == 72  # 500 characters in chunks of 7
+        assert server.requests[-1][2]["messages"][-1] == {"role": "user", "content": "hi"}
+
+
+def test_benchmark_scenario(models_cache_file):
+    scenario = {"name": "tiny", "kind": "ollama", "chunk_size": 10, "delay": 0, "length": 200}
+    result = run.run_scenario(scenario, models_cache_file)
+    assert result["chunks"] == 20
+    assert result["ttft"] is not None
+    assert result["peak_memory_kb"] > 0
+
+
+def test_compare():
+    baseline = {"commit": "a", "scenarios": {"s": {"ttft": 1.0, "main_cpu": 1.0}}}
+    results = {"commit": "b", "scenarios": {"s": {"ttft": 1.1, "main_cpu": 1.5}}}
+    assert [(name, metric) for name, metric, _ in run.compare(baseline, results, 0.2)] == [("s", "main_cpu")]
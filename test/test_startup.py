@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+"""
+Startup time benchmark. `azc -b` is launched from scripts many times over, so import time
+is most of its wall clock. Each measurement runs in a fresh interpreter (nothing cached in sys.modules),
+and the best of a few runs is compared against a budget to keep noise from failing the build.
+"""
+
+IMPORT_BUDGET_S = 0.1        # `import az.az`
+FIRST_PROMPT_BUDGET_S = 0.6  # `import az.az` + `azc -b <prompt>` until the response has been printed
+RUNS = 3
+
+HEAVY_MODULES = ['openai', 'anthropic', 'google.generativeai', 'prompt_toolkit', 'rich']  # -b to a pipe writes raw text
+
+STARTUP_SCRIPT = """
+import io, json, sys, time
+start = time.perf_counter()
+import az.az
+imported = time.perf_counter()
+
+class EchoLLM:
+    def chat(self, prompt):
+        yield prompt
+    def n_user_messages(self):
+        return 0
+    def __str__(self):
+        return "EchoLLM"
+
+import tempfile
+from unittest.mock import patch
+out = io.StringIO()
+with patch('az.search.SEARCH_DB', tempfile.mkdtemp() + '/search.db'), \\
+     patch('az.az.provider_factory', return_value=EchoLLM()), \\
+     patch('sys.stdout', out), \\
+     patch('sys.argv', ['azc', '-b', 'hello']):
+    az.az.main()
+done = time.perf_counter()
+assert 'hello' in out.getvalue()
+
+print(json.dumps({
+    'import_s': imported - start,
+    'first_prompt_s': done - start,
+    'modules': [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_startup():
+    env = dict(os.environ, OLLAMA_URL="http://localhost:0")
+    result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.fixture(scope="module")
+def startup_runs():
+    return [measure_startup() for _ in range(RUNS)]
+
+
+@pytest.mark.slow
+def test_batch_run_does_not_import_heavy_modules(startup_runs):
+    assert startup_runs[0]['modules'] == []
+
+
+@pytest.mark.slow
+def test_import_time(startup_runs):
+    best = min(run['import_s'] for run in startup_runs)
+    print(f"import az.az: {best * 1000:.0f} ms")
+    assert best < IMPORT_BUDGET_S, f"import az.az took {best * 1000:.0f} ms (budget {IMPORT_BUDGET_S * 1000:.0f} ms)"
+
+
+@pytest.mark.slow
+def test_first_prompt_latency(startup_runs):
+    best = min(run['first_prompt_s'] for run in startup_runs)
+    print(f"first prompt: {best * 1000:.0f} ms")
+    assert best < FIRST_PROMPT_BUDGET_S, f"first prompt took {best * 1000:.0f} ms (budget {FIRST_PROMPT_BUDGET_S * 1000:.0f} ms)"
@@ -0,0 +1,141 @@
+import io
+import json
+import re
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from az.az import main
+from az.batch import run_batch
+from az.stats import ChatStats, measure, StatsReport
+from conftest import EchoLLM
+
+
+class TimedLLM(EchoLLM):
+    """ Waits `delay` seconds before each chunk, and optionally reports usage like a provider would """
+    def __init__(self, chunks, delay=0.01, usage=None):
+        super().__init__("timed", chunks, delay=delay)
+        self.usage = usage
+
+    def _stream(self, request):
+        yield from super()._stream(request)
+        if self.usage:
+            self.last_usage = self.usage
+
+
+def test_measure_without_usage():
+    client = TimedLLM(["abcd", "efgh", "ij"], delay=0.02)
+    measured = measure(client, client.chat("hi"))
+    assert "".join(measured) == "abcdefghij"
+    stats = measured.stats
+    assert stats.chunks == 3
+    assert stats.chars == 10
+    assert stats.ttft >= 0.02
+    assert stats.duration >= 0.06
+    assert stats.tokens_estimated
+    assert stats.output_tokens == 2  # 10 characters / 4 per token, rounded
+    assert stats.summary().startswith("TTFT 0.0")
+
+
+def test_measure_with_provider_usage():
+    client = TimedLLM(["a", "b"], usage={"input_tokens": 12, "output_tokens": 40, "generation_seconds": 0.5})
+    measured = measure(client, client.chat("hi"))
+    list(measured)
+    stats = measured.stats.as_dict()
+    assert stats["input_tokens"] == 12
+    assert stats["output_tokens"] == 40
+    assert not stats["tokens_estimated"]
+    assert stats["tokens_per_second"] == 80
+
+
+def test_usage_of_previous_response_is_not_reused():
+    client = TimedLLM(["a"], usage={"input_tokens": 1, "output_tokens": 1})
+    list(measure(client, client.chat("hi")))
+    measured = measure(client, iter(["cached response"]))
+    list(measured)
+    assert measured.stats.tokens_estimated
+
+
+def test_report():
+    report = StatsReport()
+    for ttft in (0.1, 0.3):
+        stats = ChatStats("p", "m")
+        stats.first_chunk = stats.start + ttft
+        stats.on_end({"output_tokens": 10})
+        report.add(stats)
+    [row] = report.rows()
+    assert row["model"] == "p:m"
+    assert row["responses"] == 2
+    assert row["mean_ttft"] == pytest.approx(0.2)
+    assert row["output_tokens"] == 20
+
+
+def test_ollama_final_line_usage(monkeypatch):
+    from az.ollama_provider import OllamaClient
+    monkeypatch.setattr(OllamaClient, "list_models", lambda self: ["llama3:latest"])
+    client = OllamaClient()
+    assert client._parse_line('{"message": {"content": "hi"}, "done": false}') == "hi"
+    final = {"done": True, "prompt_eval_count": 26, "eval_count": 290, "eval_duration": 4_000_000_000}
+    assert client._parse_line(json.dumps(final)) is None
+    assert client.last_usage == {"input_tokens": 26, "output_tokens": 290, "generation_seconds": 4.0}
+
+
+def test_openai_usage_chunk(monkeypatch):
+    from openai import OpenAI
+    from az.openai_provider import OpenAIClient
+
+    def chunk(choices, usage=None):
+        return "data: " + json.dumps({"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+                                      "choices": choices, "usage": usage}) + "\n\n"
+
+    def handler(request):
+        assert json.loads(request.content)["stream_options"] == {"include_usage": True}
+        body = chunk([{"index": 0, "delta": {"content": "Hi"}, "finish_reason": None}]) + \
+               chunk([], {"prompt_tokens": 9, "completion_tokens": 1, "total_tokens": 10}) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    def list_models(self):
+        self.models = ["gpt-4o-mini"]
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(OpenAIClient, "list_models", list_models)
+    client = OpenAIClient()
+    client.client = OpenAI(base_url="http://openai.test/v1", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    assert "".join(client.chat("hello")) == "Hi"
+    assert client.last_usage == {"input_tokens": 9, "output_tokens": 1}
+
+
+@pytest.fixture
+def providers():
+    return ["timed"]
+
+
+@pytest.mark.parametrize("reply", [["Hello"]])
+def test_batch_stats_on_stderr(clients):
+    out, err = io.StringIO(), io.StringIO()
+    with patch('sys.stdout', out), patch('sys.stderr', err), \
+         patch('sys.argv', ['azc', '-b', '--stats', 'hi']):
+        main()
+    assert "Hello" in out.getvalue()
+    stats = json.loads(err.getvalue())
+    assert stats["chunks"] == 1
+    assert stats["model"] == "timed-1"
+
+
+@pytest.mark.parametrize("reply", [["Hello"]])
+def test_interactive_stats(clients):
+    out = io.StringIO()
+    with patch('sys.stdout', out), \
+         patch('prompt_toolkit.PromptSession.prompt', side_effect=["hi", "again", EOFError]), \
+         patch('sys.argv', ['azc', '--stats']):
+        main()
+    output = out.getvalue()
+    assert len(re.findall(r"TTFT \d", output)) == 2
+    assert "Response stats" in output
+    assert "timed:timed-1" in output
+
+
+def test_prompts_stats():
+    [result] = run_batch(TimedLLM(["Hello"]), [{"id": 1, "prompt": "hi"}], stats=True)
+    assert result["stats"]["chars"] == 5
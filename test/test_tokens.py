@@ -0,0 +1,114 @@
+import io
+from unittest.mock import patch
+
+import pytest
+
+from az import tokens
+from az.az import main
+from conftest import EchoLLM
+
+
+class CountingLLM(EchoLLM):
+    """ Counts tokens by words, and keeps the texts it counted """
+    def __init__(self, name="counting", model="gpt-4o-mini"):
+        super().__init__(name, "ok", models=[model], primer="be brief")
+        self.counted = []
+
+    def tokenizer(self):
+        def count(text):
+            self.counted.append(text)
+            return len(text.split())
+        return "words", count
+
+
+def test_messages_are_counted_once():
+    client = CountingLLM()
+    client.record_turn("one two three", "four five")
+    assert tokens.count(client) == 2 + 3 + 2 + 3 * tokens.MESSAGE_OVERHEAD
+    client.record_turn("six", "seven")
+    client.counted.clear()
+    assert tokens.count(client, "typed so far") == 2 + 3 + 2 + 1 + 1 + 3 + 6 * tokens.MESSAGE_OVERHEAD
+    assert client.counted == ["six", "seven", "typed so far"]
+
+
+def test_prices_and_context_windows():
+    config = {"tokens": {"prices": {"my-model": [1, 2]}, "context-windows": {"my-model": 1000}}, "ollama": {"num-ctx": 8192}}
+    assert tokens.price({}, "openai", "gpt-4o-mini-2024-07-18") == (0.15, 0.60)
+    assert tokens.cost({}, "openai", "gpt-4o", 1_000_000, 100_000) == pytest.approx(3.5)
+    assert tokens.cost(config, "openai", "my-model-v2", 1000) == pytest.approx(0.001)
+    assert tokens.cost({}, "ollama", "llama3.1:latest", 1000) == 0
+    assert tokens.cost({}, "openai", "unknown", 1000) is None
+    assert tokens.context_window(config, "openai", "my-model") == 1000
+    assert tokens.context_window({}, "anthropic", "claude-3-5-sonnet-20240620") == 200000
+    assert tokens.context_window(config, "ollama", "llama3.1") == 8192
+    assert tokens.context_window({}, "ollama", "llama3.1") is None
+
+
+def test_max_tokens():
+    assert tokens.max_tokens({}, "anthropic") == 4096
+    assert tokens.max_tokens({}, "openai") is None
+    assert tokens.max_tokens({"max-tokens": 500, "anthropic": {"max-tokens": 8192}}, "anthropic") == 8192
+    assert tokens.max_tokens({"max-tokens": 500}, "openai") == 500
+
+
+def test_preflight():
+    client = CountingLLM()
+    assert tokens.preflight(client, "hi", {}) == []
+    warnings = tokens.preflight(client, "word " * 100, {"tokens": {"context-windows": {"gpt-4o-mini": 50}}})
+    assert len(warnings) == 1 and "over the 50 context window of gpt-4o-mini" in warnings[0]
+    warnings = tokens.preflight(client, "word " * 100, {"tokens": {"prices": {"gpt-4o-mini": [1000, 0]}, "warn-cost": 0.05}})
+    assert warnings == ["the request will cost more than $0.11"]
+
+
+def test_readout():
+    client = CountingLLM()
+    assert tokens.readout(client, "hello there") == "~12 tok · <$0.0001"
+    client.model = "gpt-4o-mini"
+    assert tokens.readout(client, "word " * 2000, {"tokens": {"prices": {"gpt-4o-mini": [10, 0]}}}) == "~2.0k tok · $0.02"
+
+
+def test_readout_in_the_toolbar():
+    from prompt_toolkit.formatted_text import fragment_list_to_text, to_formatted_text
+    toolbars = []
+
+    def prompt(self, message, bottom_toolbar, **kwargs):
+        toolbars.append(fragment_list_to_text(to_formatted_text(bottom_toolbar())))
+        raise EOFError
+
+    client = CountingLLM(model="<gpt-4o-mini>")
+    with patch('az.az.provider_factory', return_value=client), patch('az.az.providers', ['counting']), \
+            patch('prompt_toolkit.PromptSession.prompt', prompt), patch('sys.argv', ['azc']), patch('sys.stdout', new_callable=io.StringIO):
+        main()
+    assert "Using counting:<gpt-4o-mini> (1st message)  next: ~6 tok · <$0.0001" in toolbars[0]
+
+
+def test_anthropic_tokenizer_and_max_tokens(monkeypatch):
+    from az.anthropic_provider import AnthropicClient
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    client = AnthropicClient({"anthropic": {"max-tokens": 2000}}, primer="be brief")
+    assert client.sampling_params() == {"max_tokens": 2000}
+    assert client.tokenizer()[0] == "anthropic"
+    client.record_turn("hello world, how are you?", "fine")
+    assert tokens.count(client) == client.client.count_tokens("be brief\n\nhello world, how are you?") + 1 + 2 * tokens.MESSAGE_OVERHEAD
+
+
+def test_preflight_warning_before_sending(capsys):
+    client = CountingLLM()
+    with patch('az.az.provider_factory', return_value=client), patch('az.az.providers', ['counting']), \
+            patch('az.az.config', {"tokens": {"context-windows": {"gpt-4o-mini": 20}}}), \
+            patch('sys.argv', ['azc', '-b', 'word ' * 30]), patch('sys.stdout', new_callable=io.StringIO) as stdout:
+        main()
+    assert stdout.getvalue().strip() == "ok"
+    assert "warning: the request is ~" in capsys.readouterr().err
+
+
+def test_ollama_options(monkeypatch):
+    from az import transport
+    from benchmarks.stand_ins import StandInServer
+    monkeypatch.setattr(transport, "_clients", {})
+    with StandInServer("ollama", length=50) as server:
+        monkeypatch.setenv("OLLAMA_URL", server.url)
+        from az.ollama_provider import OllamaClient
+        client = OllamaClient({"max-tokens": 300, "ollama": {"num-ctx": 8192}})
+        "".join(client.chat("hi"))
+    assert server.requests[-1][2]["options"] == {"num_predict": 300, "num_ctx": 8192}
@@ -0,0 +1,72 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from az import transport
+from az.ollama_provider import OllamaClient
+
+
+class OllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    client_ports = []
+
+    def log_message(self, *args):
+        pass
+
+    def send_json_lines(self, lines):
+        body = "".join(json.dumps(line) + "\n" for line in lines).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.client_ports.append(self.client_address[1])
+        self.send_json_lines([{"models": [{"name": "llama3:latest"}]}])
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.client_ports.append(self.client_address[1])
+        self.send_json_lines([{"message": {"content": "pong"}}, {"done": True}])
+
+
+@pytest.fixture
+def ollama_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OllamaHandler)
+    OllamaHandler.client_ports = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OLLAMA_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(transport, "_clients", {})
+    yield OllamaHandler
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused_across_clients(ollama_server):
+    clients = [OllamaClient(), OllamaClient()]
+    for client in clients + [clients[0].fork()]:
+        assert "".join(client.chat("ping")) == "pong"
+    # 1 model list (shared by the clients) + 3 chats over a single kept-alive connection
+    assert len(ollama_server.client_ports) == 4
+    assert len(set(ollama_server.client_ports)) == 1
+
+
+def test_clients_are_shared(monkeypatch):
+    monkeypatch.setattr(transport, "_clients", {})
+    assert transport.http_client() is transport.http_client()
+    assert transport.requests_session() is transport.requests_session()
+    assert transport.async_http_client() is transport.async_http_client()
+
+
+def test_settings_from_config(monkeypatch):
+    monkeypatch.setattr(transport, "_clients", {})
+    config = {"http": {"max-connections": 3, "timeout": 30, "connect-timeout": 2}}
+    client = transport.http_client(config)
+    assert client.timeout.read == 30
+    assert client.timeout.connect == 2
+    assert client._transport._pool._max_connections == 3
+    assert transport.request_timeout(config) == (2, 30)
+    assert transport.requests_session(config).get_adapter("http://localhost")._pool_maxsize == 3